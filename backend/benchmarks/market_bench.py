@@ -0,0 +1,282 @@
+"""Matching engine benchmark.
+
+Generates a synthetic order flow from a seeded RNG and replays it through
+the market against a fresh database, reporting orders per second and match
+latency percentiles. Items are picked with Zipfian popularity, so a few
+items carry most of the flow, as on the live market.
+
+Usage:
+    python -m backend.benchmarks.market_bench --orders 20000 --items 50
+    python -m backend.benchmarks.market_bench --json > bench.json
+
+The benchmark drops and recreates every table of its database. Besides
+in-memory SQLite it only runs against databases (or SQLite files) named as
+throwaway ones (containing "bench", "test" or "tmp"), unless `--yes-drop`
+is given.
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.src.database.base import Base
+from backend.src.models import Player, Character, Item, ItemType, InventorySlot, OrderType
+from backend.src.core.order_book import reset_order_books
+from backend.src.core.market import create_order, cancel_order
+
+
+@dataclass
+class FlowEvent:
+    """One step of the synthetic order flow."""
+    action: str  # "create" or "cancel"
+    character: int = 0
+    item: int = 0
+    order_type: OrderType = OrderType.BUY
+    price: float = 0.0
+    quantity: int = 0
+    target: int = -1  # Index of the create event a cancel refers to
+
+
+def generate_flow(
+    seed: int,
+    orders: int,
+    items: int,
+    characters: int,
+    zipf_s: float = 1.1,
+    cancel_ratio: float = 0.2
+) -> List[FlowEvent]:
+    """Build a reproducible order flow.
+    
+    Item `i` is picked with weight 1 / (i + 1) ** zipf_s. Prices scatter
+    around a per-item mid price so roughly half of the orders cross. After
+    each order a cancel of an earlier order follows with probability
+    `cancel_ratio`.
+    """
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** zipf_s for rank in range(items)))
+    mids = [rng.randint(10, 1000) for _ in range(items)]
+    
+    flow = []
+    created = []
+    for _ in range(orders):
+        item = bisect.bisect_left(cum_weights, rng.random() * cum_weights[-1])
+        order_type = OrderType.BUY if rng.random() < 0.5 else OrderType.SELL
+        mid = mids[item]
+        # Buys bid around the mid, sells ask around it; the overlap crosses
+        offset = rng.gauss(0, 0.02) * mid
+        price = round(mid + offset, 2)
+        flow.append(FlowEvent(
+            "create",
+            character=rng.randrange(characters),
+            item=item,
+            order_type=order_type,
+            price=max(price, 0.01),
+            quantity=rng.randint(1, 5),
+        ))
+        created.append(len(flow) - 1)
+        if rng.random() < cancel_ratio:
+            flow.append(FlowEvent("cancel", target=rng.choice(created)))
+    return flow
+
+
+def setup_market(db: Session, items: int, characters: int) -> Dict[str, List[int]]:
+    """Create items and rich characters holding plenty of every item."""
+    player = Player(username="bench", email="bench@example.com", password_hash="x")
+    db.add(player)
+    item_rows = [
+        Item(name=f"Bench {i}", item_type=ItemType.SHELL, is_tradable=True, stack_size=10 ** 9)
+        for i in range(items)
+    ]
+    db.add_all(item_rows)
+    db.flush()
+    character_rows = [
+        Character(player_id=player.id, name=f"Трейдер {i}", gold=10 ** 9)
+        for i in range(characters)
+    ]
+    db.add_all(character_rows)
+    db.flush()
+    db.add_all([
+        InventorySlot(character_id=character.id, item_id=item.id, quantity=10 ** 6, slot_index=index)
+        for character in character_rows
+        for index, item in enumerate(item_rows)
+    ])
+    db.commit()
+    return {
+        "items": [item.id for item in item_rows],
+        "characters": [character.id for character in character_rows],
+    }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def replay(flow: List[FlowEvent], db: Session, ids: Dict[str, List[int]]) -> Dict[str, Any]:
+    """Replay a flow through the market and time every order."""
+    characters = {
+        character_id: db.get(Character, character_id) for character_id in ids["characters"]
+    }
+    order_ids: Dict[int, Optional[int]] = {}
+    latencies = []
+    matched = 0
+    cancels = 0
+    
+    started = time.perf_counter()
+    for index, event in enumerate(flow):
+        if event.action == "cancel":
+            order_id = order_ids.get(event.target)
+            target = flow[event.target]
+            if order_id and cancel_order(order_id, ids["characters"][target.character], db)["success"]:
+                cancels += 1
+            continue
+        
+        character = characters[ids["characters"][event.character]]
+        order_started = time.perf_counter()
+        result = create_order(
+            character, ids["items"][event.item], event.order_type, event.price, event.quantity, db
+        )
+        latencies.append(time.perf_counter() - order_started)
+        order_ids[index] = result.get("order_id")
+        matched += bool(result.get("matched"))
+    elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    return {
+        "orders": len(latencies),
+        "matched": matched,
+        "cancelled": cancels,
+        "seconds": round(elapsed, 3),
+        "orders_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+# Name fragments marking a database as safe to wipe
+THROWAWAY_DATABASE_MARKERS = ("bench", "test", "tmp")
+
+
+def is_throwaway_database(database_url: str) -> bool:
+    """Check if a database may be wiped without asking.
+    
+    In-memory SQLite always may; a SQLite file or a server database only if
+    its name contains one of THROWAWAY_DATABASE_MARKERS.
+    """
+    url = make_url(database_url)
+    name = url.database or ""
+    if url.get_backend_name() == "sqlite":
+        if name in ("", ":memory:"):
+            return True
+        # The file name, not its directory: ./tmp/dreamforge.db is still the game's
+        name = os.path.basename(name)
+    return any(marker in name.lower() for marker in THROWAWAY_DATABASE_MARKERS)
+
+
+def run_benchmark(
+    orders: int = 5000,
+    items: int = 20,
+    characters: int = 50,
+    zipf_s: float = 1.1,
+    cancel_ratio: float = 0.2,
+    seed: int = 42,
+    database_url: str = "sqlite://",
+    allow_drop: bool = False
+) -> Dict[str, Any]:
+    """Generate a flow, replay it against a fresh database and report.
+    
+    Raises ValueError for a database that is not a throwaway one unless
+    `allow_drop` is set, as its tables are dropped.
+    """
+    if not allow_drop and not is_throwaway_database(database_url):
+        raise ValueError(
+            f"Refusing to drop the tables of {make_url(database_url).render_as_string(hide_password=True)}; "
+            "use a throwaway database or pass --yes-drop"
+        )
+    flow = generate_flow(seed, orders, items, characters, zipf_s, cancel_ratio)
+    
+    if database_url == "sqlite://":
+        engine = create_engine(
+            database_url,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+    else:
+        engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    reset_order_books()
+    try:
+        ids = setup_market(db, items, characters)
+        report = replay(flow, db, ids)
+    finally:
+        db.close()
+        reset_order_books()
+        engine.dispose()
+    
+    report.update({
+        "seed": seed,
+        "items": items,
+        "characters": characters,
+        "zipf_s": zipf_s,
+        "cancel_ratio": cancel_ratio,
+    })
+    return report
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Matching engine benchmark")
+    parser.add_argument("--orders", type=int, default=5000, help="orders to place")
+    parser.add_argument("--items", type=int, default=20, help="distinct items traded")
+    parser.add_argument("--characters", type=int, default=50, help="trading characters")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of item popularity")
+    parser.add_argument("--cancel-ratio", type=float, default=0.2, help="cancels per placed order")
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed of the order flow")
+    parser.add_argument(
+        "--database-url", default="sqlite://",
+        help="database to run against (default: in-memory SQLite); its tables are recreated"
+    )
+    parser.add_argument(
+        "--yes-drop", action="store_true",
+        help="allow dropping the tables of a database whose name does not mark it as throwaway"
+    )
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+    
+    try:
+        report = run_benchmark(
+            args.orders, args.items, args.characters, args.zipf,
+            args.cancel_ratio, args.seed, args.database_url, args.yes_drop
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    
+    print(f"Ордеров:          {report['orders']} (сопоставлено {report['matched']}, отменено {report['cancelled']})")
+    print(f"Время:            {report['seconds']} с")
+    print(f"Ордеров в секунду: {report['orders_per_second']}")
+    print(f"Задержка p50:     {report['p50_ms']} мс")
+    print(f"Задержка p99:     {report['p99_ms']} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,25 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.src.api.routes import (
+    admin,
     character,
     combat,
     inventory,
     crafting,
     market,
     location,
+    loot,
     skills
 )
 from backend.src.api.routes import combat_enhanced
+from backend.src.database.base import SessionLocal
+from backend.src.core.order_book import load_order_books
+from backend.src.core.auction import auction_scheduler
+from backend.src.core.expiry import expiry_sweeper
+from backend.src.core.drop import compile_drop_tables
+from backend.src.core.loot import loot_worker
+from backend.src.core.drop_stats import drop_stats_aggregator
+from backend.src.core.combat_scheduler import combat_scheduler
 
 app = FastAPI(
     title="Dreamforge API",
@@ -36,7 +46,59 @@ app.include_router(inventory.router, prefix="/api")
 app.include_router(crafting.router, prefix="/api")
 app.include_router(market.router, prefix="/api")
 app.include_router(location.router, prefix="/api")
+app.include_router(loot.router, prefix="/api")
 app.include_router(skills.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
+
+
+@app.on_event("startup")
+def load_market():
+    """Rebuild market order books from the database."""
+    db = SessionLocal()
+    try:
+        load_order_books(db)
+    finally:
+        db.close()
+    auction_scheduler.start()
+    expiry_sweeper.start()
+
+
+@app.on_event("startup")
+def load_drop_tables():
+    """Compile monster drop tables and start the loot and drop stats jobs."""
+    db = SessionLocal()
+    try:
+        compile_drop_tables(db)
+    finally:
+        db.close()
+    loot_worker.start()
+    drop_stats_aggregator.start()
+
+
+@app.on_event("startup")
+async def start_combat_clock():
+    """Start the combat scheduler on the server's event loop."""
+    combat_scheduler.start()
+
+
+@app.on_event("shutdown")
+def stop_market():
+    """Stop market background jobs."""
+    auction_scheduler.stop()
+    expiry_sweeper.stop()
+
+
+@app.on_event("shutdown")
+def stop_drops():
+    """Resolve queued kills and stop the loot and drop stats jobs."""
+    loot_worker.stop()
+    drop_stats_aggregator.stop()
+
+
+@app.on_event("shutdown")
+async def stop_combat_clock():
+    """Stop the combat scheduler."""
+    await combat_scheduler.stop()
 
 
 @app.get("/")
@@ -0,0 +1,18 @@
+"""Admin API routes."""
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from backend.src.database.base import get_db
+from backend.src.core.drop_stats import drop_stats_aggregator
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/drops/stats")
+def get_drop_stats(monster_id: int = None, refresh: bool = False, db: Session = Depends(get_db)):
+    """Observed versus expected drop rates per drop table entry."""
+    stats = drop_stats_aggregator.refresh(db) if refresh else drop_stats_aggregator.latest(db)
+    entries = stats["entries"]
+    if monster_id is not None:
+        entries = [entry for entry in entries if entry["monster_id"] == monster_id]
+    return {"generated_at": stats["generated_at"], "entries": entries}
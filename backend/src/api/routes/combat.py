@@ -6,6 +6,7 @@ from backend.src.database.base import get_db
 from backend.src.models import Character, Monster
 from backend.src.api.schemas.combat import AttackRequest, AttackResponse, MonsterAttackResponse
 from backend.src.core.combat import attack_monster, monster_attack, determine_turn_order
+from backend.src.core.loot import loot_queue
 
 router = APIRouter(prefix="/combat", tags=["combat"])
 
@@ -25,6 +26,9 @@ def attack(attack_req: AttackRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Monster is already dead")
     
     result = attack_monster(character, monster, db, attack_req.skill_id)
+    if result["monster_hp"] <= 0:
+        # Loot is resolved by the loot worker; poll /loot/{kill_id}
+        result["kill_id"] = loot_queue.enqueue(character.id, monster.id, character.luck, db)
     return result
 
 
@@ -1,36 +1,67 @@
 """Enhanced combat API routes."""
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from backend.src.database.base import get_db
 from backend.src.models import Character, Monster
-from backend.src.core.combat_enhanced import EnhancedCombatState
+from backend.src.core.combat_enhanced import (
+    EnhancedCombatState,
+    checkpoint_due,
+    checkpoint_monster_hp,
+    get_combat_skill,
+    write_monster_hp,
+)
+from backend.src.core.combat_store import StaleCombatState, combat_key, combat_store, fight_lock
+from backend.src.core.combat_scheduler import combat_scheduler
+from backend.src.core.combat_feed import combat_feed
+from backend.src.core.loot import loot_queue
 from typing import Optional
 
 router = APIRouter(prefix="/combat-enhanced", tags=["combat-enhanced"])
 
-# Store active combat states (in production, use Redis or DB)
-active_combats: dict = {}
-
 
 def get_combat_state(character_id: int, monster_id: int) -> Optional[EnhancedCombatState]:
-    """Get or create combat state."""
-    key = f"{character_id}_{monster_id}"
-    return active_combats.get(key)
+    """Load a fight in progress from the combat store."""
+    return combat_store.load(combat_key(character_id, monster_id))
 
 
-def set_combat_state(character_id: int, monster_id: int, state: EnhancedCombatState):
-    """Store combat state."""
-    key = f"{character_id}_{monster_id}"
-    active_combats[key] = state
+def set_combat_state(
+    character_id: int,
+    monster_id: int,
+    state: EnhancedCombatState,
+    db: Optional[Session] = None
+):
+    """Save combat state and hand its next deadline to the combat scheduler.
+    
+    With `db`, a due monster HP checkpoint is saved with the state and
+    written and committed once the save succeeds. A fight changed meanwhile
+    by another worker is a 409 and writes nothing; the client retries.
+    """
+    hp = checkpoint_monster_hp(state) if db is not None and checkpoint_due(state) else None
+    key = combat_key(character_id, monster_id)
+    try:
+        combat_store.save(key, state)
+    except StaleCombatState:
+        raise HTTPException(status_code=409, detail="Combat changed by another request, retry")
+    if hp is not None:
+        write_monster_hp(monster_id, hp, db)
+        db.commit()
+    combat_scheduler.track(key, state)
+    combat_feed.publish(key, state)
 
 
 @router.post("/start")
 def start_combat(character_id: int, monster_id: int, db: Session = Depends(get_db)):
     """Start combat."""
+    with fight_lock(combat_key(character_id, monster_id)):
+        return _start_combat(character_id, monster_id, db)
+
+
+def _start_combat(character_id: int, monster_id: int, db: Session):
     # Check if combat already exists
     existing = get_combat_state(character_id, monster_id)
-    if existing:
+    if existing and not existing.is_combat_over():
         return {
             "success": True,
             "combat_state": existing.get_combat_state(),
@@ -55,8 +86,10 @@ def start_combat(character_id: int, monster_id: int, db: Session = Depends(get_d
         db.commit()
         db.refresh(monster)
     
-    # Create combat state
+    # Create combat state; it replaces a finished fight, so it follows that fight's version
     combat_state = EnhancedCombatState(character, monster, db)
+    if existing:
+        combat_state.version = existing.version
     set_combat_state(character_id, monster_id, combat_state)
     
     state = combat_state.get_combat_state()
@@ -77,6 +110,11 @@ def perform_action(
     db: Session = Depends(get_db)
 ):
     """Perform combat action."""
+    with fight_lock(combat_key(character_id, monster_id)):
+        return _perform_action(character_id, monster_id, action_type, skill_id, db)
+
+
+def _perform_action(character_id: int, monster_id: int, action_type: str, skill_id: Optional[int], db: Session):
     combat_state = get_combat_state(character_id, monster_id)
     if not combat_state:
         raise HTTPException(status_code=404, detail="Combat not found. Start combat first.")
@@ -94,7 +132,9 @@ def perform_action(
     if action_type == "attack":
         result = combat_state.character_attack()
     elif action_type == "skill" and skill_id:
-        result = combat_state.character_attack(skill_id)
+        result = get_combat_skill(character_id, skill_id, db)
+        if result["success"]:
+            result = combat_state.character_attack(result["skill"])
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
     
@@ -112,10 +152,15 @@ def perform_action(
         result["combat_over"] = True
         result["winner"] = winner
         
-        # Clean up
-        key = f"{character_id}_{monster_id}"
-        if key in active_combats:
-            del active_combats[key]
+        # The finished fight stays in the store until it expires, so streams see the end.
+        # Saved before the monster HP write and the kill: a request that lost the race
+        # gets a 409 and changes nothing
+        set_combat_state(character_id, monster_id, combat_state, db)
+        
+        # Loot is resolved by the loot worker; poll /loot/{kill_id}
+        if winner == "character":
+            luck = db.query(Character.luck).filter(Character.id == character_id).scalar() or 0
+            result["kill_id"] = loot_queue.enqueue(character_id, monster_id, luck, db)
     else:
         # Only end turn if action consumes turn
         if combat_state.current_turn and combat_state.current_turn.action_taken:
@@ -129,6 +174,8 @@ def perform_action(
                 
                 # End monster turn and start character turn
                 combat_state.end_turn()
+        
+        set_combat_state(character_id, monster_id, combat_state, db)
     
     return {
         "success": True,
@@ -147,9 +194,33 @@ def get_state(character_id: int, monster_id: int):
     return combat_state.get_combat_state()
 
 
+@router.get("/stream")
+def stream_state(
+    character_id: int,
+    monster_id: int,
+    since: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None),
+):
+    """Stream combat state changes as Server-Sent Events."""
+    key = combat_key(character_id, monster_id)
+    if combat_store.load(key) is None:
+        raise HTTPException(status_code=404, detail="Combat not found")
+    
+    return StreamingResponse(
+        combat_feed.stream(key, since if since is not None else last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @router.post("/end-turn")
-def end_turn(character_id: int, monster_id: int):
+def end_turn(character_id: int, monster_id: int, db: Session = Depends(get_db)):
     """Manually end turn."""
+    with fight_lock(combat_key(character_id, monster_id)):
+        return _end_turn(character_id, monster_id, db)
+
+
+def _end_turn(character_id: int, monster_id: int, db: Session):
     combat_state = get_combat_state(character_id, monster_id)
     if not combat_state:
         raise HTTPException(status_code=404, detail="Combat not found")
@@ -162,6 +233,8 @@ def end_turn(character_id: int, monster_id: int):
         result["monster_action"] = monster_result
         combat_state.end_turn()
     
+    set_combat_state(character_id, monster_id, combat_state, db)
+    
     return {
         "success": True,
         "result": result,
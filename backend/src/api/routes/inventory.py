@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from backend.src.database.base import get_db
 from backend.src.models import Character
-from backend.src.core.inventory import get_inventory, get_equipment, equip_item, unequip_item
+from backend.src.core.inventory import get_inventory, get_equipment, equip_item, unequip_item, claim_pending_deliveries
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
@@ -29,6 +29,20 @@ def get_character_equipment(character_id: int, db: Session = Depends(get_db)):
     return get_equipment(character, db)
 
 
+@router.post("/{character_id}/claim")
+def claim_deliveries(character_id: int, db: Session = Depends(get_db)):
+    """Move pending deliveries into the inventory grid."""
+    character = db.query(Character).filter(Character.id == character_id).first()
+    if not character:
+        raise HTTPException(status_code=404, detail="Character not found")
+    
+    result = claim_pending_deliveries(character, db)
+    if not result.get("success"):
+        raise HTTPException(status_code=400, detail=result.get("reason", "Failed to claim"))
+    
+    return result
+
+
 @router.post("/equip")
 def equip(character_id: int, item_id: int, db: Session = Depends(get_db)):
     """Equip an item."""
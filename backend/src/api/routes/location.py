@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from backend.src.database.base import get_db
 from backend.src.models import Character, Location
-from backend.src.core.location import get_location_info, start_travel, get_available_locations
+from backend.src.core.location import get_location_info, get_location_monsters, start_travel, get_available_locations
 
 router = APIRouter(prefix="/locations", tags=["locations"])
 
@@ -32,6 +32,15 @@ def get_location(location_id: int, db: Session = Depends(get_db)):
     return info
 
 
+@router.get("/{location_id}/monsters")
+def get_monsters(location_id: int, db: Session = Depends(get_db)):
+    """Get location monsters with their drops."""
+    info = get_location_monsters(location_id, db)
+    if not info:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return info
+
+
 @router.post("/travel")
 def travel(character_id: int, target_location_id: int, db: Session = Depends(get_db)):
     """Travel to location."""
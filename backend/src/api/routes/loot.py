@@ -0,0 +1,17 @@
+"""Loot API routes."""
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from backend.src.database.base import get_db
+from backend.src.core.loot import loot_queue
+
+router = APIRouter(prefix="/loot", tags=["loot"])
+
+
+@router.get("/{kill_id}")
+def get_loot(kill_id: str, db: Session = Depends(get_db)):
+    """Get the loot of a kill; poll while its status is pending."""
+    result = loot_queue.result(kill_id, db)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Kill not found")
+    return result
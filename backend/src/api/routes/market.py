@@ -1,11 +1,12 @@
 """Market API routes."""
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from backend.src.database.base import get_db
-from backend.src.models import Character, OrderType, OrderStatus
+from backend.src.models import Character, OrderType, OrderStatus, TimeInForce, CandleResolution
 from backend.src.api.schemas.market import MarketOrderCreate, MarketOrderResponse
-from backend.src.core.market import create_order, get_market_orders, cancel_order
+from backend.src.core.market import create_order, get_market_orders, cancel_order, get_market_depth
+from backend.src.core.candles import get_candles
 
 router = APIRouter(prefix="/market", tags=["market"])
 
@@ -18,11 +19,19 @@ def create_market_order(order: MarketOrderCreate, db: Session = Depends(get_db))
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid order type")
     
+    try:
+        time_in_force = TimeInForce(order.time_in_force)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid time in force")
+    
     character = db.query(Character).filter(Character.id == order.character_id).first()
     if not character:
         raise HTTPException(status_code=404, detail="Character not found")
     
-    result = create_order(character, order.item_id, order_type, order.price, order.quantity, db)
+    result = create_order(
+        character, order.item_id, order_type, order.price, order.quantity, db,
+        time_in_force, order.expires_at
+    )
     if not result.get("success"):
         raise HTTPException(status_code=400, detail=result.get("reason", "Failed to create order"))
     
@@ -33,8 +42,15 @@ def create_market_order(order: MarketOrderCreate, db: Session = Depends(get_db))
 
 
 @router.get("/orders")
-def get_orders(item_id: int = None, order_type: str = None, status: str = None, db: Session = Depends(get_db)):
-    """Get market orders with filters."""
+def get_orders(
+    item_id: int = None,
+    order_type: str = None,
+    status: str = None,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str = None,
+    db: Session = Depends(get_db)
+):
+    """Get a page of market orders with filters."""
     order_type_enum = None
     if order_type:
         try:
@@ -49,7 +65,10 @@ def get_orders(item_id: int = None, order_type: str = None, status: str = None,
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid status")
     
-    return get_market_orders(item_id, order_type_enum, status_enum, db)
+    try:
+        return get_market_orders(item_id, order_type_enum, status_enum, db, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.delete("/orders/{order_id}")
@@ -60,3 +79,28 @@ def cancel_market_order(order_id: int, character_id: int, db: Session = Depends(
         raise HTTPException(status_code=400, detail=result.get("reason", "Failed to cancel order"))
     return result
 
+
+@router.get("/{item_id}/depth")
+def get_depth(item_id: int, levels: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+    """Get aggregated order book depth for an item."""
+    return get_market_depth(item_id, levels, db)
+
+
+@router.get("/{item_id}/candles")
+def get_item_candles(
+    item_id: int,
+    resolution: str = "1m",
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Get OHLCV candles for an item."""
+    try:
+        resolution_enum = CandleResolution(resolution)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid resolution")
+    
+    return {
+        "item_id": item_id,
+        "resolution": resolution_enum.value,
+        "candles": get_candles(item_id, resolution_enum, db, limit)
+    }
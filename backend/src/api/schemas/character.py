@@ -21,6 +21,7 @@ class CharacterResponse(BaseModel):
     endurance: int
     wisdom: int
     luck: int
+    gold: float
     character_class: str
     location_id: Optional[int]
     
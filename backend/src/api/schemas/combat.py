@@ -16,6 +16,7 @@ class AttackResponse(BaseModel):
     monster_hp: int
     monster_max_hp: int
     message: str
+    kill_id: Optional[str] = None
 
 
 class MonsterAttackResponse(BaseModel):
@@ -1,15 +1,18 @@
 """Market schemas."""
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
+from datetime import datetime
 
 
 class MarketOrderCreate(BaseModel):
     character_id: int
     item_id: int
     order_type: str  # "buy" or "sell"
-    price: float
-    quantity: int
+    price: float = Field(gt=0)
+    quantity: int = Field(gt=0)
+    time_in_force: str = "gtc"  # "gtc", "gtt", "ioc" or "fok"
+    expires_at: Optional[datetime] = None  # Required for "gtt"
 
 
 class MarketOrderResponse(BaseModel):
@@ -21,7 +24,9 @@ class MarketOrderResponse(BaseModel):
     price: float
     quantity: int
     filled_quantity: int
-    created_at: Optional[str]
+    time_in_force: str
+    expires_at: Optional[datetime]
+    created_at: Optional[datetime]
     
     class Config:
         from_attributes = True
@@ -0,0 +1,95 @@
+"""Batched auction ticks for busy market items.
+
+Items in batch mode do not match on every request. `create_order` queues the
+order on the item's book and returns right away; a scheduler clears every
+queued order once per tick and settles the whole window in one transaction.
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, Set
+from sqlalchemy.orm import Session
+from backend.src.database.base import SessionLocal
+from backend.src.core.order_book import get_all_order_books, locked_order_book
+from backend.src.core.settlement import settle_fills
+
+logger = logging.getLogger(__name__)
+
+MARKET_TICK_MS = int(os.getenv("MARKET_TICK_MS", "250"))
+
+# Items matched in auction ticks, e.g. MARKET_BATCH_ITEMS="12,15"
+_batch_items: Set[int] = {
+    int(item_id)
+    for item_id in os.getenv("MARKET_BATCH_ITEMS", "").split(",")
+    if item_id.strip()
+}
+
+
+def set_batch_mode(item_id: int, enabled: bool = True):
+    """Switch an item between per-request matching and auction ticks."""
+    if enabled:
+        _batch_items.add(item_id)
+    else:
+        _batch_items.discard(item_id)
+
+
+def is_batch_item(item_id: int) -> bool:
+    """Check if item is matched in auction ticks."""
+    return item_id in _batch_items
+
+
+def run_auction_tick(db: Session) -> Dict[int, int]:
+    """Clear queued orders on every book.
+    
+    Returns the number of fills per item.
+    """
+    results = {}
+    for book in get_all_order_books(db):
+        if not book.incoming:
+            continue
+        with locked_order_book(book.item_id, db) as book:
+            fills = book.run_auction()
+            if not fills:
+                continue
+            settle_fills(fills, db)
+            db.commit()
+            results[book.item_id] = len(fills)
+    return results
+
+
+class AuctionScheduler:
+    """Background thread running auction ticks."""
+    
+    def __init__(self, interval_ms: int = MARKET_TICK_MS):
+        self.interval = interval_ms / 1000.0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start ticking."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="market-auction", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop ticking and wait for the current tick."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = SessionLocal()
+            try:
+                run_auction_tick(db)
+            except Exception:
+                logger.exception("Auction tick failed")
+            finally:
+                db.close()
+
+
+auction_scheduler = AuctionScheduler()
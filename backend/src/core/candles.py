@@ -0,0 +1,119 @@
+"""OHLCV candle aggregation for executed trades.
+
+Settlement feeds every batch of trades here. Trades are rolled up in memory
+per (item, resolution, bucket) and merged into `price_candles` with a single
+upsert per batch, so candle reads never rescan trades or orders.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+from backend.src.models import PriceCandle, CandleResolution
+
+RESOLUTION_SECONDS = {
+    CandleResolution.MINUTE: 60,
+    CandleResolution.HOUR: 3600,
+    CandleResolution.DAY: 86400,
+}
+
+
+def bucket_start(timestamp: datetime, resolution: CandleResolution) -> datetime:
+    """Start of the candle bucket containing timestamp (UTC)."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    seconds = RESOLUTION_SECONDS[resolution]
+    epoch = int(timestamp.timestamp()) // seconds * seconds
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
+_CANDLE_COLUMNS = (
+    "item_id", "resolution", "bucket_start", "open", "high", "low", "close", "volume", "trade_count"
+)
+
+
+def _upsert_statement(greatest: str, least: str):
+    """Candle merge; a text statement keeps its compiled form cached."""
+    table = PriceCandle.__table__
+    return text(
+        f"INSERT INTO price_candles ({', '.join(_CANDLE_COLUMNS)}) "
+        f"VALUES ({', '.join(':' + name for name in _CANDLE_COLUMNS)}) "
+        "ON CONFLICT (item_id, resolution, bucket_start) DO UPDATE SET "
+        f"high = {greatest}(price_candles.high, excluded.high), "
+        f"low = {least}(price_candles.low, excluded.low), "
+        "close = excluded.close, "
+        "volume = price_candles.volume + excluded.volume, "
+        "trade_count = price_candles.trade_count + excluded.trade_count"
+    ).bindparams(*[bindparam(name, type_=table.c[name].type) for name in _CANDLE_COLUMNS])
+
+
+_upsert_candles = {
+    "postgresql": _upsert_statement("GREATEST", "LEAST"),
+    "sqlite": _upsert_statement("MAX", "MIN"),
+}
+
+
+def record_trades(trades: List[Dict[str, Any]], db: Session):
+    """Roll executed trades into candles at every resolution.
+    
+    Trades must be in execution order. Runs in the caller's transaction.
+    """
+    if not trades:
+        return
+    
+    candles: Dict[Tuple[int, CandleResolution, datetime], Dict[str, Any]] = {}
+    for trade in trades:
+        price = trade["price"]
+        for resolution in RESOLUTION_SECONDS:
+            key = (trade["item_id"], resolution, bucket_start(trade["executed_at"], resolution))
+            candle = candles.get(key)
+            if candle is None:
+                candles[key] = {
+                    "item_id": key[0],
+                    "resolution": resolution,
+                    "bucket_start": key[2],
+                    "open": price,
+                    "high": price,
+                    "low": price,
+                    "close": price,
+                    "volume": trade["quantity"],
+                    "trade_count": 1,
+                }
+            else:
+                candle["high"] = max(candle["high"], price)
+                candle["low"] = min(candle["low"], price)
+                candle["close"] = price
+                candle["volume"] += trade["quantity"]
+                candle["trade_count"] += 1
+    db.execute(_upsert_candles[db.get_bind().dialect.name], list(candles.values()))
+
+
+def get_candles(
+    item_id: int,
+    resolution: CandleResolution,
+    db: Session,
+    limit: int = 100,
+    before: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """Get the latest candles for an item, oldest first."""
+    query = db.query(PriceCandle).filter(
+        PriceCandle.item_id == item_id,
+        PriceCandle.resolution == resolution
+    )
+    if before:
+        query = query.filter(PriceCandle.bucket_start < before)
+    
+    candles = query.order_by(PriceCandle.bucket_start.desc()).limit(limit).all()
+    
+    return [
+        {
+            "bucket_start": candle.bucket_start.isoformat(),
+            "open": float(candle.open),
+            "high": float(candle.high),
+            "low": float(candle.low),
+            "close": float(candle.close),
+            "volume": candle.volume,
+            "trade_count": candle.trade_count,
+        }
+        for candle in reversed(candles)
+    ]
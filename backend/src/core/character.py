@@ -1,11 +1,24 @@
 """Character system with classes."""
 
+import random
 from typing import Dict, Any
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
 from backend.src.models import Character, CharacterClass
 from backend.src.utils.formulas import (
     calculate_max_hp,
     calculate_max_mp,
 )
+from backend.src.utils.rng import character_stream
+
+_characters = Character.__table__
+
+_open_rng_epoch = (
+    update(_characters)
+    .where(_characters.c.id == bindparam("epoch_character_id"))
+    .values(rng_epoch=_characters.c.rng_epoch + 1)
+    .returning(_characters.c.rng_epoch)
+)
 
 
 def get_class_stat_bonuses(character_class: CharacterClass, level: int) -> Dict[str, int]:
@@ -59,6 +72,23 @@ def get_class_unique_mechanic(character_class: CharacterClass) -> str:
     return mechanics.get(character_class, "Нет уникальной механики")
 
 
+def bump_stats_version(character: Character):
+    """Mark the character's cached derived stats stale; saved with the caller's commit."""
+    character.stats_version = (character.stats_version or 0) + 1
+
+
+def character_rng(character: Character, db: Session) -> random.Random:
+    """Character's long-lived random stream.
+    
+    Creating the stream bumps the character's `rng_epoch` in the current
+    transaction, so a stream recreated after a restart draws new rolls.
+    """
+    return character_stream(
+        character.id,
+        lambda: db.execute(_open_rng_epoch, {"epoch_character_id": character.id}).scalar_one()
+    )
+
+
 def level_up_character(character: Character) -> Dict[str, Any]:
     """Level up character and apply stat bonuses."""
     old_level = character.level
@@ -73,6 +103,7 @@ def level_up_character(character: Character) -> Dict[str, Any]:
     character.endurance += bonuses.get("endurance", 0)
     character.wisdom += bonuses.get("wisdom", 0)
     character.luck += bonuses.get("luck", 0)
+    bump_stats_version(character)
     
     # Calculate new max HP/MP
     new_max_hp = calculate_max_hp(character.level, character.strength, character.endurance)
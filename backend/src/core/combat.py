@@ -1,9 +1,12 @@
 """Combat system."""
 
-import random
-from typing import Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from backend.src.models import Character, Monster
+from backend.src.models import Character, Item, Monster
+from backend.src.core.character import character_rng
 from backend.src.utils.formulas import (
     calculate_physical_damage,
     calculate_magical_damage,
@@ -38,8 +41,47 @@ class CombatState:
         )
 
 
+# Derived stats per (character_id, stats_version), least recently used first
+STATS_CACHE_SIZE = 10000
+_stats_cache: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()
+_stats_lock = threading.Lock()
+
+EQUIPMENT_SLOTS = ("helmet_id", "chest_id", "belt_id", "legs_id", "boots_id", "weapon_id", "accessory1_id", "accessory2_id")
+
+
+def clear_stats_cache(*args):
+    """Forget all cached derived stats."""
+    with _stats_lock:
+        _stats_cache.clear()
+
+
+# Item bonuses feed every wearer's stats
+event.listen(Item, "after_update", clear_stats_cache)
+event.listen(Item, "after_delete", clear_stats_cache)
+
+
 def calculate_character_stats(character: Character, db: Session) -> Dict[str, Any]:
-    """Calculate all character derived stats."""
+    """Calculate all character derived stats.
+    
+    Cached per (character, stats_version); the returned dict is shared and
+    must not be modified. A recompute loads all equipped items with one query.
+    """
+    key = (character.id, character.stats_version or 0)
+    with _stats_lock:
+        stats = _stats_cache.get(key)
+        if stats is not None:
+            _stats_cache.move_to_end(key)
+            return stats
+    
+    stats = _compute_character_stats(character, db)
+    with _stats_lock:
+        _stats_cache[key] = stats
+        while len(_stats_cache) > STATS_CACHE_SIZE:
+            _stats_cache.popitem(last=False)
+    return stats
+
+
+def _compute_character_stats(character: Character, db: Session) -> Dict[str, Any]:
     # Get equipment bonuses
     equipment = character.equipment
     weapon_bonus = 0
@@ -55,25 +97,44 @@ def calculate_character_stats(character: Character, db: Session) -> Dict[str, An
     
     if equipment:
         # Sum bonuses from all equipped items
-        for slot_name in ["helmet_id", "chest_id", "belt_id", "legs_id", "boots_id", "weapon_id", "accessory1_id", "accessory2_id"]:
-            item_id = getattr(equipment, slot_name, None)
-            if item_id:
-                from backend.src.models import Item
-                item = db.query(Item).filter(Item.id == item_id).first()
-                if item:
-                    if item.stat_bonuses:
-                        for stat, bonus in item.stat_bonuses.items():
-                            stat_bonuses[stat] += bonus
-                    weapon_bonus += item.physical_damage or 0
-                    armor_bonus += item.physical_defense or 0
-    
+        item_ids = [getattr(equipment, slot_name) for slot_name in EQUIPMENT_SLOTS]
+        item_ids = [item_id for item_id in item_ids if item_id]
+        items = {}
+        if item_ids:
+            items = {
+                item.id: item
+                for item in db.query(
+                    Item.id, Item.stat_bonuses, Item.physical_damage, Item.physical_defense
+                ).filter(Item.id.in_(set(item_ids)))
+            }
+        for item_id in item_ids:
+            item = items.get(item_id)
+            if item:
+                if item.stat_bonuses:
+                    for stat, bonus in item.stat_bonuses.items():
+                        stat_bonuses[stat] += bonus
+                weapon_bonus += item.physical_damage or 0
+                armor_bonus += item.physical_defense or 0
+    
+    base = {stat: getattr(character, stat) for stat in stat_bonuses}
+    return derive_character_stats(character.level, base, stat_bonuses, weapon_bonus, armor_bonus)
+
+
+def derive_character_stats(
+    level: int,
+    base: Dict[str, int],
+    stat_bonuses: Dict[str, int],
+    weapon_bonus: int = 0,
+    armor_bonus: int = 0
+) -> Dict[str, Any]:
+    """Derived stats from base stats and summed equipment bonuses."""
     # Calculate stats with bonuses
-    total_strength = character.strength + stat_bonuses["strength"]
-    total_agility = character.agility + stat_bonuses["agility"]
-    total_intelligence = character.intelligence + stat_bonuses["intelligence"]
-    total_endurance = character.endurance + stat_bonuses["endurance"]
-    total_wisdom = character.wisdom + stat_bonuses["wisdom"]
-    total_luck = character.luck + stat_bonuses["luck"]
+    total_strength = base["strength"] + stat_bonuses.get("strength", 0)
+    total_agility = base["agility"] + stat_bonuses.get("agility", 0)
+    total_intelligence = base["intelligence"] + stat_bonuses.get("intelligence", 0)
+    total_endurance = base["endurance"] + stat_bonuses.get("endurance", 0)
+    total_wisdom = base["wisdom"] + stat_bonuses.get("wisdom", 0)
+    total_luck = base["luck"] + stat_bonuses.get("luck", 0)
     
     # Calculate derived stats
     phys_damage = calculate_physical_damage(total_strength, weapon_bonus)
@@ -90,8 +151,8 @@ def calculate_character_stats(character: Character, db: Session) -> Dict[str, An
         "magical_defense": mag_def,
         "crit_chance": crit_chance,
         "speed": speed,
-        "max_hp": calculate_max_hp(character.level, total_strength, total_endurance),
-        "max_mp": calculate_max_mp(character.level, total_intelligence, total_wisdom),
+        "max_hp": calculate_max_hp(level, total_strength, total_endurance),
+        "max_mp": calculate_max_mp(level, total_intelligence, total_wisdom),
     }
 
 
@@ -107,22 +168,29 @@ def calculate_max_mp(level: int, intelligence: int, wisdom: int) -> int:
     return calc_mp(level, intelligence, wisdom)
 
 
-def attack_monster(character: Character, monster: Monster, db: Session, use_skill: Optional[int] = None) -> Dict[str, Any]:
-    """Character attacks monster."""
+def attack_monster(
+    character: Character,
+    monster: Monster,
+    db: Session,
+    use_skill: Optional[int] = None,
+    rng=None
+) -> Dict[str, Any]:
+    """Character attacks monster, drawing from the character's stream unless `rng` is given."""
+    rng = rng or character_rng(character, db)
     char_stats = calculate_character_stats(character, db)
     
     # Determine damage type and amount
     if use_skill:
         # Skill attack (to be implemented)
         damage_type = "physical"  # Default
-        base_damage = random.randint(char_stats["physical_damage"]["min"], char_stats["physical_damage"]["max"])
+        base_damage = rng.randint(char_stats["physical_damage"]["min"], char_stats["physical_damage"]["max"])
     else:
         # Basic attack
         damage_type = "physical"
-        base_damage = random.randint(char_stats["physical_damage"]["min"], char_stats["physical_damage"]["max"])
+        base_damage = rng.randint(char_stats["physical_damage"]["min"], char_stats["physical_damage"]["max"])
     
     # Check for crit
-    is_crit = random.random() * 100 < char_stats["crit_chance"]
+    is_crit = rng.random() * 100 < char_stats["crit_chance"]
     if is_crit:
         damage = calculate_crit_damage(base_damage)
         crit_text = " КРИТИЧЕСКИЙ УДАР!"
@@ -146,12 +214,13 @@ def attack_monster(character: Character, monster: Monster, db: Session, use_skil
     return result
 
 
-def monster_attack(monster: Monster, character: Character, db: Session) -> Dict[str, Any]:
-    """Monster attacks character."""
+def monster_attack(monster: Monster, character: Character, db: Session, rng=None) -> Dict[str, Any]:
+    """Monster attacks character, drawing from the character's stream unless `rng` is given."""
+    rng = rng or character_rng(character, db)
     char_stats = calculate_character_stats(character, db)
     
     # Calculate monster damage
-    base_damage = random.randint(monster.physical_damage_min, monster.physical_damage_max)
+    base_damage = rng.randint(monster.physical_damage_min, monster.physical_damage_max)
     
     # Apply character defense
     final_damage = apply_physical_damage(base_damage, char_stats["physical_defense"])
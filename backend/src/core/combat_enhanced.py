@@ -1,13 +1,15 @@
 """Enhanced combat system with tactics, timing, and skill selection."""
 
+import os
 import random
 import time
 from typing import Dict, Any, Optional, List
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from backend.src.models import Character, Monster, Skill
+from backend.src.models import Character, CharacterSkill, Monster, Skill
 from backend.src.core.combat import calculate_character_stats, calculate_max_hp, calculate_max_mp
 from backend.src.core.tactics import TacticsManager, TacticType, generate_tactics_from_action
+from backend.src.utils.rng import derive_seed
 from backend.src.utils.formulas import (
     calculate_crit_damage,
     apply_physical_damage,
@@ -28,6 +30,27 @@ class CombatTurn:
         self.skill_id: Optional[int] = None
         self.result = None
     
+    def to_snapshot(self) -> List[Any]:
+        """Plain-value form of the turn; the action result is not kept."""
+        return [
+            self.actor_type,
+            self.actor_id,
+            self.time_limit,
+            self.start_time.timestamp(),
+            self.action_taken,
+            self.action_type,
+        ]
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: List[Any]) -> "CombatTurn":
+        """Rebuild a turn from `to_snapshot` output."""
+        actor_type, actor_id, time_limit, started, action_taken, action_type = snapshot
+        turn = cls(actor_type, actor_id, time_limit)
+        turn.start_time = datetime.fromtimestamp(started)
+        turn.action_taken = action_taken
+        turn.action_type = action_type
+        return turn
+    
     def is_expired(self) -> bool:
         """Check if turn time expired."""
         elapsed = (datetime.now() - self.start_time).total_seconds()
@@ -39,16 +62,37 @@ class CombatTurn:
         return max(0, self.time_limit - elapsed)
 
 
+# Turns between write-behind flushes of monster HP while a fight goes on
+COMBAT_CHECKPOINT_TURNS = int(os.getenv("COMBAT_CHECKPOINT_TURNS", "10"))
+
+# Monster fields a fight reads after it has started
+MONSTER_FIELDS = ("name", "max_hp", "physical_defense", "magical_defense", "physical_damage_min", "physical_damage_max")
+
+
 class EnhancedCombatState:
-    """Enhanced combat state with tactics and timing."""
+    """Enhanced combat state with tactics and timing.
     
-    def __init__(self, character: Character, monster: Monster, db: Session):
-        self.character = character
-        self.monster = monster
-        self.db = db
+    The state is a pure simulation: character stats and the monster fields it
+    needs are snapshotted when the fight starts, and no action touches the
+    database. `to_snapshot` / `from_snapshot` move it through a combat store
+    between requests. Monster HP reaches the database only through
+    `flush_monster_hp`, at the end of the fight or at a checkpoint.
+    """
+    
+    def __init__(self, character: Character, monster: Monster, db: Session, seed: Optional[int] = None):
+        self.character_id = character.id
+        self.monster_id = monster.id
+        self.monster = {field: getattr(monster, field) for field in MONSTER_FIELDS}
+        
+        # Every roll of the fight comes from its own stream; the seed replays it
+        if seed is None:
+            seed = derive_seed("combat", character.id, monster.id, time.time_ns())
+        self.seed = seed
+        self.actions = 0
+        self.version = 0  # Bumped by every save to a combat store
         
         # Calculate stats
-        self.char_stats = calculate_character_stats(character, db)
+        self.char_stats = dict(calculate_character_stats(character, db))
         self.char_max_hp = calculate_max_hp(character.level, character.strength, character.endurance)
         self.char_max_mp = calculate_max_mp(character.level, character.intelligence, character.wisdom)
         
@@ -57,6 +101,8 @@ class EnhancedCombatState:
         self.char_hp = self.char_max_hp
         self.char_mp = self.char_max_mp
         self.monster_hp = monster.current_hp
+        self.flushed_hp = monster.current_hp  # Monster HP last written to the database
+        self.flushed_turn = 0
         
         # Tactics
         self.tactics = TacticsManager()
@@ -65,18 +111,72 @@ class EnhancedCombatState:
         self.turn_number = 0
         self.current_turn: Optional[CombatTurn] = None
         self.combat_log: List[Dict[str, Any]] = []
+        self.log_total = 0  # Entries ever logged; the log itself keeps the last 10
         
         # Timing configuration
         self.base_turn_time = 15.0  # Base turn time in seconds
         self.turn_time_reduction = 0.1  # 10% reduction per turn
         
         # Determine first turn
-        self._determine_first_turn()
+        self._determine_first_turn(monster.speed)
+    
+    def to_snapshot(self) -> Dict[str, Any]:
+        """Compact plain-value form of the fight for a combat store."""
+        return {
+            "character_id": self.character_id,
+            "monster_id": self.monster_id,
+            "monster": self.monster,
+            "seed": self.seed,
+            "actions": self.actions,
+            "char_stats": self.char_stats,
+            "char_max_hp": self.char_max_hp,
+            "char_max_mp": self.char_max_mp,
+            "char_hp": self.char_hp,
+            "char_mp": self.char_mp,
+            "monster_hp": self.monster_hp,
+            "flushed_hp": self.flushed_hp,
+            "flushed_turn": self.flushed_turn,
+            "tactics": self.tactics.get_all_tactics(),
+            "turn_number": self.turn_number,
+            "turn": self.current_turn.to_snapshot() if self.current_turn else None,
+            "combat_log": self.combat_log[-10:],
+            "log_total": self.log_total,
+            "version": self.version,
+        }
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "EnhancedCombatState":
+        """Rebuild a fight from `to_snapshot` output without touching the database."""
+        state = cls.__new__(cls)
+        for field in (
+            "character_id", "monster_id", "monster", "seed", "actions", "char_stats",
+            "char_max_hp", "char_max_mp", "char_hp", "char_mp", "monster_hp",
+            "flushed_hp", "flushed_turn", "turn_number", "log_total", "version",
+        ):
+            setattr(state, field, snapshot[field])
+        state.tactics = TacticsManager()
+        for tactic, amount in snapshot["tactics"].items():
+            state.tactics.tactics[TacticType(tactic)] = amount
+        state.current_turn = CombatTurn.from_snapshot(snapshot["turn"]) if snapshot["turn"] else None
+        state.combat_log = snapshot["combat_log"]
+        state.base_turn_time = 15.0
+        state.turn_time_reduction = 0.1
+        return state
+    
+    def _next_rng(self) -> random.Random:
+        """Generator for the next action, derived from the fight seed and action number."""
+        self.actions += 1
+        return random.Random(f"{self.seed}:{self.actions}")
     
-    def _determine_first_turn(self):
+    def _log(self, actor: str, message: str):
+        """Add a combat log line."""
+        self.combat_log.append({"turn": self.turn_number, "actor": actor, "message": message})
+        del self.combat_log[:-10]
+        self.log_total += 1
+    
+    def _determine_first_turn(self, monster_speed: float):
         """Determine who goes first based on speed."""
         char_speed = self.char_stats["speed"]
-        monster_speed = self.monster.speed
         
         if char_speed >= monster_speed:
             self._start_character_turn()
@@ -86,13 +186,13 @@ class EnhancedCombatState:
     def _start_character_turn(self):
         """Start character's turn."""
         turn_time = self._calculate_turn_time()
-        self.current_turn = CombatTurn("character", self.character.id, turn_time)
+        self.current_turn = CombatTurn("character", self.character_id, turn_time)
         self.turn_number += 1
     
     def _start_monster_turn(self):
         """Start monster's turn."""
         turn_time = self._calculate_turn_time()
-        self.current_turn = CombatTurn("monster", self.monster.id, turn_time)
+        self.current_turn = CombatTurn("monster", self.monster_id, turn_time)
         self.turn_number += 1
     
     def _calculate_turn_time(self) -> float:
@@ -100,8 +200,11 @@ class EnhancedCombatState:
         reduction = self.turn_time_reduction * (self.turn_number - 1)
         return max(5.0, self.base_turn_time * (1 - reduction))  # Minimum 5 seconds
     
-    def character_attack(self, skill_id: Optional[int] = None) -> Dict[str, Any]:
-        """Character performs attack or skill."""
+    def character_attack(self, skill: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Character performs attack or skill.
+        
+        `skill` is a learned skill as returned by `get_combat_skill`.
+        """
         if not self.current_turn or self.current_turn.actor_type != "character":
             return {"success": False, "error": "Not character's turn"}
         
@@ -112,8 +215,8 @@ class EnhancedCombatState:
             return {"success": False, "error": "Turn time expired"}
         
         # Perform action
-        if skill_id:
-            result = self._use_skill(skill_id)
+        if skill:
+            result = self._use_skill(skill)
         else:
             result = self._basic_attack()
         
@@ -122,8 +225,9 @@ class EnhancedCombatState:
             return result
         
         self.current_turn.action_taken = True
-        self.current_turn.action_type = "skill" if skill_id else "attack"
+        self.current_turn.action_type = "skill" if skill else "attack"
         self.current_turn.result = result
+        self._log("character", result["message"])
         
         # Generate tactics
         if result.get("success"):
@@ -139,12 +243,13 @@ class EnhancedCombatState:
     
     def _basic_attack(self) -> Dict[str, Any]:
         """Perform basic attack."""
+        rng = self._next_rng()
         damage_range = self.char_stats["physical_damage"]
-        base_damage = random.randint(damage_range["min"], damage_range["max"])
+        base_damage = rng.randint(damage_range["min"], damage_range["max"])
         
         # Check for crit
         crit_chance = self.char_stats["crit_chance"]
-        is_crit = random.random() * 100 < crit_chance
+        is_crit = rng.random() * 100 < crit_chance
         
         if is_crit:
             damage = calculate_crit_damage(base_damage)
@@ -152,46 +257,28 @@ class EnhancedCombatState:
             damage = base_damage
         
         # Apply defense
-        final_damage = apply_physical_damage(damage, self.monster.physical_defense)
+        final_damage = apply_physical_damage(damage, self.monster["physical_defense"])
         self.monster_hp = max(0, self.monster_hp - final_damage)
         
-        # Update monster in DB
-        self.monster.current_hp = self.monster_hp
-        self.db.commit()
-        
         return {
             "success": True,
             "action": "attack",
             "damage": final_damage,
             "is_crit": is_crit,
             "monster_hp": self.monster_hp,
-            "monster_max_hp": self.monster.max_hp,
+            "monster_max_hp": self.monster["max_hp"],
             "message": f"Вы нанесли {final_damage} урона{' (КРИТ!)' if is_crit else ''}"
         }
     
-    def _use_skill(self, skill_id: int) -> Dict[str, Any]:
+    def _use_skill(self, skill: Dict[str, Any]) -> Dict[str, Any]:
         """Use a skill."""
-        skill = self.db.query(Skill).filter(Skill.id == skill_id).first()
-        if not skill:
-            return {"success": False, "error": "Skill not found"}
-        
-        # Check if skill is learned
-        from backend.src.models import CharacterSkill
-        char_skill = self.db.query(CharacterSkill).filter(
-            CharacterSkill.character_id == self.character.id,
-            CharacterSkill.skill_id == skill_id
-        ).first()
-        
-        if not char_skill:
-            return {"success": False, "error": "Skill not learned"}
-        
         # Check MP cost
-        mp_cost = skill.effects.get("mp_cost", 0)
+        mp_cost = skill["effects"].get("mp_cost", 0)
         if self.char_mp < mp_cost:
             return {"success": False, "error": f"Not enough MP (need {mp_cost}, have {self.char_mp})"}
         
         # Check tactics cost (for warrior skills)
-        tactics_cost = skill.effects.get("tactics_cost", {})
+        tactics_cost = skill["effects"].get("tactics_cost", {})
         for tactic_type_str, cost in tactics_cost.items():
             try:
                 tactic_type = TacticType(tactic_type_str)
@@ -207,21 +294,21 @@ class EnhancedCombatState:
         result = self._apply_skill_effects(skill)
         
         # Check if skill consumes turn
-        consumes_turn = skill.effects.get("consumes_turn", True)
+        consumes_turn = skill["effects"].get("consumes_turn", True)
         if not consumes_turn:
             # Skill doesn't consume turn, can act again
             self.current_turn.action_taken = False
         
         return result
     
-    def _apply_skill_effects(self, skill: Skill) -> Dict[str, Any]:
+    def _apply_skill_effects(self, skill: Dict[str, Any]) -> Dict[str, Any]:
         """Apply skill effects."""
-        effects = skill.effects
+        effects = skill["effects"]
         result = {
             "success": True,
             "action": "skill",
-            "skill_name": skill.name,
-            "message": f"Использован навык: {skill.name}"
+            "skill_name": skill["name"],
+            "message": f"Использован навык: {skill['name']}"
         }
         
         # Damage
@@ -232,18 +319,16 @@ class EnhancedCombatState:
                 base = (damage_range["min"] + damage_range["max"]) // 2
                 damage = int(base * effects["damage_multiplier"])
             
-            final_damage = apply_physical_damage(damage, self.monster.physical_defense)
+            final_damage = apply_physical_damage(damage, self.monster["physical_defense"])
             self.monster_hp = max(0, self.monster_hp - final_damage)
-            self.monster.current_hp = self.monster_hp
             result["damage"] = final_damage
             result["monster_hp"] = self.monster_hp
         
         # Magical damage
         if "magical_damage" in effects:
             damage = effects["magical_damage"]
-            final_damage = apply_magical_damage(damage, self.monster.magical_defense)
+            final_damage = apply_magical_damage(damage, self.monster["magical_defense"])
             self.monster_hp = max(0, self.monster_hp - final_damage)
-            self.monster.current_hp = self.monster_hp
             result["magical_damage"] = final_damage
             result["monster_hp"] = self.monster_hp
         
@@ -254,7 +339,6 @@ class EnhancedCombatState:
             result["heal"] = heal_amount
             result["character_hp"] = self.char_hp
         
-        self.db.commit()
         return result
     
     def monster_attack(self) -> Dict[str, Any]:
@@ -263,9 +347,9 @@ class EnhancedCombatState:
             return {"error": "Not monster's turn"}
         
         # Calculate damage
-        base_damage = random.randint(
-            self.monster.physical_damage_min,
-            self.monster.physical_damage_max
+        base_damage = self._next_rng().randint(
+            self.monster["physical_damage_min"],
+            self.monster["physical_damage_max"]
         )
         
         # Apply character defense
@@ -274,13 +358,15 @@ class EnhancedCombatState:
         
         self.current_turn.action_taken = True
         self.current_turn.action_type = "attack"
+        message = f"{self.monster['name']} нанес {final_damage} урона"
+        self._log("monster", message)
         
         return {
             "success": True,
             "damage": final_damage,
             "character_hp": self.char_hp,
             "character_max_hp": self.char_max_hp,
-            "message": f"{self.monster.name} нанес {final_damage} урона"
+            "message": message
         }
     
     def end_turn(self) -> Dict[str, Any]:
@@ -300,6 +386,36 @@ class EnhancedCombatState:
             "turn_time": self.current_turn.time_limit
         }
     
+    def due_in(self) -> Optional[float]:
+        """Seconds until the server has to act on this fight; None once it is over.
+        
+        A monster turn is due at once; a character turn when its timer runs out.
+        """
+        if self.is_combat_over() or not self.current_turn:
+            return None
+        if self.current_turn.actor_type == "monster":
+            return 0.0
+        return self.current_turn.time_remaining()
+    
+    def advance(self) -> bool:
+        """Play the turns the server owns: an expired character turn is lost,
+        then a pending monster turn is played. Returns True if the fight changed.
+        """
+        if self.is_combat_over() or not self.current_turn:
+            return False
+        changed = False
+        if self.current_turn.actor_type == "character":
+            if not self.current_turn.is_expired():
+                return False
+            self._log("character", "Время хода истекло")
+            self.end_turn()
+            changed = True
+        if self.current_turn.actor_type == "monster":
+            self.monster_attack()
+            self.end_turn()
+            changed = True
+        return changed
+    
     def get_combat_state(self) -> Dict[str, Any]:
         """Get current combat state."""
         time_remaining = 0
@@ -308,6 +424,7 @@ class EnhancedCombatState:
         
         return {
             "turn_number": self.turn_number,
+            "seed": self.seed,
             "current_turn": self.current_turn.actor_type if self.current_turn else None,
             "time_remaining": time_remaining,
             "character_hp": self.char_hp,
@@ -315,9 +432,14 @@ class EnhancedCombatState:
             "character_mp": self.char_mp,
             "character_max_mp": self.char_max_mp,
             "monster_hp": self.monster_hp,
-            "monster_max_hp": self.monster.max_hp,
+            "monster_max_hp": self.monster["max_hp"],
             "tactics": self.tactics.get_all_tactics(),
-            "combat_log": self.combat_log[-10:]  # Last 10 entries
+            "combat_log": self.combat_log[-10:],  # Last 10 entries
+            "log_total": self.log_total,
+            "time_limit": self.current_turn.time_limit if self.current_turn else 0,
+            "combat_over": self.is_combat_over(),
+            "winner": self.get_winner(),
+            "version": self.version,
         }
     
     def is_combat_over(self) -> bool:
@@ -331,3 +453,52 @@ class EnhancedCombatState:
         elif self.monster_hp <= 0:
             return "character"
         return None
+
+
+def get_combat_skill(character_id: int, skill_id: int, db: Session) -> Dict[str, Any]:
+    """Load a learned skill for use in combat as plain values."""
+    skill = db.query(Skill).filter(Skill.id == skill_id).first()
+    if not skill:
+        return {"success": False, "error": "Skill not found"}
+    
+    # Check if skill is learned
+    char_skill = db.query(CharacterSkill.id).filter(
+        CharacterSkill.character_id == character_id,
+        CharacterSkill.skill_id == skill_id
+    ).first()
+    
+    if not char_skill:
+        return {"success": False, "error": "Skill not learned"}
+    
+    return {
+        "success": True,
+        "skill": {"id": skill.id, "name": skill.name, "effects": skill.effects or {}},
+    }
+
+
+def checkpoint_monster_hp(state: EnhancedCombatState) -> Optional[int]:
+    """Record a monster HP checkpoint in the fight.
+    
+    Called once when the fight ends and every `COMBAT_CHECKPOINT_TURNS` turns
+    in between. Returns the HP to write with `write_monster_hp`, or None if
+    it did not change since the last checkpoint. Callers write it only after
+    the state carrying the checkpoint is saved, so a save that loses to
+    another worker leaves the database as it was.
+    """
+    state.flushed_turn = state.turn_number
+    if state.monster_hp == state.flushed_hp:
+        return None
+    state.flushed_hp = state.monster_hp
+    return state.monster_hp
+
+
+def write_monster_hp(monster_id: int, hp: int, db: Session):
+    """Write a checkpointed monster HP; the caller commits."""
+    db.query(Monster).filter(Monster.id == monster_id).update(
+        {Monster.current_hp: hp}, synchronize_session=False
+    )
+
+
+def checkpoint_due(state: EnhancedCombatState) -> bool:
+    """Whether the fight should flush now: it is over or a checkpoint is due."""
+    return state.is_combat_over() or state.turn_number - state.flushed_turn >= COMBAT_CHECKPOINT_TURNS
@@ -0,0 +1,133 @@
+"""Push channel for combat-enhanced fights.
+
+Clients follow a fight over Server-Sent Events instead of polling its state.
+Every save of a fight bumps its `version`; the stream sends the version as
+the event id and, after one full `state` event, only `delta` events with the
+fields that changed: HP, MP, tactics, turn changes and new log lines. A
+client that reconnects with `Last-Event-ID` (or `since`) gets nothing until
+the next change if it is current, and one full state otherwise.
+
+Saves in this process wake the streams of the fight at once. Streams also
+re-read the fight every `COMBAT_STREAM_POLL_MS`, which covers fights
+advanced by other workers and keeps the connection alive.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+from backend.src.core.combat_enhanced import EnhancedCombatState
+from backend.src.core.combat_store import combat_store
+from backend.src.core.combat_scheduler import combat_scheduler
+
+COMBAT_STREAM_POLL_MS = int(os.getenv("COMBAT_STREAM_POLL_MS", "5000"))
+
+# Fields of a fight streamed to clients; the log and tactics are diffed separately
+VIEW_FIELDS = (
+    "turn_number", "current_turn", "time_limit", "time_remaining",
+    "character_hp", "character_max_hp", "character_mp", "character_max_mp",
+    "monster_hp", "monster_max_hp", "combat_over", "winner", "seed",
+)
+
+
+def combat_view(state: EnhancedCombatState) -> Dict[str, Any]:
+    """Full streamed state of a fight."""
+    full = state.get_combat_state()
+    view = {field: full[field] for field in VIEW_FIELDS}
+    view["tactics"] = full["tactics"]
+    view["log"] = full["combat_log"]
+    view["log_total"] = full["log_total"]
+    return view
+
+
+def combat_delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields of `new` that differ from `old`; only new log lines and changed tactics.
+    
+    The turn timer is sent only when the turn changes.
+    """
+    delta = {
+        field: new[field]
+        for field in VIEW_FIELDS
+        if field != "time_remaining" and new[field] != old[field]
+    }
+    if "turn_number" in delta or "current_turn" in delta:
+        delta["time_remaining"] = new["time_remaining"]
+    tactics = {name: amount for name, amount in new["tactics"].items() if old["tactics"].get(name) != amount}
+    if tactics:
+        delta["tactics"] = tactics
+    new_lines = min(new["log_total"] - old["log_total"], len(new["log"]))
+    if new_lines > 0:
+        delta["log"] = new["log"][-new_lines:]
+    return delta
+
+
+def sse_event(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """Encode one Server-Sent Event."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+class CombatFeed:
+    """Wakes the streams of a fight when it is saved in this process."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._waiters: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+    
+    def publish(self, key: str, state: Optional[EnhancedCombatState] = None):
+        """Signal that the fight under `key` changed; safe from any thread."""
+        with self.lock:
+            waiters = list(self._waiters.get(key, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+    
+    def _add(self, key: str, waiter: Tuple[asyncio.AbstractEventLoop, asyncio.Event]):
+        with self.lock:
+            self._waiters.setdefault(key, set()).add(waiter)
+    
+    def _remove(self, key: str, waiter: Tuple[asyncio.AbstractEventLoop, asyncio.Event]):
+        with self.lock:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[key]
+    
+    async def stream(self, key: str, since: Optional[int] = None) -> AsyncIterator[str]:
+        """SSE events of a fight until it ends or disappears from the store."""
+        changed = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), changed)
+        self._add(key, waiter)
+        try:
+            view = None
+            version = since
+            while True:
+                changed.clear()
+                state = await asyncio.to_thread(combat_store.load, key)
+                if state is None:
+                    yield sse_event("end", {"reason": "not_found"}, version)
+                    return
+                if state.version != version:
+                    new_view = combat_view(state)
+                    if view is None:
+                        yield sse_event("state", new_view, state.version)
+                    else:
+                        yield sse_event("delta", combat_delta(view, new_view), state.version)
+                    view, version = new_view, state.version
+                elif view is None:
+                    # The client is current: diff from here on
+                    view = combat_view(state)
+                if state.is_combat_over():
+                    yield sse_event("end", {"winner": state.get_winner()}, version)
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), COMBAT_STREAM_POLL_MS / 1000.0)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self._remove(key, waiter)
+
+
+combat_feed = CombatFeed()
+combat_scheduler.add_listener(combat_feed.publish)
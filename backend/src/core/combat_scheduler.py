@@ -0,0 +1,174 @@
+"""Server-side combat clock.
+
+Turn timers and monster turns are driven by the server instead of by client
+calls. Every fight with a pending deadline sits in a hashed timing wheel: a
+ring of `COMBAT_WHEEL_SLOTS` slots of `COMBAT_TICK_MS` each, where a fight
+due in n ticks goes to slot (now + n) mod size. Scheduling and cancelling
+are O(1) and a tick only looks at one slot, so one event loop keeps
+thousands of fights on time.
+
+Each tick the due fights are loaded from the combat store, advanced (an
+expired character turn is lost, a monster turn is played), saved and
+rescheduled. Routes schedule a fight whenever they save it. Listeners
+registered with `add_listener` are told about every fight the scheduler
+changes.
+
+The wheel lives in the server process; with several workers each one keeps
+the fights whose requests it served, and a due fight is re-checked against
+its stored turn timer before anything is played.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+from backend.src.database.base import SessionLocal
+from backend.src.core.combat_enhanced import (
+    EnhancedCombatState,
+    checkpoint_due,
+    checkpoint_monster_hp,
+    write_monster_hp,
+)
+from backend.src.core.combat_store import StaleCombatState, combat_store, fight_lock
+
+logger = logging.getLogger(__name__)
+
+COMBAT_TICK_MS = int(os.getenv("COMBAT_TICK_MS", "100"))
+COMBAT_WHEEL_SLOTS = int(os.getenv("COMBAT_WHEEL_SLOTS", "512"))
+
+
+class TimingWheel:
+    """Hashed timing wheel of keys.
+    
+    Each key is stored with its absolute due tick, so delays longer than one
+    revolution wait in their slot until the wheel comes round again.
+    """
+    
+    def __init__(self, slots: int = COMBAT_WHEEL_SLOTS):
+        self.slots: List[Dict[str, int]] = [{} for _ in range(slots)]
+        self.tick = 0
+        self._slot_of: Dict[str, int] = {}
+    
+    def schedule(self, key: str, ticks: int):
+        """Fire `key` after `ticks` ticks (at least one); replaces its previous deadline."""
+        self.cancel(key)
+        due = self.tick + max(1, ticks)
+        slot = due % len(self.slots)
+        self.slots[slot][key] = due
+        self._slot_of[key] = slot
+    
+    def cancel(self, key: str):
+        """Forget `key` if it is scheduled."""
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+    
+    def advance(self) -> List[str]:
+        """Move one tick forward and return the keys that are now due."""
+        self.tick += 1
+        slot = self.slots[self.tick % len(self.slots)]
+        due = [key for key, tick in slot.items() if tick <= self.tick]
+        for key in due:
+            del slot[key]
+            del self._slot_of[key]
+        return due
+    
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+
+class CombatScheduler:
+    """Asyncio task ticking the timing wheel of combat-enhanced fights."""
+    
+    def __init__(self, tick_ms: int = COMBAT_TICK_MS, slots: int = COMBAT_WHEEL_SLOTS):
+        self.tick = tick_ms / 1000.0
+        self.wheel = TimingWheel(slots)
+        self.lock = threading.Lock()
+        self.listeners: List[Callable[[str, EnhancedCombatState], None]] = []
+        self._task: Optional[asyncio.Task] = None
+    
+    def add_listener(self, listener: Callable[[str, EnhancedCombatState], None]):
+        """Call `listener(key, state)` after the scheduler changes a fight."""
+        self.listeners.append(listener)
+    
+    def track(self, key: str, state: EnhancedCombatState):
+        """Schedule the next server action of a fight, or drop it once it is over."""
+        due_in = state.due_in()
+        with self.lock:
+            if due_in is None:
+                self.wheel.cancel(key)
+            else:
+                self.wheel.schedule(key, math.ceil(due_in / self.tick))
+    
+    def cancel(self, key: str):
+        """Stop tracking a fight."""
+        with self.lock:
+            self.wheel.cancel(key)
+    
+    def run_due(self, keys: List[str]):
+        """Advance the given fights and reschedule them."""
+        for key in keys:
+            try:
+                self._advance(key)
+            except Exception:
+                logger.exception("Combat tick failed for %s", key)
+    
+    def _advance(self, key: str):
+        with fight_lock(key):
+            state = combat_store.load(key)
+            if state is None:
+                return
+            changed = state.advance()
+            if changed:
+                hp = checkpoint_monster_hp(state) if checkpoint_due(state) else None
+                try:
+                    combat_store.save(key, state)
+                except StaleCombatState:
+                    # Another worker saved the fight first and tracks its new deadline
+                    return
+                if hp is not None:
+                    db = SessionLocal()
+                    try:
+                        write_monster_hp(state.monster_id, hp, db)
+                        db.commit()
+                    finally:
+                        db.close()
+            self.track(key, state)
+        if changed:
+            for listener in self.listeners:
+                listener(key, state)
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            due = []
+            with self.lock:
+                # Catch up on ticks missed while the loop was busy
+                while next_tick <= loop.time():
+                    due.extend(self.wheel.advance())
+                    next_tick += self.tick
+            if due:
+                await asyncio.to_thread(self.run_due, due)
+    
+    def start(self):
+        """Start ticking on the running event loop."""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        """Stop ticking."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+combat_scheduler = CombatScheduler()
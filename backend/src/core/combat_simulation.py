@@ -0,0 +1,151 @@
+"""Vectorized combat simulation for balance tuning.
+
+Plays many fights at once with NumPy under the rules of
+`EnhancedCombatState`: the faster side opens and turns alternate; the
+character uses basic attacks (damage range roll, crit check, CRIT_MULTIPLIER,
+flat physical defense, at least MIN_DAMAGE) and the monster hits from its damage
+range through the character's physical defense. The character's HP is the
+max HP of its base stats, as in a live fight. Derived stats come from
+`derive_character_stats`, so formula changes in `utils/formulas.py` apply
+to both. Turn timers and skills are not simulated: the character acts every
+turn.
+
+Monsters and items can be read from the `game_design` JSON files, so a
+tweaked monsters.json or items.json can be checked without a database.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Any, Iterable, Optional
+import numpy as np
+from backend.src.core.combat import derive_character_stats
+from backend.src.utils.formulas import CRIT_MULTIPLIER, MIN_DAMAGE, calculate_max_hp
+
+GAME_DESIGN_DIR = Path(__file__).resolve().parents[3] / "game_design"
+
+# Turns after which a fight counts as unresolved
+SIMULATION_MAX_TURNS = 1000
+
+STATS = ("strength", "agility", "intelligence", "endurance", "wisdom", "luck")
+
+
+def load_game_design(name: str, directory: Path = GAME_DESIGN_DIR) -> Dict[int, Dict[str, Any]]:
+    """Entries of game_design/<name>.json (e.g. "monsters", "items") by id."""
+    with open(directory / f"{name}.json", encoding="utf-8") as f:
+        return {entry["id"]: entry for entry in json.load(f)[name]}
+
+
+def simulate_combat(
+    character: Dict[str, int],
+    monster: Dict[str, Any],
+    equipment: Iterable[Dict[str, Any]] = (),
+    fights: int = 100_000,
+    seed: Optional[int] = None,
+    max_turns: int = SIMULATION_MAX_TURNS
+) -> Dict[str, Any]:
+    """Simulate `fights` fights of a character against a monster.
+    
+    `character` holds `level` and the base stats (missing ones default to a
+    new character's), `monster` the fields of monsters.json and `equipment`
+    the equipped items with the fields of items.json. Returns the win rate,
+    the distribution of the character's attacks needed to kill, damage per
+    turn of both sides and the HP left at the end.
+    """
+    level = character.get("level", 1)
+    base = {stat: character.get(stat, 10) for stat in STATS}
+    stat_bonuses = dict.fromkeys(STATS, 0)
+    weapon_bonus = 0
+    armor_bonus = 0
+    for item in equipment:
+        for stat, bonus in (item.get("stat_bonuses") or {}).items():
+            stat_bonuses[stat] += bonus
+        weapon_bonus += item.get("physical_damage") or 0
+        armor_bonus += item.get("physical_defense") or 0
+    stats = derive_character_stats(level, base, stat_bonuses, weapon_bonus, armor_bonus)
+    char_max_hp = calculate_max_hp(level, base["strength"], base["endurance"])
+    
+    rng = np.random.default_rng(seed)
+    char_hp = np.full(fights, char_max_hp, dtype=np.int64)
+    monster_hp = np.full(fights, monster["max_hp"], dtype=np.int64)
+    turns = np.zeros(fights, dtype=np.int64)
+    
+    damage_low, damage_high = stats["physical_damage"]["min"], stats["physical_damage"]["max"]
+    monster_low = monster.get("physical_damage_min") or 0
+    monster_high = monster.get("physical_damage_max") or 0
+    monster_defense = monster.get("physical_defense") or 0
+    
+    character_opens = stats["speed"] >= monster.get("speed", 10)
+    character_turn = character_opens
+    dealt = taken = attacks = monster_attacks = crits = 0
+    
+    active = np.arange(fights)
+    turn = 0
+    while active.size and turn < max_turns:
+        turn += 1
+        count = active.size
+        if character_turn:
+            damage = rng.integers(damage_low, damage_high + 1, size=count)
+            is_crit = rng.random(count) * 100 < stats["crit_chance"]
+            damage = np.where(is_crit, (damage * CRIT_MULTIPLIER).astype(np.int64), damage)
+            damage = np.maximum(MIN_DAMAGE, damage - monster_defense)
+            monster_hp[active] = np.maximum(0, monster_hp[active] - damage)
+            dealt += int(damage.sum())
+            attacks += count
+            crits += int(is_crit.sum())
+        else:
+            damage = rng.integers(monster_low, monster_high + 1, size=count)
+            damage = np.maximum(MIN_DAMAGE, damage - stats["physical_defense"])
+            char_hp[active] = np.maximum(0, char_hp[active] - damage)
+            taken += int(damage.sum())
+            monster_attacks += count
+        turns[active] = turn
+        over = (char_hp[active] <= 0) | (monster_hp[active] <= 0)
+        active = active[~over]
+        character_turn = not character_turn
+    
+    wins = monster_hp <= 0
+    losses = char_hp <= 0
+    # The opener acts on odd turns
+    char_attacks = (turns + 1) // 2 if character_opens else turns // 2
+    
+    return {
+        "fights": fights,
+        "character": {"level": level, "max_hp": char_max_hp, **{k: v for k, v in stats.items() if k != "max_hp"}},
+        "monster": {"name": monster.get("name"), "max_hp": monster["max_hp"], "speed": monster.get("speed", 10)},
+        "character_opens": character_opens,
+        "win_rate": float(wins.mean()) if fights else 0.0,
+        "loss_rate": float(losses.mean()) if fights else 0.0,
+        "unresolved_rate": float((~wins & ~losses).mean()) if fights else 0.0,
+        "attacks_to_kill": _distribution(char_attacks[wins]),
+        "turns": _distribution(turns[wins | losses]),
+        "damage_per_turn": {
+            "character": dealt / attacks if attacks else 0.0,
+            "monster": taken / monster_attacks if monster_attacks else 0.0,
+            "crit_rate": crits / attacks if attacks else 0.0,
+        },
+        "hp_remaining": {
+            "character_on_win": _distribution(char_hp[wins], histogram=False),
+            "character_on_win_share": float(char_hp[wins].mean() / char_max_hp) if wins.any() else None,
+            "monster_on_loss": _distribution(monster_hp[losses], histogram=False),
+        },
+    }
+
+
+def _distribution(values: np.ndarray, histogram: bool = True) -> Optional[Dict[str, Any]]:
+    """Mean, percentiles and, for counts, the share of each value."""
+    if not values.size:
+        return None
+    p10, p50, p90, p99 = np.percentile(values, [10, 50, 90, 99])
+    result = {
+        "mean": float(values.mean()),
+        "p10": float(p10),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+    }
+    if histogram:
+        counts = np.bincount(values)
+        result["histogram"] = {
+            int(value): float(count / values.size) for value, count in enumerate(counts) if count
+        }
+    return result
@@ -0,0 +1,330 @@
+"""Storage for fights in progress.
+
+A fight lives between requests as a compact JSON snapshot of
+`EnhancedCombatState` (ids and numbers, no ORM objects), keyed by
+character and monster. Every save pushes the fight's expiry `COMBAT_TTL_SECONDS`
+ahead, so abandoned fights disappear on their own, and a store keeps about
+`COMBAT_SESSIONS_KEPT` fights; the ones closest to expiry go first. Shared
+stores enforce the TTL and the cap in a sweep run every
+`COMBAT_SWEEP_EVERY` saves rather than on each save.
+
+Saves compare-and-swap on the snapshot's version: a save only succeeds if
+the stored fight is still at the version it was loaded at (a new fight at
+version 0 replaces only a missing or expired one), otherwise it raises
+`StaleCombatState`. `fight_lock` serializes one process's requests; the
+version check catches writers in other processes.
+
+`COMBAT_STORE` selects the backend:
+
+- `memory` (default): an LRU in the server process;
+- `sql`: the `combat_sessions` table, so fights survive restarts and are
+  shared by all workers on the database;
+- `redis://host:port/db`: any Redis-compatible server, needs the `redis`
+  package.
+"""
+
+import abc
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from sqlalchemy import Float, Integer, String, Text, bindparam, delete, func, select, text, update
+from backend.src.database.base import SessionLocal
+from backend.src.models import CombatSession
+from backend.src.core.combat_enhanced import EnhancedCombatState
+
+COMBAT_STORE = os.getenv("COMBAT_STORE", "memory")
+COMBAT_TTL_SECONDS = float(os.getenv("COMBAT_TTL_SECONDS", "900"))
+COMBAT_SESSIONS_KEPT = int(os.getenv("COMBAT_SESSIONS_KEPT", "10000"))
+COMBAT_SWEEP_EVERY = int(os.getenv("COMBAT_SWEEP_EVERY", "256"))
+
+
+class StaleCombatState(Exception):
+    """The fight was saved by someone else since it was loaded."""
+
+
+def combat_key(character_id: int, monster_id: int) -> str:
+    """Store key of a fight."""
+    return f"{character_id}_{monster_id}"
+
+
+# Striped locks serializing load-modify-save of one fight within the process
+_fight_locks = [threading.Lock() for _ in range(64)]
+
+
+def fight_lock(key: str) -> threading.Lock:
+    """Lock guarding a fight against concurrent requests and the scheduler."""
+    return _fight_locks[hash(key) % len(_fight_locks)]
+
+
+class CombatStore(abc.ABC):
+    """Base class; backends store snapshots as JSON strings."""
+    
+    def __init__(
+        self,
+        ttl: float = COMBAT_TTL_SECONDS,
+        max_sessions: int = COMBAT_SESSIONS_KEPT,
+        sweep_every: int = COMBAT_SWEEP_EVERY
+    ):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sweep_every = sweep_every
+        self._saves = itertools.count(1)
+    
+    def load(self, key: str) -> Optional[EnhancedCombatState]:
+        """Fight stored under `key`; None if absent or expired."""
+        payload = self._get(key)
+        if payload is None:
+            return None
+        return EnhancedCombatState.from_snapshot(json.loads(payload))
+    
+    def save(self, key: str, state: EnhancedCombatState):
+        """Store a fight as its next version and push its expiry forward.
+        
+        Raises StaleCombatState, leaving `state.version` as it was, if the
+        stored fight is no longer at that version.
+        """
+        expected = state.version
+        state.version += 1
+        payload = json.dumps(state.to_snapshot(), separators=(",", ":"))
+        if not self._put(key, payload, time.time() + self.ttl, expected, state.version):
+            state.version = expected
+            raise StaleCombatState(key)
+        if next(self._saves) % self.sweep_every == 0:
+            self.sweep()
+    
+    def delete(self, key: str):
+        """Forget a fight."""
+        self._delete(key)
+    
+    def sweep(self):
+        """Drop expired fights and the ones closest to expiry beyond `max_sessions`.
+        
+        Shared stores override this; a store that evicts on every save has
+        nothing left to sweep.
+        """
+        return None
+    
+    @abc.abstractmethod
+    def _get(self, key: str) -> Optional[str]:
+        """Live payload stored under `key`, None if absent or expired."""
+    
+    @abc.abstractmethod
+    def _put(self, key: str, payload: str, expires_at: float, expected: int, version: int) -> bool:
+        """Store `payload` as `version` if the live stored version is `expected` (0 if none)."""
+    
+    @abc.abstractmethod
+    def _delete(self, key: str):
+        """Remove the fight stored under `key`, if any."""
+
+
+class MemoryCombatStore(CombatStore):
+    """LRU of fights in the server process."""
+    
+    def __init__(self, ttl: float = COMBAT_TTL_SECONDS, max_sessions: int = COMBAT_SESSIONS_KEPT):
+        super().__init__(ttl, max_sessions)
+        self.lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+    
+    def _get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._sessions[key]
+                return None
+            return entry[2]
+    
+    def _put(self, key: str, payload: str, expires_at: float, expected: int, version: int) -> bool:
+        with self.lock:
+            now = time.time()
+            entry = self._sessions.get(key)
+            stored = entry[1] if entry is not None and entry[0] > now else 0
+            if stored != expected:
+                return False
+            self._sessions[key] = (expires_at, version, payload)
+            # Saves push expiry forward, so the order is also expiry order.
+            # Evicting here is cheap, so the in-process store needs no sweep
+            self._sessions.move_to_end(key)
+            while self._sessions:
+                oldest_key, (oldest_expiry, _, _) = next(iter(self._sessions.items()))
+                if oldest_expiry > now and len(self._sessions) <= self.max_sessions:
+                    break
+                del self._sessions[oldest_key]
+            return True
+    
+    def _delete(self, key: str):
+        with self.lock:
+            self._sessions.pop(key, None)
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# A new fight replaces only an expired one; the syntax is shared by SQLite and PostgreSQL
+_insert_session = text(
+    "INSERT INTO combat_sessions (key, state, version, expires_at) "
+    "VALUES (:key, :state, :version, :expires_at) "
+    "ON CONFLICT (key) DO UPDATE SET state = excluded.state, version = excluded.version, "
+    "expires_at = excluded.expires_at WHERE combat_sessions.expires_at <= :now"
+).bindparams(
+    bindparam("key", type_=String),
+    bindparam("state", type_=Text),
+    bindparam("version", type_=Integer),
+    bindparam("expires_at", type_=Float),
+    bindparam("now", type_=Float),
+)
+
+_sessions = CombatSession.__table__
+
+_update_session = (
+    update(_sessions)
+    .where(
+        _sessions.c.key == bindparam("session_key"),
+        _sessions.c.version == bindparam("expected"),
+        _sessions.c.expires_at > bindparam("now"),
+    )
+    .values(state=bindparam("state"), version=bindparam("version"), expires_at=bindparam("expires_at"))
+)
+
+
+class SqlCombatStore(CombatStore):
+    """Fights in the `combat_sessions` table, shared by every worker."""
+    
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        ttl: float = COMBAT_TTL_SECONDS,
+        max_sessions: int = COMBAT_SESSIONS_KEPT,
+        sweep_every: int = COMBAT_SWEEP_EVERY
+    ):
+        super().__init__(ttl, max_sessions, sweep_every)
+        self.session_factory = session_factory
+    
+    def _get(self, key: str) -> Optional[str]:
+        db = self.session_factory()
+        try:
+            return db.execute(
+                select(CombatSession.state).where(
+                    CombatSession.key == key,
+                    CombatSession.expires_at > time.time(),
+                )
+            ).scalar()
+        finally:
+            db.close()
+    
+    def _put(self, key: str, payload: str, expires_at: float, expected: int, version: int) -> bool:
+        params = {"state": payload, "version": version, "expires_at": expires_at, "now": time.time()}
+        db = self.session_factory()
+        try:
+            if expected == 0:
+                result = db.execute(_insert_session, {"key": key, **params})
+            else:
+                result = db.execute(_update_session, {"session_key": key, "expected": expected, **params})
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+    
+    def sweep(self):
+        db = self.session_factory()
+        try:
+            db.execute(delete(CombatSession).where(CombatSession.expires_at <= time.time()))
+            excess = db.execute(select(func.count()).select_from(CombatSession)).scalar() - self.max_sessions
+            if excess > 0:
+                oldest = select(CombatSession.key).order_by(CombatSession.expires_at).limit(excess)
+                db.execute(delete(CombatSession).where(CombatSession.key.in_(oldest.scalar_subquery())))
+            db.commit()
+        finally:
+            db.close()
+    
+    def _delete(self, key: str):
+        db = self.session_factory()
+        try:
+            db.execute(delete(CombatSession).where(CombatSession.key == key))
+            db.commit()
+        finally:
+            db.close()
+
+
+class RedisCombatStore(CombatStore):
+    """Fights in a Redis-compatible server; keys expire by themselves.
+    
+    A sorted set of keys by expiry enforces the size cap. Saves WATCH the
+    fight's key and write in a MULTI block only if its version still matches.
+    """
+    
+    PREFIX = "combat:"
+    INDEX = "combat:index"
+    
+    def __init__(
+        self,
+        url: str,
+        ttl: float = COMBAT_TTL_SECONDS,
+        max_sessions: int = COMBAT_SESSIONS_KEPT,
+        sweep_every: int = COMBAT_SWEEP_EVERY
+    ):
+        super().__init__(ttl, max_sessions, sweep_every)
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("COMBAT_STORE=redis:// requires the 'redis' package") from exc
+        self.client = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+    
+    def _get(self, key: str) -> Optional[str]:
+        payload = self.client.get(self.PREFIX + key)
+        return payload.decode() if payload is not None else None
+    
+    def _put(self, key: str, payload: str, expires_at: float, expected: int, version: int) -> bool:
+        name = self.PREFIX + key
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(name)
+                current = pipe.get(name)
+                stored = json.loads(current)["version"] if current is not None else 0
+                if stored != expected:
+                    return False
+                pipe.multi()
+                pipe.set(name, payload, px=int(self.ttl * 1000))
+                pipe.zadd(self.INDEX, {key: expires_at})
+                pipe.execute()
+                return True
+            except self._watch_error:
+                return False
+    
+    def sweep(self):
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(self.INDEX, 0, time.time())
+        pipe.zcard(self.INDEX)
+        excess = pipe.execute()[-1] - self.max_sessions
+        if excess > 0:
+            oldest = [k.decode() for k in self.client.zrange(self.INDEX, 0, excess - 1)]
+            pipe = self.client.pipeline()
+            pipe.delete(*[self.PREFIX + k for k in oldest])
+            pipe.zrem(self.INDEX, *oldest)
+            pipe.execute()
+    
+    def _delete(self, key: str):
+        pipe = self.client.pipeline()
+        pipe.delete(self.PREFIX + key)
+        pipe.zrem(self.INDEX, key)
+        pipe.execute()
+
+
+def make_combat_store(spec: str = COMBAT_STORE) -> CombatStore:
+    """Build the combat store named by a `COMBAT_STORE` value."""
+    if spec == "memory":
+        return MemoryCombatStore()
+    if spec == "sql":
+        return SqlCombatStore()
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCombatStore(spec)
+    raise ValueError(f"Unknown COMBAT_STORE: {spec}")
+
+
+combat_store = make_combat_store()
@@ -3,6 +3,7 @@
 from typing import Dict, Any, List, Optional
 from sqlalchemy.orm import Session
 from backend.src.models import Character, Item, InventorySlot
+from backend.src.core.inventory import lock_inventories, plan_placement, apply_placement
 
 
 def check_crafting_recipe(character: Character, recipe: Dict[str, Any], db: Session) -> Dict[str, Any]:
@@ -102,11 +103,15 @@ def check_crafting_recipe(character: Character, recipe: Dict[str, Any], db: Sess
 def craft_item(character: Character, recipe: Dict[str, Any], db: Session) -> Dict[str, Any]:
     """Craft item from recipe.
     
-    Removes ingredients and adds result to inventory.
+    Removes ingredients and adds result to inventory. The character's
+    inventory stays locked from the ingredient check to the commit.
     """
+    lock_inventories([character.id], db)
+    
     # Check if can craft
     check_result = check_crafting_recipe(character, recipe, db)
     if not check_result["can_craft"]:
+        db.rollback()
         return check_result
     
     inventory = db.query(InventorySlot).filter(
@@ -166,34 +171,16 @@ def craft_item(character: Character, recipe: Dict[str, Any], db: Session) -> Dic
             "reason": "Результат крафта не найден"
         }
     
-    # Find empty slot
-    max_slots = 30
-    existing_slots = db.query(InventorySlot).filter(
-        InventorySlot.character_id == character.id
-    ).all()
-    used_indices = {slot.slot_index for slot in existing_slots}
-    
-    slot_index = None
-    for i in range(max_slots):
-        if i not in used_indices:
-            slot_index = i
-            break
-    
-    if slot_index is None:
+    # Put the result where the removed ingredients may have freed room
+    db.flush()
+    plan = plan_placement([(character.id, result_item_id, 1, result_item.stack_size)], db)
+    if plan.unplaced[0]:
         db.rollback()
         return {
             "success": False,
             "reason": "Инвентарь переполнен"
         }
-    
-    # Create new inventory slot
-    new_slot = InventorySlot(
-        character_id=character.id,
-        item_id=result_item_id,
-        quantity=1,
-        slot_index=slot_index
-    )
-    db.add(new_slot)
+    apply_placement(plan, db)
     
     db.commit()
     
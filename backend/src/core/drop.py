@@ -1,9 +1,14 @@
 """Drop system with Core/Shell mechanics."""
 
-import random
-from typing import List, Dict, Any, Optional
+import threading
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import event, select
 from sqlalchemy.orm import Session
-from backend.src.models import Monster, DropTable, DropTableItem, Item, Character, InventorySlot
+from backend.src.models import Monster, DropTable, DropTableItem, Item, ItemType
+from backend.src.core.pity import PITY_MAX_CHANCE, pity_chance
+
+LUCK_BONUS_PER_POINT = 0.0001  # 0.01% per LUK point
 
 
 def calculate_drop_chance(base_chance: float, luck: int) -> float:
@@ -11,121 +16,319 @@ def calculate_drop_chance(base_chance: float, luck: int) -> float:
     
     LUK increases drop chance slightly (1 LUK = 0.01% bonus).
     """
-    luck_bonus = luck * 0.0001  # 0.01% per LUK point
+    luck_bonus = luck * LUCK_BONUS_PER_POINT
     return min(1.0, base_chance + luck_bonus)
 
 
-def roll_drop(monster: Monster, character: Character, db: Session) -> List[Dict[str, Any]]:
-    """Roll for drops from monster.
+class CompiledDropTable:
+    """Immutable, DB-free form of a monster's drop table.
     
-    Returns list of dropped items with quantities.
+    Entry data lives in parallel tuples indexed by entry. Independent tables
+    roll every entry against its threshold. Exclusive tables first roll
+    whether anything drops (the sum of chances) and then pick one entry with
+    Vose's alias method in O(1). Rare Core entries are pity-protected.
     """
-    if not monster.drop_table:
-        return []
     
-    drops = []
-    drop_table = monster.drop_table
+    __slots__ = (
+        "monster_id", "exclusive", "thresholds", "item_ids", "min_quantities",
+        "max_quantities", "item_names", "stack_sizes", "is_core", "is_shell",
+        "entry_ids", "pity_indices", "total_chance", "alias_probabilities", "aliases",
+    )
+    
+    def __init__(self, monster_id: int, exclusive: bool, entries: List[Tuple]):
+        self.monster_id = monster_id
+        self.exclusive = exclusive
+        (
+            self.thresholds, self.item_ids, self.min_quantities, self.max_quantities,
+            self.item_names, self.stack_sizes, self.is_core, self.is_shell, self.entry_ids,
+        ) = (tuple(column) for column in zip(*entries)) if entries else ((),) * 9
+        self.pity_indices = tuple(
+            index for index, (core, threshold) in enumerate(zip(self.is_core, self.thresholds))
+            if core and 0 < threshold <= PITY_MAX_CHANCE
+        )
+        self.total_chance = min(1.0, sum(self.thresholds))
+        if exclusive and self.total_chance > 0:
+            self.alias_probabilities, self.aliases = _build_alias(self.thresholds)
+        else:
+            self.alias_probabilities, self.aliases = (), ()
+    
+    def __len__(self) -> int:
+        return len(self.item_ids)
     
-    # Roll for each item in drop table
-    for drop_item in drop_table.items:
-        # Calculate actual drop chance with LUK
-        actual_chance = calculate_drop_chance(float(drop_item.drop_chance), character.luck)
+    def roll(self, luck: int, rng, pity: Optional[Dict[int, int]] = None) -> List[Tuple[int, int]]:
+        """Roll one kill. Returns (entry index, quantity) pairs.
         
-        # Roll
-        if random.random() < actual_chance:
-            quantity = random.randint(drop_item.min_quantity, drop_item.max_quantity)
-            drops.append({
-                "item_id": drop_item.item_id,
-                "item": drop_item.item,
-                "quantity": quantity,
-                "is_core": drop_item.item.is_soul_bound if drop_item.item else False,
-                "is_shell": drop_item.item.item_type.value == "shell" if drop_item.item else False,
-            })
+        `pity` maps entry ids to the rolling character's dry kills. A pity
+        entry whose streak raised its chance first rolls for the extra
+        chance alone; if that hits it drops outright (and, in an exclusive
+        table, instead of the normal roll). The counters are updated in place.
+        
+        Every roll is counted in the calling thread's drop counters.
+        """
+        bonus = luck * LUCK_BONUS_PER_POINT
+        if pity is None or not self.pity_indices:
+            results, forced = self._roll(bonus, rng), ()
+        else:
+            results, forced = self._roll_with_pity(bonus, rng, pity)
+        
+        counters = _thread_counters()
+        counters.rolls[(self.monster_id, luck)] += 1
+        for index, _ in results:
+            counters.hits[self.entry_ids[index]] += 1
+        if forced:
+            # A forced drop replaces the whole roll of an exclusive table
+            for index in range(len(self)) if self.exclusive else forced:
+                counters.pity_rolls[(self.entry_ids[index], luck)] += 1
+            for index in forced:
+                counters.pity_hits[self.entry_ids[index]] += 1
+        return results
     
-    return drops
+    def _roll_with_pity(self, bonus: float, rng, pity: Dict[int, int]) -> Tuple[List[Tuple[int, int]], List[int]]:
+        forced = []
+        for index in self.pity_indices:
+            chance = self.entry_chance(index, bonus)
+            boosted = pity_chance(chance, pity.get(self.entry_ids[index], 0))
+            if boosted > chance and rng.random() < (boosted - chance) / (1.0 - chance):
+                forced.append((index, rng.randint(self.min_quantities[index], self.max_quantities[index])))
+                if self.exclusive:
+                    break
+        
+        if forced and self.exclusive:
+            results = forced
+        else:
+            skipped = {index for index, _ in forced}
+            results = forced + [result for result in self._roll(bonus, rng) if result[0] not in skipped]
+        
+        dropped = {index for index, _ in results}
+        for index in self.pity_indices:
+            entry_id = self.entry_ids[index]
+            pity[entry_id] = 0 if index in dropped else pity.get(entry_id, 0) + 1
+        return results, [index for index, _ in forced]
+    
+    def entry_chance(self, index: int, bonus: float = 0.0) -> float:
+        """Per-kill chance of one entry."""
+        if self.exclusive:
+            return self.thresholds[index] / sum(self.thresholds) * min(1.0, self.total_chance + bonus)
+        return min(1.0, self.thresholds[index] + bonus)
+    
+    def _roll(self, bonus: float, rng) -> List[Tuple[int, int]]:
+        results = []
+        if self.exclusive:
+            if not self.aliases or rng.random() >= self.total_chance + bonus:
+                return results
+            scaled = rng.random() * len(self.aliases)
+            index = int(scaled)
+            if scaled - index >= self.alias_probabilities[index]:
+                index = self.aliases[index]
+            results.append((index, rng.randint(self.min_quantities[index], self.max_quantities[index])))
+            return results
+        
+        for index, threshold in enumerate(self.thresholds):
+            if rng.random() < threshold + bonus:
+                results.append((index, rng.randint(self.min_quantities[index], self.max_quantities[index])))
+        return results
+
+
+def _build_alias(weights: Tuple[float, ...]) -> Tuple[Tuple[float, ...], Tuple[int, ...]]:
+    """Vose's alias tables for sampling indices proportionally to weights."""
+    count = len(weights)
+    total = sum(weights)
+    scaled = [weight * count / total for weight in weights]
+    probabilities = [1.0] * count
+    aliases = list(range(count))
+    small = [index for index, value in enumerate(scaled) if value < 1.0]
+    large = [index for index, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        probabilities[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    return tuple(probabilities), tuple(aliases)
+
+
+class DropCounters:
+    """Roll and hit counts of one thread since startup.
+    
+    `rolls` is keyed by (monster_id, luck), `hits` by drop table entry id.
+    `pity_rolls`, keyed by (entry id, luck), counts rolls whose outcome for
+    the entry was decided by a forced pity drop; `pity_hits` counts those
+    drops per entry. Only the owning thread writes them, so counting takes
+    no lock.
+    """
+    
+    __slots__ = ("rolls", "hits", "pity_rolls", "pity_hits")
+    
+    def __init__(self):
+        self.rolls: Dict[Tuple[int, int], int] = defaultdict(int)
+        self.hits: Dict[int, int] = defaultdict(int)
+        self.pity_rolls: Dict[Tuple[int, int], int] = defaultdict(int)
+        self.pity_hits: Dict[int, int] = defaultdict(int)
+
+
+_thread_local = threading.local()
+_all_counters: List[DropCounters] = []
+_counters_lock = threading.Lock()  # Taken once per thread, on its first roll
+
+
+def _thread_counters() -> DropCounters:
+    counters = getattr(_thread_local, "counters", None)
+    if counters is None:
+        counters = _thread_local.counters = DropCounters()
+        with _counters_lock:
+            _all_counters.append(counters)
+    return counters
+
+
+def drop_counts() -> Tuple[Counter, Counter, Counter, Counter]:
+    """Rolls, hits, pity rolls and pity hits (see `DropCounters`), summed over threads."""
+    totals = Counter(), Counter(), Counter(), Counter()
+    with _counters_lock:
+        all_counters = list(_all_counters)
+    for counters in all_counters:
+        # Copying a dict of ints is atomic, so owners may keep counting
+        for total, name in zip(totals, DropCounters.__slots__):
+            total.update(dict(getattr(counters, name)))
+    return totals
 
 
-def add_drops_to_inventory(character: Character, drops: List[Dict[str, Any]], db: Session) -> Dict[str, Any]:
-    """Add dropped items to character inventory.
+def reset_drop_counts():
+    """Zero every thread's counters."""
+    with _counters_lock:
+        for counters in _all_counters:
+            for name in DropCounters.__slots__:
+                setattr(counters, name, defaultdict(int))
+
+
+# Compiled tables per monster; None until compiled or after a change
+_compiled_tables: Optional[Dict[int, CompiledDropTable]] = None
+_compile_lock = threading.Lock()
+_EMPTY_TABLE = CompiledDropTable(0, False, [])
+
+
+def compile_drop_tables(db: Session) -> Dict[int, CompiledDropTable]:
+    """Compile every drop table with a single query.
     
-    Returns summary of what was added.
+    Called at startup; after a drop table or item changes the tables are
+    recompiled on next use.
     """
+    global _compiled_tables
+    rows = db.execute(
+        select(
+            DropTable.monster_id,
+            DropTable.is_exclusive,
+            DropTableItem.id.label("entry_id"),
+            DropTableItem.drop_chance,
+            DropTableItem.item_id,
+            DropTableItem.min_quantity,
+            DropTableItem.max_quantity,
+            Item.name,
+            Item.stack_size,
+            Item.is_soul_bound,
+            Item.item_type,
+        )
+        .join(DropTableItem, DropTableItem.drop_table_id == DropTable.id)
+        .join(Item, Item.id == DropTableItem.item_id)
+        .order_by(DropTable.monster_id, DropTableItem.id)
+    ).all()
+    
+    entries: Dict[int, List[Tuple]] = {}
+    exclusive: Dict[int, bool] = {}
+    for row in rows:
+        exclusive[row.monster_id] = row.is_exclusive
+        entries.setdefault(row.monster_id, []).append((
+            float(row.drop_chance),
+            row.item_id,
+            row.min_quantity,
+            row.max_quantity,
+            row.name,
+            row.stack_size,
+            bool(row.is_soul_bound),
+            row.item_type == ItemType.SHELL,
+            row.entry_id,
+        ))
+    
+    compiled = {
+        monster_id: CompiledDropTable(monster_id, exclusive[monster_id], monster_entries)
+        for monster_id, monster_entries in entries.items()
+    }
+    with _compile_lock:
+        _compiled_tables = compiled
+    return compiled
+
+
+def invalidate_drop_tables(*args):
+    """Forget compiled tables so they are rebuilt on next use."""
+    global _compiled_tables
+    with _compile_lock:
+        _compiled_tables = None
+
+
+for _model in (DropTable, DropTableItem, Item):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, invalidate_drop_tables)
+
+
+def get_compiled_drop_table(monster_id: int, db: Session) -> CompiledDropTable:
+    """Compiled drop table of a monster (empty if it has none)."""
+    tables = _compiled_tables
+    if tables is None:
+        tables = compile_drop_tables(db)
+    return tables.get(monster_id, _EMPTY_TABLE)
+
+
+def drops_from_table(
+    table: CompiledDropTable,
+    luck: int,
+    rng,
+    pity: Optional[Dict[int, int]] = None
+) -> List[Dict[str, Any]]:
+    """Roll one kill against a compiled table into drop dicts."""
+    if not len(table):
+        return []
+    
+    return [
+        {
+            "item_id": table.item_ids[index],
+            "item_name": table.item_names[index],
+            "stack_size": table.stack_sizes[index],
+            "quantity": quantity,
+            "is_core": table.is_core[index],
+            "is_shell": table.is_shell[index],
+        }
+        for index, quantity in table.roll(luck, rng, pity)
+    ]
+
+
+def summarize_drops(drops: List[Dict[str, Any]], placed: List[Tuple[int, int]]) -> Dict[str, Any]:
+    """Describe placed drops; `placed` is (stacked, new) per drop."""
     added_items = []
     cores_found = []
     shells_found = []
     
-    for drop in drops:
-        item = drop["item"]
-        quantity = drop["quantity"]
-        
-        # Check if item is stackable
-        if item.stack_size > 1:
-            # Try to find existing stack
-            existing_slot = db.query(InventorySlot).filter(
-                InventorySlot.character_id == character.id,
-                InventorySlot.item_id == item.id
-            ).first()
-            
-            if existing_slot:
-                # Add to existing stack
-                existing_slot.quantity += quantity
-                added_items.append({
-                    "item": item.name,
-                    "quantity": quantity,
-                    "action": "stacked"
-                })
-            else:
-                # Create new slot
-                # Find first empty slot
-                max_slots = 30  # 6x5 grid
-                existing_slots = db.query(InventorySlot).filter(
-                    InventorySlot.character_id == character.id
-                ).all()
-                used_indices = {slot.slot_index for slot in existing_slots}
-                
-                for i in range(max_slots):
-                    if i not in used_indices:
-                        new_slot = InventorySlot(
-                            character_id=character.id,
-                            item_id=item.id,
-                            quantity=quantity,
-                            slot_index=i
-                        )
-                        db.add(new_slot)
-                        added_items.append({
-                            "item": item.name,
-                            "quantity": quantity,
-                            "action": "new"
-                        })
-                        break
-        else:
-            # Non-stackable item - create separate slots
-            max_slots = 30
-            existing_slots = db.query(InventorySlot).filter(
-                InventorySlot.character_id == character.id
-            ).all()
-            used_indices = {slot.slot_index for slot in existing_slots}
-            
-            for qty in range(quantity):
-                for i in range(max_slots):
-                    if i not in used_indices:
-                        new_slot = InventorySlot(
-                            character_id=character.id,
-                            item_id=item.id,
-                            quantity=1,
-                            slot_index=i
-                        )
-                        db.add(new_slot)
-                        used_indices.add(i)
-                        break
+    for drop, (stacked, new) in zip(drops, placed):
+        item_name = drop["item_name"]
+        if stacked:
+            added_items.append({
+                "item": item_name,
+                "quantity": stacked,
+                "action": "stacked"
+            })
+        if new:
+            added_items.append({
+                "item": item_name,
+                "quantity": new,
+                "action": "new"
+            })
         
         # Track cores and shells
+        if not stacked and not new:
+            continue
         if drop["is_core"]:
-            cores_found.append(item.name)
+            cores_found.append(item_name)
         elif drop["is_shell"]:
-            shells_found.append({"name": item.name, "quantity": quantity})
-    
-    db.commit()
+            shells_found.append({"name": item_name, "quantity": stacked + new})
     
     return {
         "added_items": added_items,
@@ -152,29 +355,24 @@ def _format_drop_message(cores: List[str], shells: List[Dict[str, Any]]) -> str:
     return "\n".join(messages)
 
 
-def get_drop_info(monster: Monster) -> Dict[str, Any]:
+def get_drop_info(monster: Monster, db: Session) -> Dict[str, Any]:
     """Get information about possible drops from monster."""
-    if not monster.drop_table:
-        return {"cores": [], "shells": [], "other": []}
+    table = get_compiled_drop_table(monster.id, db)
     
     cores = []
     shells = []
     other = []
     
-    for drop_item in monster.drop_table.items:
-        item = drop_item.item
-        if not item:
-            continue
-        
+    for index in range(len(table)):
         drop_info = {
-            "name": item.name,
-            "chance": float(drop_item.drop_chance) * 100,
-            "quantity": f"{drop_item.min_quantity}-{drop_item.max_quantity}",
+            "name": table.item_names[index],
+            "chance": table.thresholds[index] * 100,
+            "quantity": f"{table.min_quantities[index]}-{table.max_quantities[index]}",
         }
         
-        if item.is_soul_bound:
+        if table.is_core[index]:
             cores.append(drop_info)
-        elif item.item_type.value == "shell":
+        elif table.is_shell[index]:
             shells.append(drop_info)
         else:
             other.append(drop_info)
@@ -184,4 +382,3 @@ def get_drop_info(monster: Monster) -> Dict[str, Any]:
         "shells": shells,
         "other": other
     }
-
@@ -0,0 +1,295 @@
+"""Vectorized drop simulation for balance and economy forecasting.
+
+Draws millions of kills at once with NumPy against a monster's compiled drop
+table. Per-kill probabilities come from `calculate_drop_chance` and exclusive
+tables use the same alias tables as live rolls, so simulated and live drop
+rates agree.
+
+Pity-protected Core entries are replayed per simulated player: the kills of
+a chunk are rolled at once, then a walk from one pity event (a normal or a
+forced drop) to the next tracks each entry's dry streak and overlays the
+forced drops, as `CompiledDropTable.roll` does live.
+"""
+
+from typing import Dict, Any, List, Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from backend.src.core.drop import calculate_drop_chance, get_compiled_drop_table
+from backend.src.core.pity import PITY_RAMP, PITY_START
+
+# Kills drawn per batch; bounds memory at roughly 10 bytes per kill and entry
+SIMULATION_CHUNK = 1_000_000
+# Survival below which a pity entry's dry streak is treated as impossible
+PITY_SURVIVAL_EPSILON = 1e-15
+
+
+def simulate_drops(
+    monster_id: int,
+    kills: int = 1_000_000,
+    luck: int = 0,
+    db: Optional[Session] = None,
+    seed: Optional[int] = None,
+    players: int = 1
+) -> Dict[str, Any]:
+    """Simulate `kills` kills of a monster by characters with `luck` LUK.
+    
+    The kills are split evenly between `players` characters, each starting
+    with no pity streak. Returns per-item expected and simulated counts with
+    the per-kill variance, and the distribution of kills needed for each
+    Core drop. `chance` is the table's per-kill chance; `expected_rate` adds
+    the long-run effect of pity.
+    """
+    table = get_compiled_drop_table(monster_id, db)
+    rng = np.random.default_rng(seed)
+    entries = len(table)
+    kills_per_player = max(1, -(-kills // max(1, players)))
+    
+    chances = np.array([calculate_drop_chance(threshold, luck) for threshold in table.thresholds])
+    min_quantities = np.array(table.min_quantities, dtype=np.int64)
+    max_quantities = np.array(table.max_quantities, dtype=np.int64)
+    is_core = np.array(table.is_core, dtype=bool)
+    
+    if table.exclusive and entries:
+        drop_chance = calculate_drop_chance(table.total_chance, luck)
+        alias_probabilities = np.array(table.alias_probabilities)
+        aliases = np.array(table.aliases, dtype=np.int64)
+        # Share of each entry among kills that drop something
+        shares = np.array(table.thresholds) / sum(table.thresholds)
+        per_kill_chances = drop_chance * shares
+    else:
+        per_kill_chances = chances
+    
+    pity_indices = np.array(
+        [index for index in table.pity_indices if 0 < per_kill_chances[index] < 1], dtype=np.int64
+    )
+    streaks = np.zeros(pity_indices.size, dtype=np.int64)
+    expected_rates = _expected_rates(per_kill_chances, pity_indices, table.exclusive)
+    
+    hits = np.zeros(entries, dtype=np.int64)
+    totals = np.zeros(entries, dtype=np.int64)
+    squares = np.zeros(entries, dtype=np.int64)
+    core_gaps: List[np.ndarray] = []
+    last_core = -1  # Kill index of the previous Core drop
+    
+    done = 0
+    while done < kills and entries:
+        size = min(SIMULATION_CHUNK, kills - done)
+        
+        if table.exclusive:
+            dropped = np.flatnonzero(rng.random(size) < drop_chance)
+            scaled = rng.random(dropped.size) * entries
+            picked = scaled.astype(np.int64)
+            picked = np.where(scaled - picked < alias_probabilities[picked], picked, aliases[picked])
+            kill_index = [dropped[picked == index] for index in range(entries)]
+        else:
+            kill_index = [np.flatnonzero(rng.random(size) < chance) for chance in chances]
+        
+        if pity_indices.size:
+            kill_index = _overlay_pity(
+                kill_index, size, done, kills_per_player, pity_indices,
+                per_kill_chances[pity_indices], streaks, table.exclusive, rng
+            )
+        
+        core_kills = []
+        for index in range(entries):
+            count = kill_index[index].size
+            quantities = rng.integers(min_quantities[index], max_quantities[index] + 1, size=count)
+            hits[index] += count
+            totals[index] += quantities.sum()
+            squares[index] += (quantities * quantities).sum()
+            if is_core[index]:
+                core_kills.append(kill_index[index])
+        
+        if core_kills:
+            core_at = np.unique(np.concatenate(core_kills)) + done
+            if core_at.size:
+                # A player's first Core is counted from their first kill
+                player_starts = core_at // kills_per_player * kills_per_player - 1
+                previous = np.concatenate(([last_core], core_at[:-1]))
+                core_gaps.append(core_at - np.maximum(previous, player_starts))
+                last_core = core_at[-1]
+        done += size
+    
+    mean_quantities = (min_quantities + max_quantities) / 2
+    items = []
+    for index in range(entries):
+        mean = totals[index] / kills if kills else 0.0
+        items.append({
+            "item_id": table.item_ids[index],
+            "name": table.item_names[index],
+            "is_core": table.is_core[index],
+            "pity": bool(np.isin(index, pity_indices)),
+            "chance": float(per_kill_chances[index]),
+            "expected_rate": float(expected_rates[index]),
+            "expected_drops": float(kills * expected_rates[index]),
+            "drops": int(hits[index]),
+            "expected_quantity": float(kills * expected_rates[index] * mean_quantities[index]),
+            "quantity": int(totals[index]),
+            "mean_per_kill": float(mean),
+            "variance_per_kill": float(squares[index] / kills - mean * mean) if kills else 0.0,
+        })
+    
+    return {
+        "monster_id": monster_id,
+        "kills": kills,
+        "luck": luck,
+        "players": players,
+        "exclusive": table.exclusive,
+        "items": items,
+        "kills_to_core": _kills_to_core(table, expected_rates, is_core, core_gaps),
+    }
+
+
+def _pity_chances(chance: np.ndarray, streaks: np.ndarray) -> np.ndarray:
+    """`pity_chance` over arrays of chances and dry streaks."""
+    overdue = streaks * chance - PITY_START
+    return np.where(overdue > 0, np.minimum(1.0, chance * (1 + PITY_RAMP * overdue)), chance)
+
+
+def _pity_rate(chance: float) -> float:
+    """Long-run per-kill chance of a pity entry: one over the mean kills between drops."""
+    mean_gap = 0.0
+    survival = 1.0  # Chance that the streak reaches the block's first kill
+    start = 0
+    block = min(SIMULATION_CHUNK, max(1024, int(4 / chance)))
+    while survival > PITY_SURVIVAL_EPSILON:
+        dry = np.cumprod(1 - _pity_chances(chance, np.arange(start, start + block)))
+        mean_gap += survival * (1 + dry[:-1].sum())
+        survival *= dry[-1]
+        start += block
+    return 1 / mean_gap
+
+
+def _expected_rates(per_kill_chances: np.ndarray, pity_indices: np.ndarray, exclusive: bool) -> np.ndarray:
+    """Per-kill drop rates with pity.
+    
+    A pity entry drops at the rate of its streak's renewal process. In an
+    exclusive table forced drops replace whole rolls, so the other entries
+    lose the share of kills taken by them; with several pity entries this
+    treats their streaks as independent.
+    """
+    rates = per_kill_chances.astype(float)
+    if not pity_indices.size:
+        return rates
+    rates[pity_indices] = [_pity_rate(float(per_kill_chances[index])) for index in pity_indices]
+    if exclusive:
+        # Each kill drops a pity entry either forced or, if nothing was forced, normally:
+        # rate = forced + (1 - forced total) * chance, summed over the pity entries
+        pity_chance_total = per_kill_chances[pity_indices].sum()
+        forced_total = (rates[pity_indices].sum() - pity_chance_total) / (1 - pity_chance_total)
+        others = np.ones(rates.size, dtype=bool)
+        others[pity_indices] = False
+        rates[others] *= 1 - forced_total
+    return rates
+
+
+def _overlay_pity(kill_index, size, offset, kills_per_player, pity_indices, chances, streaks, exclusive, rng):
+    """Add forced pity drops to one chunk's normally rolled kills.
+    
+    `kill_index` holds the chunk's dropping kills per entry; `streaks` the
+    current player's dry kills per pity entry, updated in place. Walks from
+    one kill where a pity entry drops to the next. Until some streak passes
+    its pity start nothing can be forced and the walk jumps straight to the
+    next normal drop; past it, forced rolls are evaluated a window of kills
+    at a time.
+    """
+    normal = np.zeros((pity_indices.size, size), dtype=bool)
+    for row, index in enumerate(pity_indices):
+        normal[row, kill_index[index]] = True
+    normal_kills = np.flatnonzero(normal.any(axis=0))
+    draws = rng.random((pity_indices.size, size))
+    # Longest streaks that still roll at the table's chance (rounded down, to be safe)
+    pity_starts = np.floor(PITY_START / chances).astype(np.int64)
+    column = chances[:, None]
+    window = min(SIMULATION_CHUNK, max(64, int(2 / chances.min())))
+    forced_kills: List[List[int]] = [[] for _ in pity_indices]
+    replaced = []
+    
+    position = 0
+    upcoming = 0  # Index of the next normal drop in normal_kills
+    while position < size:
+        # Streaks restart with the next player
+        boundary = ((offset + position) // kills_per_player + 1) * kills_per_player - offset
+        limit = min(size, boundary)
+        quiet_until = position + max(0, int((pity_starts - streaks).min()))
+        while upcoming < normal_kills.size and normal_kills[upcoming] < position:
+            upcoming += 1
+        next_normal = normal_kills[upcoming] if upcoming < normal_kills.size else size
+        
+        if next_normal < min(quiet_until, limit):
+            kill = next_normal
+            dropped_rows = np.flatnonzero(normal[:, kill])
+        elif quiet_until >= limit:
+            kill = None
+            streaks += limit - position
+            position = limit
+        else:
+            streaks += quiet_until - position
+            position = quiet_until
+            end = min(limit, position + window)
+            boosted = _pity_chances(column, streaks[:, None] + np.arange(end - position))
+            forced = draws[:, position:end] < (boosted - column) / (1 - column)
+            events = forced | normal[:, position:end]
+            hit = np.flatnonzero(events.any(axis=0))
+            if hit.size:
+                kill = position + hit[0]
+                forced_rows = np.flatnonzero(forced[:, hit[0]])
+                if exclusive and forced_rows.size:
+                    # The first forced entry replaces the kill's normal roll
+                    forced_rows = forced_rows[:1]
+                    dropped_rows = forced_rows
+                    replaced.append(kill)
+                else:
+                    dropped_rows = np.flatnonzero(events[:, hit[0]])
+                for row in forced_rows:
+                    forced_kills[row].append(kill)
+            else:
+                kill = None
+                streaks += end - position
+                position = end
+        
+        if kill is not None:
+            streaks += kill + 1 - position
+            streaks[dropped_rows] = 0
+            position = kill + 1
+        if position == boundary:
+            streaks[:] = 0
+    
+    if replaced:
+        kill_index = [kills[~np.isin(kills, replaced)] for kills in kill_index]
+    for row, index in enumerate(pity_indices):
+        if forced_kills[row]:
+            kill_index[index] = np.union1d(kill_index[index], forced_kills[row])
+    return kill_index
+
+
+def _kills_to_core(table, rates, is_core, core_gaps) -> Optional[Dict[str, Any]]:
+    """Distribution of kills needed for a Core drop.
+    
+    Each gap between consecutive Core drops (and the kills before a player's
+    first) is one sample of kills-until-Core.
+    """
+    if not is_core.any():
+        return None
+    
+    if table.exclusive:
+        chance = float(rates[is_core].sum())
+    else:
+        chance = float(1 - np.prod(1 - rates[is_core]))
+    
+    result = {
+        "chance_per_kill": chance,
+        "expected_kills": 1 / chance if chance else None,
+        "samples": 0,
+    }
+    if core_gaps:
+        gaps = np.concatenate(core_gaps)
+        p50, p90, p99 = np.percentile(gaps, [50, 90, 99])
+        result.update({
+            "samples": int(gaps.size),
+            "mean_kills": float(gaps.mean()),
+            "p50_kills": float(p50),
+            "p90_kills": float(p90),
+            "p99_kills": float(p99),
+        })
+    return result
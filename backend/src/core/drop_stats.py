@@ -0,0 +1,123 @@
+"""Observed versus expected drop rates.
+
+Live rolls only bump in-process counters (see `drop_counts`). A background
+job periodically folds them into per-entry statistics: the observed rate
+with its 95% Wilson interval and the rate the table promises at the luck
+values actually rolled. Rolls decided by a forced pity drop follow the
+character's streak rather than the table, so they are left out of both the
+observed and the expected rate and reported separately.
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from backend.src.database.base import SessionLocal
+from backend.src.core.drop import LUCK_BONUS_PER_POINT, drop_counts, get_compiled_drop_table
+
+logger = logging.getLogger(__name__)
+
+DROP_STATS_INTERVAL_MS = int(os.getenv("DROP_STATS_INTERVAL_MS", "10000"))
+CONFIDENCE_Z = 1.96  # 95%
+
+
+def wilson_interval(hits: int, rolls: int, z: float = CONFIDENCE_Z) -> Tuple[float, float]:
+    """Wilson score interval of a binomial rate."""
+    if rolls == 0:
+        return 0.0, 1.0
+    rate = hits / rolls
+    denominator = 1 + z * z / rolls
+    center = (rate + z * z / (2 * rolls)) / denominator
+    margin = z * ((rate * (1 - rate) + z * z / (4 * rolls)) / rolls) ** 0.5 / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def compute_drop_stats(db: Session) -> List[Dict[str, Any]]:
+    """Per-entry drop statistics from the current counters."""
+    rolls, hits, pity_rolls, pity_hits = drop_counts()
+    rolls_by_monster: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+    for (monster_id, luck), count in rolls.items():
+        rolls_by_monster[monster_id].append((luck, count))
+    
+    stats = []
+    for monster_id in sorted(rolls_by_monster):
+        table = get_compiled_drop_table(monster_id, db)
+        by_luck = rolls_by_monster[monster_id]
+        for index, entry_id in enumerate(table.entry_ids):
+            table_rolls = [(luck, count - pity_rolls.get((entry_id, luck), 0)) for luck, count in by_luck]
+            total = sum(count for _, count in table_rolls)
+            expected = sum(
+                count * table.entry_chance(index, luck * LUCK_BONUS_PER_POINT)
+                for luck, count in table_rolls
+            ) / total if total else 0.0
+            entry_pity_hits = pity_hits.get(entry_id, 0)
+            entry_hits = hits.get(entry_id, 0) - entry_pity_hits
+            low, high = wilson_interval(entry_hits, total)
+            stats.append({
+                "monster_id": monster_id,
+                "entry_id": entry_id,
+                "item_id": table.item_ids[index],
+                "item_name": table.item_names[index],
+                "rolls": total,
+                "hits": entry_hits,
+                "pity_hits": entry_pity_hits,
+                "observed_rate": entry_hits / total if total else 0.0,
+                "expected_rate": expected,
+                "ci_low": low,
+                "ci_high": high,
+                "within_ci": low <= expected <= high,
+            })
+    return stats
+
+
+class DropStatsAggregator:
+    """Background thread refreshing drop statistics."""
+    
+    def __init__(self, interval_ms: int = DROP_STATS_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def refresh(self, db: Session) -> Dict[str, Any]:
+        """Recompute the statistics now."""
+        self.snapshot = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "entries": compute_drop_stats(db),
+        }
+        return self.snapshot
+    
+    def latest(self, db: Session) -> Dict[str, Any]:
+        """Last computed statistics, computing them if there are none yet."""
+        return self.snapshot or self.refresh(db)
+    
+    def start(self):
+        """Start refreshing."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="drop-stats", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop refreshing."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = SessionLocal()
+            try:
+                self.refresh(db)
+            except Exception:
+                logger.exception("Drop stats refresh failed")
+            finally:
+                db.close()
+
+
+drop_stats_aggregator = DropStatsAggregator()
@@ -0,0 +1,105 @@
+"""Expiry of good-till-time market orders.
+
+A background sweeper closes open orders past their `expires_at`. Each run
+finds the affected items through the partial expiry index and closes every
+expired order of an item with one range UPDATE ... RETURNING, then returns
+the escrow in bulk; no order rows are loaded into the ORM.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+from backend.src.database.base import SessionLocal
+from backend.src.models import MarketOrder, OrderStatus
+from backend.src.core.order_book import locked_order_book, open_status_clause
+from backend.src.core.settlement import release_escrow
+
+logger = logging.getLogger(__name__)
+
+MARKET_EXPIRY_SWEEP_MS = int(os.getenv("MARKET_EXPIRY_SWEEP_MS", "1000"))
+
+_orders = MarketOrder.__table__
+
+_expire_item_orders = (
+    update(_orders)
+    .where(
+        _orders.c.item_id == bindparam("expired_item_id"),
+        open_status_clause(_orders.c.status),
+        _orders.c.expires_at <= bindparam("now"),
+    )
+    .values(status=OrderStatus.EXPIRED)
+    .returning(
+        _orders.c.id,
+        _orders.c.character_id,
+        _orders.c.item_id,
+        _orders.c.order_type,
+        _orders.c.price,
+        _orders.c.quantity,
+        _orders.c.filled_quantity,
+    )
+)
+
+
+def expire_orders(db: Session, now: Optional[datetime] = None) -> int:
+    """Close every open order past its expiry and return its escrow.
+    
+    Returns the number of expired orders.
+    """
+    now = now or datetime.now(timezone.utc)
+    item_ids = db.execute(
+        select(MarketOrder.item_id)
+        .where(open_status_clause(), MarketOrder.expires_at <= now)
+        .distinct()
+    ).scalars().all()
+    
+    expired = 0
+    for item_id in item_ids:
+        with locked_order_book(item_id, db) as book:
+            rows = db.execute(_expire_item_orders, {"expired_item_id": item_id, "now": now}).all()
+            release_escrow(rows, db)
+            db.commit()
+            for row in rows:
+                book.remove(row.id)
+        expired += len(rows)
+    return expired
+
+
+class ExpirySweeper:
+    """Background thread expiring good-till-time orders."""
+    
+    def __init__(self, interval_ms: int = MARKET_EXPIRY_SWEEP_MS):
+        self.interval = interval_ms / 1000.0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start sweeping."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="market-expiry", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop sweeping and wait for the current sweep."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = SessionLocal()
+            try:
+                expire_orders(db)
+            except Exception:
+                logger.exception("Order expiry sweep failed")
+            finally:
+                db.close()
+
+
+expiry_sweeper = ExpirySweeper()
@@ -1,8 +1,311 @@
-"""Inventory and equipment system."""
+"""Inventory and equipment system.
 
-from typing import Dict, Any, List, Optional
+Grid occupancy is kept as a bitmask on the character (`inventory_mask`, bit i
+set while slot i holds an item), so free slots are found without reading the
+character's slots. Every placement locks the receiving characters' masks
+until the transaction ends, which serializes loot, crafting, unequipping and
+market deliveries per character across threads and server processes.
+"""
+
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from sqlalchemy import BigInteger, bindparam, delete, event, insert, select, update
 from sqlalchemy.orm import Session
-from backend.src.models import Character, Item, InventorySlot, EquipmentSlot
+from backend.src.models import Character, Item, InventorySlot, EquipmentSlot, PendingDelivery
+from backend.src.core.character import bump_stats_version
+
+MAX_INVENTORY_SLOTS = 30  # 6x5 grid
+GRID_MASK = (1 << MAX_INVENTORY_SLOTS) - 1
+
+_inventory = InventorySlot.__table__
+_characters = Character.__table__
+
+_set_slot_quantity = (
+    update(_inventory)
+    .where(_inventory.c.id == bindparam("slot_id"))
+    .values(quantity=bindparam("new_quantity"))
+)
+
+# A no-op write that takes the characters' row locks and returns their masks
+_lock_masks = (
+    update(_characters)
+    .where(_characters.c.id.in_(bindparam("character_ids", expanding=True)))
+    .values(inventory_mask=_characters.c.inventory_mask)
+    .returning(_characters.c.id, _characters.c.inventory_mask)
+)
+
+_set_mask = (
+    update(_characters)
+    .where(_characters.c.id == bindparam("character_key"))
+    .values(inventory_mask=bindparam("new_mask", type_=BigInteger))
+)
+
+_occupy_slot = (
+    update(_characters)
+    .where(_characters.c.id == bindparam("character_key"))
+    .values(inventory_mask=_characters.c.inventory_mask.op("|")(bindparam("bits", type_=BigInteger)))
+)
+
+_set_pending_quantity = (
+    update(PendingDelivery.__table__)
+    .where(PendingDelivery.__table__.c.id == bindparam("delivery_id"))
+    .values(quantity=bindparam("new_quantity"))
+)
+
+_free_slot = (
+    update(_characters)
+    .where(_characters.c.id == bindparam("character_key"))
+    .values(inventory_mask=_characters.c.inventory_mask.op("&")(bindparam("keep", type_=BigInteger)))
+)
+
+
+def first_free_slot(mask: int) -> Optional[int]:
+    """Lowest free grid slot of an occupancy mask, or None if the grid is full."""
+    free = ~mask & GRID_MASK
+    if not free:
+        return None
+    return (free & -free).bit_length() - 1
+
+
+def free_slots(mask: int, count: int) -> List[int]:
+    """Up to `count` lowest free grid slots of an occupancy mask."""
+    slots = []
+    free = ~mask & GRID_MASK
+    while free and len(slots) < count:
+        lowest = free & -free
+        slots.append(lowest.bit_length() - 1)
+        free ^= lowest
+    return slots
+
+
+def lock_inventories(character_ids: Iterable[int], db: Session) -> Dict[int, int]:
+    """Lock characters' inventories for the transaction; returns their masks.
+    
+    Missing masks are rebuilt from the characters' slots first.
+    """
+    masks = dict(db.execute(_lock_masks, {"character_ids": sorted(set(character_ids))}).all())
+    missing = [character_id for character_id, mask in masks.items() if mask is None]
+    if missing:
+        masks.update(rebuild_inventory_masks(missing, db))
+    return masks
+
+
+def rebuild_inventory_masks(character_ids: Iterable[int], db: Session) -> Dict[int, int]:
+    """Recompute characters' occupancy masks from their grid slots and store them."""
+    masks = dict.fromkeys(character_ids, 0)
+    if not masks:
+        return masks
+    for character_id, slot_index in db.execute(
+        select(InventorySlot.character_id, InventorySlot.slot_index).where(
+            InventorySlot.character_id.in_(masks),
+            InventorySlot.slot_index >= 0,
+            InventorySlot.slot_index < MAX_INVENTORY_SLOTS
+        )
+    ):
+        masks[character_id] |= 1 << slot_index
+    db.execute(_set_mask, [
+        {"character_key": character_id, "new_mask": mask}
+        for character_id, mask in masks.items()
+    ])
+    return masks
+
+
+# Slots written through the ORM keep the mask in step; the bulk writes below
+# set it themselves.
+@event.listens_for(InventorySlot, "after_insert")
+def _occupy_inserted_slot(mapper, connection, target):
+    if 0 <= target.slot_index < MAX_INVENTORY_SLOTS:
+        connection.execute(_occupy_slot, {"character_key": target.character_id, "bits": 1 << target.slot_index})
+
+
+@event.listens_for(InventorySlot, "after_delete")
+def _free_deleted_slot(mapper, connection, target):
+    if 0 <= target.slot_index < MAX_INVENTORY_SLOTS:
+        connection.execute(_free_slot, {"character_key": target.character_id, "keep": ~(1 << target.slot_index)})
+
+
+class PlacementPlan:
+    """Slot writes for a batch of item deliveries.
+    
+    `placed` holds, per delivery in input order, the quantity merged into
+    existing stacks and the quantity put into new slots; `unplaced` the
+    quantity that did not fit. `masks` are the receiving characters'
+    occupancy masks after the plan is applied.
+    """
+    
+    __slots__ = ("inserts", "updates", "masks", "placed", "unplaced")
+    
+    def __init__(self):
+        self.inserts: List[Dict[str, int]] = []
+        self.updates: Dict[int, int] = {}
+        self.masks: Dict[int, int] = {}
+        self.placed: List[Tuple[int, int]] = []
+        self.unplaced: List[int] = []
+
+
+def plan_placement(
+    deliveries: Iterable[Tuple[int, int, int, int]],
+    db: Session
+) -> PlacementPlan:
+    """Plan where delivered items go.
+    
+    `deliveries` are (character_id, item_id, quantity, stack_size). Items
+    top up existing stacks of the same item to `stack_size` first, then take
+    the lowest free slots; what does not fit the grid is left unplaced.
+    
+    Locks the receiving inventories until the transaction ends; pending ORM
+    changes to their slots must be flushed first.
+    """
+    deliveries = [delivery for delivery in deliveries if delivery[2] > 0]
+    plan = PlacementPlan()
+    if not deliveries:
+        return plan
+    
+    character_ids = {delivery[0] for delivery in deliveries}
+    masks = lock_inventories(character_ids, db)
+    
+    stacks: Dict[Tuple[int, int], List[Dict[str, int]]] = defaultdict(list)
+    stackable = {delivery[1] for delivery in deliveries if (delivery[3] or 1) > 1}
+    if stackable:
+        for slot_id, character_id, item_id, quantity in db.execute(
+            select(
+                InventorySlot.id,
+                InventorySlot.character_id,
+                InventorySlot.item_id,
+                InventorySlot.quantity,
+            )
+            .where(
+                InventorySlot.character_id.in_(character_ids),
+                InventorySlot.item_id.in_(stackable)
+            )
+            .order_by(InventorySlot.slot_index)
+        ):
+            stacks[(character_id, item_id)].append({"slot_id": slot_id, "quantity": quantity})
+    
+    for character_id, item_id, quantity, stack_size in deliveries:
+        stack_size = max(stack_size or 1, 1)
+        remaining = quantity
+        
+        if stack_size > 1:
+            for stack in stacks[(character_id, item_id)]:
+                room = stack_size - stack["quantity"]
+                if room <= 0:
+                    continue
+                added = min(room, remaining)
+                stack["quantity"] += added
+                if "slot_id" in stack:
+                    plan.updates[stack["slot_id"]] = stack["quantity"]
+                remaining -= added
+                if not remaining:
+                    break
+        merged = quantity - remaining
+        
+        if remaining > 0:
+            mask = masks.get(character_id, 0)
+            needed = -(-remaining // stack_size)
+            slots = free_slots(mask, needed)
+            for slot_index in slots:
+                mask |= 1 << slot_index
+            plan.masks[character_id] = masks[character_id] = mask
+            
+            for slot_index in slots:
+                amount = min(stack_size, remaining)
+                row = {
+                    "character_id": character_id,
+                    "item_id": item_id,
+                    "quantity": amount,
+                    "slot_index": slot_index,
+                }
+                plan.inserts.append(row)
+                if stack_size > 1:
+                    # Later deliveries of the batch merge into the new stack
+                    stacks[(character_id, item_id)].append(row)
+                remaining -= amount
+        
+        plan.placed.append((merged, quantity - merged - remaining))
+        plan.unplaced.append(remaining)
+    
+    return plan
+
+
+def apply_placement(plan: PlacementPlan, db: Session):
+    """Write a placement plan with one bulk statement per table touched."""
+    if plan.updates:
+        db.execute(_set_slot_quantity, [
+            {"slot_id": slot_id, "new_quantity": quantity}
+            for slot_id, quantity in plan.updates.items()
+        ])
+    if plan.inserts:
+        db.execute(insert(InventorySlot), plan.inserts)
+        db.execute(_set_mask, [
+            {"character_key": character_id, "new_mask": mask}
+            for character_id, mask in plan.masks.items()
+        ])
+
+
+def hold_deliveries(deliveries: Iterable[Tuple[int, int, int]], db: Session):
+    """Keep items that did not fit the grid as pending deliveries.
+    
+    `deliveries` are (character_id, item_id, quantity); the player collects
+    them with `claim_pending_deliveries` once the grid has room.
+    """
+    rows = [
+        {"character_id": character_id, "item_id": item_id, "quantity": quantity}
+        for character_id, item_id, quantity in deliveries
+        if quantity > 0
+    ]
+    if rows:
+        db.execute(insert(PendingDelivery), rows)
+
+
+def claim_pending_deliveries(character: Character, db: Session) -> Dict[str, Any]:
+    """Move a character's pending deliveries into the grid, oldest first, as far as they fit."""
+    # Lock before reading, so concurrent claims do not deliver the same items twice
+    lock_inventories([character.id], db)
+    pending = db.execute(
+        select(PendingDelivery.id, PendingDelivery.item_id, PendingDelivery.quantity, Item.stack_size)
+        .join(Item, Item.id == PendingDelivery.item_id)
+        .where(PendingDelivery.character_id == character.id)
+        .order_by(PendingDelivery.id)
+    ).all()
+    if not pending:
+        db.rollback()
+        return {
+            "success": False,
+            "reason": "Нет ожидающих доставок"
+        }
+    
+    plan = plan_placement(
+        [(character.id, row.item_id, row.quantity, row.stack_size or 1) for row in pending],
+        db
+    )
+    claimed = sum(row.quantity for row in pending) - sum(plan.unplaced)
+    if not claimed:
+        db.rollback()
+        return {
+            "success": False,
+            "reason": "Инвентарь переполнен"
+        }
+    
+    done = [row.id for row, left in zip(pending, plan.unplaced) if not left]
+    partial = [
+        {"delivery_id": row.id, "new_quantity": left}
+        for row, left in zip(pending, plan.unplaced)
+        if 0 < left < row.quantity
+    ]
+    if done:
+        db.execute(delete(PendingDelivery).where(PendingDelivery.id.in_(done)))
+    if partial:
+        db.execute(_set_pending_quantity, partial)
+    apply_placement(plan, db)
+    db.commit()
+    
+    return {
+        "success": True,
+        "claimed": claimed,
+        "pending": sum(plan.unplaced),
+        "message": f"Получено предметов: {claimed}"
+    }
 
 
 def get_inventory(character: Character, db: Session) -> Dict[str, Any]:
@@ -11,7 +314,7 @@ def get_inventory(character: Character, db: Session) -> Dict[str, Any]:
         InventorySlot.character_id == character.id
     ).order_by(InventorySlot.slot_index).all()
     
-    max_slots = 30  # 6x5 grid
+    max_slots = MAX_INVENTORY_SLOTS
     inventory_grid = [None] * max_slots
     
     for slot in slots:
@@ -28,10 +331,29 @@ def get_inventory(character: Character, db: Session) -> Dict[str, Any]:
                 "quantity": slot.quantity,
             }
     
+    # Deliveries waiting for room in the grid
+    pending = db.query(PendingDelivery).filter(
+        PendingDelivery.character_id == character.id
+    ).order_by(PendingDelivery.id).all()
+    
     return {
         "slots": inventory_grid,
         "used_slots": len([s for s in inventory_grid if s is not None]),
         "max_slots": max_slots,
+        "pending": [
+            {
+                "id": delivery.id,
+                "item_id": delivery.item_id,
+                "item": {
+                    "id": delivery.item.id,
+                    "name": delivery.item.name,
+                    "rarity": delivery.item.rarity.value,
+                    "item_type": delivery.item.item_type.value,
+                },
+                "quantity": delivery.quantity,
+            }
+            for delivery in pending
+        ],
     }
 
 
@@ -138,6 +460,7 @@ def equip_item(character: Character, item_id: int, db: Session) -> Dict[str, Any
     
     # Equip new item
     setattr(equipment, slot_name, item_id)
+    bump_stats_version(character)
     
     # Remove from inventory
     inventory_slot.quantity -= 1
@@ -174,36 +497,17 @@ def unequip_item(character: Character, slot_name: str, db: Session) -> Dict[str,
     
     # Clear slot
     setattr(equipment, full_slot_name, None)
+    bump_stats_version(character)
     
     # Add item back to inventory
-    # Find empty slot
-    max_slots = 30
-    existing_slots = db.query(InventorySlot).filter(
-        InventorySlot.character_id == character.id
-    ).all()
-    used_indices = {slot.slot_index for slot in existing_slots}
-    
-    slot_index = None
-    for i in range(max_slots):
-        if i not in used_indices:
-            slot_index = i
-            break
-    
-    if slot_index is None:
+    plan = plan_placement([(character.id, item_id, 1, 1)], db)
+    if plan.unplaced[0]:
         db.rollback()
         return {
             "success": False,
             "reason": "Инвентарь переполнен"
         }
-    
-    # Create inventory slot
-    new_slot = InventorySlot(
-        character_id=character.id,
-        item_id=item_id,
-        quantity=1,
-        slot_index=slot_index
-    )
-    db.add(new_slot)
+    apply_placement(plan, db)
     
     db.commit()
     
@@ -4,6 +4,7 @@ from typing import Dict, Any, List, Optional
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from backend.src.models import Location, Character, Monster
+from backend.src.core.drop import get_drop_info
 
 
 def get_location_info(location_id: int, db: Session) -> Dict[str, Any]:
@@ -34,6 +35,41 @@ def get_location_info(location_id: int, db: Session) -> Dict[str, Any]:
     }
 
 
+def get_location_monsters(location_id: int, db: Session) -> Optional[Dict[str, Any]]:
+    """Get every monster of a location with its drop info.
+    
+    Costs two queries however many monsters there are; drops are served
+    from the compiled drop tables.
+    """
+    location = db.query(Location.id, Location.name).filter(Location.id == location_id).first()
+    if not location:
+        return None
+    
+    monsters = db.query(
+        Monster.id,
+        Monster.name,
+        Monster.level,
+        Monster.current_hp,
+        Monster.max_hp,
+    ).filter(Monster.location_id == location_id).order_by(Monster.id).all()
+    
+    return {
+        "id": location.id,
+        "name": location.name,
+        "monsters": [
+            {
+                "id": m.id,
+                "name": m.name,
+                "level": m.level,
+                "current_hp": m.current_hp,
+                "max_hp": m.max_hp,
+                "drops": get_drop_info(m, db),
+            }
+            for m in monsters
+        ]
+    }
+
+
 def can_travel(character: Character, target_location_id: int, db: Session) -> Dict[str, Any]:
     """Check if character can travel to location."""
     if not character.location_id:
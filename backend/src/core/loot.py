@@ -0,0 +1,324 @@
+"""Kill-event pipeline for loot.
+
+Combat does not resolve drops in the request. A victory enqueues a kill
+event and the player gets its `kill_id` back at once; a background worker
+drains the queue in batches, rolls every kill against the compiled drop
+tables and places the loot of the whole batch, for many characters, in one
+transaction.
+
+Kill events and their results live in the `loot_kills` table, so any server
+process can serve a poll by `kill_id` and pending kills survive restarts.
+A worker claims a batch in the same transaction that places its loot: if
+the batch fails, nothing is kept and its kills are resolved one at a time,
+so one bad kill only fails itself.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from backend.src.database.base import SessionLocal
+from backend.src.models import LootKill
+from backend.src.core.drop import drops_from_table, get_compiled_drop_table, summarize_drops
+from backend.src.core.inventory import plan_placement, apply_placement
+from backend.src.core.pity import flush_pity, load_pity
+from backend.src.utils.rng import derive_seed
+
+logger = logging.getLogger(__name__)
+
+LOOT_BATCH_MS = int(os.getenv("LOOT_BATCH_MS", "100"))
+LOOT_BATCH_SIZE = int(os.getenv("LOOT_BATCH_SIZE", "500"))
+LOOT_POLL_MS = int(os.getenv("LOOT_POLL_MS", "1000"))
+LOOT_RESULTS_TTL_SECONDS = float(os.getenv("LOOT_RESULTS_TTL_SECONDS", "3600"))
+
+_kills = LootKill.__table__
+
+_claimed_columns = (
+    _kills.c.kill_id,
+    _kills.c.character_id,
+    _kills.c.monster_id,
+    _kills.c.luck,
+    _kills.c.seed,
+    _kills.c.created_at,
+)
+
+# Oldest pending kills; other workers' claimed rows are skipped on PostgreSQL
+_claim_batch = (
+    update(_kills)
+    .where(
+        _kills.c.status == "pending",
+        _kills.c.kill_id.in_(
+            select(_kills.c.kill_id)
+            .where(_kills.c.status == "pending")
+            .order_by(_kills.c.created_at)
+            .limit(bindparam("batch_size"))
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        ),
+    )
+    .values(status="resolving")
+    .returning(*_claimed_columns)
+)
+
+_claim_kill = (
+    update(_kills)
+    .where(_kills.c.kill_id == bindparam("claimed_kill_id"), _kills.c.status == "pending")
+    .values(status="resolving")
+    .returning(*_claimed_columns)
+)
+
+_finish_kill = (
+    update(_kills)
+    .where(_kills.c.kill_id == bindparam("finished_kill_id"))
+    .values(status=bindparam("new_status"), result=bindparam("new_result"))
+)
+
+
+class KillEvent:
+    """A monster kill waiting for loot resolution."""
+    
+    __slots__ = ("kill_id", "character_id", "monster_id", "luck", "seed")
+    
+    def __init__(self, kill_id: str, character_id: int, monster_id: int, luck: int, seed: int):
+        self.kill_id = kill_id
+        self.character_id = character_id
+        self.monster_id = monster_id
+        self.luck = luck
+        self.seed = seed
+
+
+def resolve_kills(events: List[KillEvent], db: Session) -> Dict[str, Dict[str, Any]]:
+    """Roll and place the loot of a batch of kills in the caller's transaction.
+    
+    Each kill rolls with its own seed. Pity counters of the batch's
+    characters are read with one query and their changes written with the
+    loot. Returns the loot summary per kill_id.
+    """
+    tables = [get_compiled_drop_table(event.monster_id, db) for event in events]
+    counters = load_pity(
+        {event.character_id for event, table in zip(events, tables) if table.pity_indices}, db
+    )
+    rolled = []
+    for event, table in zip(events, tables):
+        pity = counters.get(event.character_id) if table.pity_indices else None
+        rolled.append((event, drops_from_table(table, event.luck, random.Random(event.seed), pity)))
+    
+    plan = plan_placement(
+        [
+            (event.character_id, drop["item_id"], drop["quantity"], drop["stack_size"])
+            for event, drops in rolled
+            for drop in drops
+        ],
+        db
+    )
+    apply_placement(plan, db)
+    flush_pity(counters, db)
+    
+    results = {}
+    position = 0
+    for event, drops in rolled:
+        placed = plan.placed[position:position + len(drops)]
+        position += len(drops)
+        results[event.kill_id] = {
+            "status": "ready",
+            "kill_id": event.kill_id,
+            "character_id": event.character_id,
+            "monster_id": event.monster_id,
+            "seed": event.seed,
+            **summarize_drops(drops, placed),
+        }
+    return results
+
+
+class LootQueue:
+    """Kill events and results in the `loot_kills` table.
+    
+    `ready` wakes this process's worker when a kill is enqueued here; kills
+    enqueued by other processes are picked up on the worker's next poll.
+    """
+    
+    def __init__(self, results_ttl: float = LOOT_RESULTS_TTL_SECONDS):
+        self.results_ttl = results_ttl
+        self.ready = threading.Event()
+    
+    def enqueue(self, character_id: int, monster_id: int, luck: int, db: Session, seed: Optional[int] = None) -> str:
+        """Queue a kill, commit it and return its kill_id.
+        
+        The loot seed defaults to one derived from the server seed and the
+        kill_id, so every drop can be audited after the fact.
+        """
+        kill_id = uuid.uuid4().hex
+        db.execute(insert(LootKill), {
+            "kill_id": kill_id,
+            "character_id": character_id,
+            "monster_id": monster_id,
+            "luck": luck,
+            "seed": derive_seed("loot", kill_id) if seed is None else seed,
+            "status": "pending",
+            "created_at": time.time(),
+        })
+        db.commit()
+        self.ready.set()
+        return kill_id
+    
+    def take(self, limit: int, db: Session) -> List[KillEvent]:
+        """Claim up to `limit` pending kills, oldest first, in the current transaction.
+        
+        Rolling the transaction back returns them to the queue.
+        """
+        rows = db.execute(_claim_batch, {"batch_size": limit}).all()
+        return [_kill_event(row) for row in sorted(rows, key=lambda row: row.created_at)]
+    
+    def claim(self, kill_id: str, db: Session) -> Optional[KillEvent]:
+        """Claim one kill if it is still pending."""
+        row = db.execute(_claim_kill, {"claimed_kill_id": kill_id}).first()
+        return _kill_event(row) if row is not None else None
+    
+    def complete(self, results: Dict[str, Dict[str, Any]], db: Session):
+        """Store resolved kills' results in the current transaction."""
+        db.execute(_finish_kill, [
+            {"finished_kill_id": kill_id, "new_status": "ready", "new_result": json.dumps(result, ensure_ascii=False)}
+            for kill_id, result in results.items()
+        ])
+    
+    def fail(self, kill_id: str, error: str, db: Session):
+        """Record that a kill could not be resolved."""
+        db.execute(_finish_kill, [
+            {"finished_kill_id": kill_id, "new_status": "failed", "new_result": json.dumps({"error": error})}
+        ])
+    
+    def result(self, kill_id: str, db: Session) -> Optional[Dict[str, Any]]:
+        """Result of a kill: pending, ready or failed; None if unknown."""
+        row = db.execute(
+            select(LootKill.status, LootKill.result).where(LootKill.kill_id == kill_id)
+        ).first()
+        if row is None:
+            return None
+        if row.status == "ready":
+            return json.loads(row.result)
+        if row.status == "failed":
+            return {"status": "failed", "kill_id": kill_id}
+        return {"status": "pending", "kill_id": kill_id}
+    
+    def pending(self, db: Session) -> int:
+        """Number of kills waiting for the worker."""
+        return db.execute(
+            select(func.count()).select_from(LootKill).where(LootKill.status == "pending")
+        ).scalar()
+    
+    def prune(self, db: Session, now: Optional[float] = None) -> int:
+        """Delete results older than `results_ttl`. Returns the number deleted."""
+        cutoff = (now or time.time()) - self.results_ttl
+        deleted = 0
+        for status in ("ready", "failed"):
+            deleted += db.execute(
+                delete(LootKill).where(LootKill.status == status, LootKill.created_at < cutoff)
+            ).rowcount
+        db.commit()
+        return deleted
+
+
+def _kill_event(row) -> KillEvent:
+    return KillEvent(row.kill_id, row.character_id, row.monster_id, row.luck, row.seed)
+
+
+loot_queue = LootQueue()
+
+
+def drain_loot(db: Session, queue: LootQueue = loot_queue, batch_size: int = LOOT_BATCH_SIZE) -> int:
+    """Resolve every queued kill in batches. Returns the number resolved.
+    
+    A batch that fails is rolled back and its kills are resolved one at a
+    time; a kill that fails on its own is recorded as failed.
+    """
+    resolved = 0
+    while True:
+        events = queue.take(batch_size, db)
+        if not events:
+            db.rollback()
+            return resolved
+        try:
+            queue.complete(resolve_kills(events, db), db)
+            db.commit()
+            resolved += len(events)
+        except Exception:
+            db.rollback()
+            logger.exception("Loot batch of %d kills failed, resolving them one at a time", len(events))
+            for event in events:
+                resolved += _resolve_alone(event.kill_id, db, queue)
+
+
+def _resolve_alone(kill_id: str, db: Session, queue: LootQueue) -> int:
+    event = queue.claim(kill_id, db)
+    if event is None:
+        # Resolved by another worker in the meantime
+        db.rollback()
+        return 0
+    try:
+        queue.complete(resolve_kills([event], db), db)
+        db.commit()
+        return 1
+    except Exception as e:
+        db.rollback()
+        logger.exception("Loot for kill %s failed", kill_id)
+        queue.fail(kill_id, repr(e), db)
+        db.commit()
+        return 0
+
+
+class LootWorker:
+    """Background thread draining the kill queue."""
+    
+    # Seconds between deletions of old results
+    PRUNE_INTERVAL = 60.0
+    
+    def __init__(self, queue: LootQueue = loot_queue, interval_ms: int = LOOT_BATCH_MS, poll_ms: int = LOOT_POLL_MS):
+        self.queue = queue
+        self.interval = interval_ms / 1000.0
+        self.poll = poll_ms / 1000.0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start draining."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="loot-worker", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop draining and wait for the current batch."""
+        self._stop.set()
+        self.queue.ready.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        next_prune = time.monotonic()
+        while not self._stop.is_set():
+            # Kills from other processes and from before a restart are found by polling
+            self.queue.ready.wait(self.poll)
+            self.queue.ready.clear()
+            # Let kills accumulate into one batch
+            self._stop.wait(self.interval)
+            db = SessionLocal()
+            try:
+                drain_loot(db, self.queue)
+                if time.monotonic() >= next_prune:
+                    self.queue.prune(db)
+                    next_prune = time.monotonic() + self.PRUNE_INTERVAL
+            except Exception:
+                logger.exception("Loot batch failed")
+            finally:
+                db.close()
+
+
+loot_worker = LootWorker()
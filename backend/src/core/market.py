@@ -1,10 +1,24 @@
 """Market system with order matching."""
 
-from typing import Dict, Any, List, Optional
+import base64
+import heapq
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from datetime import datetime
-from backend.src.models import MarketOrder, OrderType, OrderStatus, Character, Item, InventorySlot
+from sqlalchemy import and_, func, tuple_
+from backend.src.models import MarketOrder, OrderType, OrderStatus, TimeInForce, Character, Item, InventorySlot
+from backend.src.core.order_book import (
+    BookOrder,
+    OPEN_STATUSES,
+    as_utc,
+    normalize_price,
+    get_order_book,
+    get_all_order_books,
+    locked_order_book,
+    refresh_order_book,
+)
+from backend.src.core.settlement import settle_fills, debit_gold, release_escrow
+from backend.src.core.auction import is_batch_item
 
 
 def create_order(
@@ -13,9 +27,50 @@ def create_order(
     order_type: OrderType,
     price: float,
     quantity: int,
-    db: Session
+    db: Session,
+    time_in_force: TimeInForce = TimeInForce.GTC,
+    expires_at: Optional[datetime] = None
 ) -> Dict[str, Any]:
-    """Create a market order."""
+    """Create a market order.
+    
+    The order escrows its side of the trade: sell orders take the items out
+    of the inventory, buy orders reserve gold at the limit price. Escrow,
+    the order row and any fills are written in one transaction while the
+    item's book is locked.
+    
+    GTT orders rest until `expires_at`. IOC and FOK orders never rest: what
+    does not fill at once is cancelled and its escrow returned.
+    """
+    price = normalize_price(price)
+    expires_at = as_utc(expires_at)
+    
+    if quantity <= 0:
+        return {
+            "success": False,
+            "reason": "Количество должно быть больше нуля"
+        }
+    if price <= 0:
+        return {
+            "success": False,
+            "reason": "Цена должна быть больше нуля"
+        }
+    
+    if time_in_force == TimeInForce.GTT:
+        if expires_at is None:
+            return {
+                "success": False,
+                "reason": "Для GTT-ордера нужен срок действия"
+            }
+        if expires_at <= datetime.now(timezone.utc):
+            return {
+                "success": False,
+                "reason": "Срок действия ордера уже истёк"
+            }
+    elif expires_at is not None:
+        return {
+            "success": False,
+            "reason": "Срок действия задаётся только для GTT-ордеров"
+        }
     
     # Validate item exists
     item = db.query(Item).filter(Item.id == item_id).first()
@@ -25,149 +80,221 @@ def create_order(
             "reason": "Предмет не найден"
         }
     
-    # For sell orders, check inventory
-    if order_type == OrderType.SELL:
-        inventory_qty = db.query(InventorySlot).filter(
-            and_(
+    # Check if item is tradable
+    if order_type == OrderType.SELL and not item.is_tradable:
+        return {
+            "success": False,
+            "reason": "Предмет нельзя продать (Soul-Bound)"
+        }
+    
+    with locked_order_book(item_id, db) as book:
+        if order_type == OrderType.SELL:
+            # For sell orders, check inventory
+            inventory_qty = db.query(InventorySlot).filter(
+                and_(
+                    InventorySlot.character_id == character.id,
+                    InventorySlot.item_id == item_id
+                )
+            ).with_entities(
+                func.sum(InventorySlot.quantity)
+            ).scalar() or 0
+            
+            if inventory_qty < quantity:
+                return {
+                    "success": False,
+                    "reason": f"Недостаточно предметов в инвентаре (есть: {inventory_qty}, требуется: {quantity})"
+                }
+            
+            # Escrow items
+            remaining = quantity
+            slots = db.query(InventorySlot).filter(
                 InventorySlot.character_id == character.id,
                 InventorySlot.item_id == item_id
-            )
-        ).with_entities(
-            db.func.sum(InventorySlot.quantity)
-        ).scalar() or 0
+            ).order_by(InventorySlot.slot_index).all()
+            for slot in slots:
+                if remaining <= 0:
+                    break
+                if slot.quantity <= remaining:
+                    remaining -= slot.quantity
+                    db.delete(slot)
+                else:
+                    slot.quantity -= remaining
+                    remaining = 0
+        else:
+            # Escrow gold
+            cost = price * quantity
+            if not debit_gold(character.id, cost, db):
+                gold = db.query(Character.gold).filter(Character.id == character.id).scalar() or 0
+                return {
+                    "success": False,
+                    "reason": f"Недостаточно золота (есть: {gold}, требуется: {cost})"
+                }
         
-        if inventory_qty < quantity:
-            return {
-                "success": False,
-                "reason": f"Недостаточно предметов в инвентаре (есть: {inventory_qty}, требуется: {quantity})"
-            }
+        # Create order
+        order = MarketOrder(
+            character_id=character.id,
+            item_id=item_id,
+            order_type=order_type,
+            status=OrderStatus.PENDING,
+            price=price,
+            quantity=quantity,
+            filled_quantity=0,
+            time_in_force=time_in_force,
+            expires_at=expires_at
+        )
+        db.add(order)
+        db.flush()
+        incoming = BookOrder.from_model(order)
+        immediate = time_in_force in (TimeInForce.IOC, TimeInForce.FOK)
         
-        # Check if item is tradable
-        if not item.is_tradable:
+        # Busy items are matched in the next auction tick
+        if is_batch_item(item_id) and not immediate:
+            book.queue(incoming)
+            db.commit()
             return {
-                "success": False,
-                "reason": "Предмет нельзя продать (Soul-Bound)"
+                "success": True,
+                "order_id": incoming.id,
+                "matched": False,
+                "batched": True,
+                "message": "Ордер принят. Сопоставление в ближайший тик аукциона."
             }
+        
+        # Try to match immediately
+        if time_in_force == TimeInForce.FOK and book.fillable(incoming) < incoming.remaining:
+            fills = []
+        else:
+            fills = book.match(incoming)
+        settle_fills(fills, db)
+        
+        if incoming.remaining > 0:
+            if immediate:
+                order.status = OrderStatus.CANCELLED
+                order.filled_quantity = incoming.filled_quantity
+                release_escrow([order], db)
+            else:
+                book.add(incoming)
+        db.commit()
     
-    # Create order
-    order = MarketOrder(
-        character_id=character.id,
-        item_id=item_id,
-        order_type=order_type,
-        status=OrderStatus.PENDING,
-        price=price,
-        quantity=quantity,
-        filled_quantity=0
-    )
-    db.add(order)
-    db.commit()
-    
-    # Try to match immediately
-    match_result = try_match_order(order.id, db)
-    
+    matched = bool(fills)
     return {
         "success": True,
-        "order_id": order.id,
-        "matched": match_result["matched"],
-        "message": f"Ордер создан. {'Сразу сопоставлен!' if match_result['matched'] else 'Ожидает сопоставления.'}"
+        "order_id": incoming.id,
+        "matched": matched,
+        "message": f"Ордер создан. {'Сразу сопоставлен!' if matched else 'Ожидает сопоставления.'}"
     }
 
 
 def try_match_order(order_id: int, db: Session) -> Dict[str, Any]:
-    """Try to match an order with existing orders."""
-    order = db.query(MarketOrder).filter(MarketOrder.id == order_id).first()
-    if not order or order.status != OrderStatus.PENDING:
+    """Try to match an order against the item's order book.
+    
+    Matching runs in memory against the book; only the rows touched by
+    fills are written back to the database.
+    """
+    order = db.get(MarketOrder, order_id)
+    if not order:
         return {"matched": False}
     
-    # Find matching orders (opposite type, same item, compatible price)
-    if order.order_type == OrderType.BUY:
-        # Looking for SELL orders with price <= buy order price
-        matching_orders = db.query(MarketOrder).filter(
-            and_(
-                MarketOrder.order_type == OrderType.SELL,
-                MarketOrder.item_id == order.item_id,
-                MarketOrder.status == OrderStatus.PENDING,
-                MarketOrder.price <= order.price,
-                MarketOrder.character_id != order.character_id  # Can't match with self
-            )
-        ).order_by(MarketOrder.price.asc()).all()  # Cheapest first
-    else:
-        # Looking for BUY orders with price >= sell order price
-        matching_orders = db.query(MarketOrder).filter(
-            and_(
-                MarketOrder.order_type == OrderType.BUY,
-                MarketOrder.item_id == order.item_id,
-                MarketOrder.status == OrderStatus.PENDING,
-                MarketOrder.price >= order.price,
-                MarketOrder.character_id != order.character_id
-            )
-        ).order_by(MarketOrder.price.desc()).all()  # Most expensive first
-    
-    remaining_qty = order.quantity - order.filled_quantity
-    matched = False
-    
-    for match_order in matching_orders:
-        if remaining_qty <= 0:
-            break
-        
-        match_remaining = match_order.quantity - match_order.filled_quantity
-        if match_remaining <= 0:
-            continue
-        
-        # Determine trade quantity
-        trade_qty = min(remaining_qty, match_remaining)
-        trade_price = match_order.price  # Use the matched order's price
+    with locked_order_book(order.item_id, db) as book:
+        incoming = book.get(order.id)
+        if incoming is None:
+            # Not in the book: re-read it now that the item is locked
+            db.refresh(order)
+            incoming = BookOrder.from_model(order)
+            if order.status not in OPEN_STATUSES or incoming.expired(datetime.now(timezone.utc)):
+                return {"matched": False}
+            fills = book.match(incoming)
+            if incoming.remaining > 0:
+                book.add(incoming)
+        elif order.id in book.incoming:
+            # Queued orders are matched by the next auction tick
+            return {"matched": False}
+        else:
+            # A resting order keeps its time priority within its level
+            fills = book.match_resting(incoming)
         
-        # Execute trade
-        execute_trade(order, match_order, trade_qty, trade_price, db)
-        matched = True
+        if not fills:
+            return {"matched": False}
         
-        remaining_qty -= trade_qty
-    
-    # Update order status
-    if order.filled_quantity >= order.quantity:
-        order.status = OrderStatus.FILLED
-    elif order.filled_quantity > 0:
-        order.status = OrderStatus.PARTIAL
-    
-    db.commit()
+        settle_fills(fills, db)
+        db.commit()
     
-    return {"matched": matched}
+    return {"matched": True}
 
 
-def execute_trade(
-    buy_order: MarketOrder,
-    sell_order: MarketOrder,
-    quantity: int,
-    price: float,
-    db: Session
-):
-    """Execute a trade between two orders."""
-    # This is simplified - in real implementation, we'd need to:
-    # 1. Transfer items from seller to buyer
-    # 2. Transfer gold from buyer to seller
-    # 3. Update order filled quantities
-    # 4. Handle partial fills
-    
-    # For now, just update filled quantities
-    buy_order.filled_quantity += quantity
-    sell_order.filled_quantity += quantity
-    
-    # Update statuses
-    if buy_order.filled_quantity >= buy_order.quantity:
-        buy_order.status = OrderStatus.FILLED
-    if sell_order.filled_quantity >= sell_order.quantity:
-        sell_order.status = OrderStatus.FILLED
+def encode_cursor(created_at: Optional[datetime], order_id: int) -> str:
+    """Encode a listing position as an opaque cursor."""
+    raw = f"{created_at.isoformat() if created_at else ''}|{order_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Decode a listing cursor. Raises ValueError if it is malformed."""
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return (datetime.fromisoformat(created_at) if created_at else None), int(order_id)
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
 
 
 def get_market_orders(
     item_id: Optional[int] = None,
     order_type: Optional[OrderType] = None,
     status: Optional[OrderStatus] = None,
-    db: Session = None
-) -> List[Dict[str, Any]]:
-    """Get market orders with filters."""
-    query = db.query(MarketOrder)
+    db: Session = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """Get a page of market orders with filters, newest first.
+    
+    Pages are keyed on (created_at, id): pass `next_cursor` from the previous
+    page as `cursor` to continue. Open orders (pending/partial) are served
+    from the order books; other statuses come from the database as plain
+    column tuples without building ORM objects.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    
+    if status in OPEN_STATUSES:
+        if item_id:
+            books = [get_order_book(item_id, db)]
+        else:
+            books = get_all_order_books(db)
+        
+        candidates = []
+        for book in books:
+            with book.lock:
+                if item_id:
+                    refresh_order_book(book, db)
+                for book_order in book.open_orders():
+                    if book_order.status != status:
+                        continue
+                    if order_type and book_order.order_type != order_type:
+                        continue
+                    key = (book_order.created_at or datetime.min, book_order.id)
+                    if after and key >= (after[0] or datetime.min, after[1]):
+                        continue
+                    candidates.append((key, book_order.to_dict()))
+        
+        page = heapq.nlargest(limit + 1, candidates, key=lambda candidate: candidate[0])
+        orders = [order for _, order in page[:limit]]
+        last_key = page[limit - 1][0] if len(page) > limit else None
+        return {
+            "orders": orders,
+            "next_cursor": encode_cursor(*last_key) if last_key else None,
+        }
+    
+    query = db.query(
+        MarketOrder.id,
+        MarketOrder.character_id,
+        MarketOrder.item_id,
+        MarketOrder.order_type,
+        MarketOrder.status,
+        MarketOrder.price,
+        MarketOrder.quantity,
+        MarketOrder.filled_quantity,
+        MarketOrder.time_in_force,
+        MarketOrder.expires_at,
+        MarketOrder.created_at,
+    )
     
     if item_id:
         query = query.filter(MarketOrder.item_id == item_id)
@@ -175,23 +302,47 @@ def get_market_orders(
         query = query.filter(MarketOrder.order_type == order_type)
     if status:
         query = query.filter(MarketOrder.status == status)
+    if after:
+        query = query.filter(tuple_(MarketOrder.created_at, MarketOrder.id) < after)
     
-    orders = query.order_by(MarketOrder.created_at.desc()).all()
+    rows = query.order_by(
+        MarketOrder.created_at.desc(),
+        MarketOrder.id.desc()
+    ).limit(limit + 1).all()
     
-    return [
+    orders = [
         {
-            "id": order.id,
-            "character_id": order.character_id,
-            "item_id": order.item_id,
-            "order_type": order.order_type.value,
-            "status": order.status.value,
-            "price": float(order.price),
-            "quantity": order.quantity,
-            "filled_quantity": order.filled_quantity,
-            "created_at": order.created_at.isoformat() if order.created_at else None,
+            "id": row.id,
+            "character_id": row.character_id,
+            "item_id": row.item_id,
+            "order_type": row.order_type.value,
+            "status": row.status.value,
+            "price": float(row.price),
+            "quantity": row.quantity,
+            "filled_quantity": row.filled_quantity,
+            "time_in_force": row.time_in_force.value,
+            "expires_at": as_utc(row.expires_at).isoformat() if row.expires_at else None,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
         }
-        for order in orders
+        for row in rows[:limit]
     ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    
+    return {
+        "orders": orders,
+        "next_cursor": next_cursor,
+    }
+
+
+def get_market_depth(item_id: int, levels: int, db: Session) -> Dict[str, Any]:
+    """Get aggregated order book depth for an item."""
+    book = get_order_book(item_id, db)
+    with book.lock:
+        refresh_order_book(book, db)
+        return book.depth(levels)
 
 
 def cancel_order(order_id: int, character_id: int, db: Session) -> Dict[str, Any]:
@@ -209,17 +360,24 @@ def cancel_order(order_id: int, character_id: int, db: Session) -> Dict[str, Any
             "reason": "Ордер не найден"
         }
     
-    if order.status != OrderStatus.PENDING:
-        return {
-            "success": False,
-            "reason": "Можно отменить только ожидающие ордера"
-        }
-    
-    order.status = OrderStatus.CANCELLED
-    db.commit()
+    with locked_order_book(order.item_id, db) as book:
+        # Other writers of the item are locked out, so the refreshed row is current
+        db.refresh(order)
+        if order.status not in OPEN_STATUSES:
+            return {
+                "success": False,
+                "reason": "Можно отменить только ожидающие ордера"
+            }
+        
+        order.status = OrderStatus.CANCELLED
+        
+        # Release escrow for the unfilled remainder
+        release_escrow([order], db)
+        
+        db.commit()
+        book.remove(order_id)
     
     return {
         "success": True,
         "message": "Ордер отменен"
     }
-
@@ -0,0 +1,629 @@
+"""In-memory price-time-priority order book.
+
+Each tradable item has its own book with bid and ask sides. A side keeps its
+distinct prices in a sorted list (binary search on insert/remove) and every
+price level is a FIFO queue of resting orders. The database stays the durable
+journal: books are rebuilt from open `MarketOrder` rows at startup or lazily on
+first access to an item.
+
+Writers go through `locked_order_book`, which serializes them per item: the
+book's lock covers threads of one process and the item's `market_books` row
+covers server processes. The row's version tells a process whether another
+one changed the item since its book was loaded.
+"""
+
+import bisect
+import heapq
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.orm import Session
+from backend.src.models import MarketOrder, MarketBook, OrderType, OrderStatus, TimeInForce
+
+PRICE_QUANT = Decimal("0.01")
+
+# Statuses of orders that rest in the book
+OPEN_STATUSES = (OrderStatus.PENDING, OrderStatus.PARTIAL)
+
+
+def normalize_price(price) -> Decimal:
+    """Convert a price to the Decimal representation used by the book."""
+    if not isinstance(price, Decimal):
+        price = Decimal(str(price))
+    return price.quantize(PRICE_QUANT)
+
+
+def as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """Make a timestamp timezone-aware UTC; naive values are taken as UTC."""
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def open_status_clause(status_column=MarketOrder.status):
+    """`status IN (open statuses)` rendered with literals.
+    
+    Partial indexes over open orders are only usable when the planner sees
+    the literal statuses.
+    """
+    open_statuses = bindparam("open_statuses", list(OPEN_STATUSES), expanding=True, literal_execute=True)
+    return status_column.in_(open_statuses)
+
+
+class BookOrder:
+    """Order resting in (or being matched against) the book."""
+    
+    __slots__ = (
+        "id", "character_id", "item_id", "order_type", "price",
+        "quantity", "filled_quantity", "created_at", "expires_at",
+    )
+    
+    def __init__(
+        self,
+        order_id: int,
+        character_id: int,
+        item_id: int,
+        order_type: OrderType,
+        price,
+        quantity: int,
+        filled_quantity: int = 0,
+        created_at=None,
+        expires_at=None,
+    ):
+        self.id = order_id
+        self.character_id = character_id
+        self.item_id = item_id
+        self.order_type = order_type
+        self.price = normalize_price(price)
+        self.quantity = quantity
+        self.filled_quantity = filled_quantity
+        self.created_at = created_at
+        self.expires_at = as_utc(expires_at)
+    
+    @classmethod
+    def from_model(cls, order: MarketOrder) -> "BookOrder":
+        """Build a book entry from a market order row."""
+        return cls(
+            order.id,
+            order.character_id,
+            order.item_id,
+            order.order_type,
+            order.price,
+            order.quantity,
+            order.filled_quantity,
+            order.created_at,
+            order.expires_at,
+        )
+    
+    @property
+    def remaining(self) -> int:
+        """Quantity still open."""
+        return self.quantity - self.filled_quantity
+    
+    @property
+    def status(self) -> OrderStatus:
+        """Status implied by the fill state."""
+        if self.filled_quantity >= self.quantity:
+            return OrderStatus.FILLED
+        if self.filled_quantity > 0:
+            return OrderStatus.PARTIAL
+        return OrderStatus.PENDING
+    
+    def expired(self, now: datetime) -> bool:
+        """Check if a good-till-time order is past its expiry."""
+        return self.expires_at is not None and self.expires_at <= now
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize in the same shape as market order listings."""
+        return {
+            "id": self.id,
+            "character_id": self.character_id,
+            "item_id": self.item_id,
+            "order_type": self.order_type.value,
+            "status": self.status.value,
+            "price": float(self.price),
+            "quantity": self.quantity,
+            "filled_quantity": self.filled_quantity,
+            "time_in_force": (TimeInForce.GTT if self.expires_at else TimeInForce.GTC).value,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class Fill:
+    """A single match between a buy order and a sell order."""
+    
+    __slots__ = ("buy_order", "sell_order", "price", "quantity")
+    
+    def __init__(self, buy_order: BookOrder, sell_order: BookOrder, price: Decimal, quantity: int):
+        self.buy_order = buy_order
+        self.sell_order = sell_order
+        self.price = price
+        self.quantity = quantity
+
+
+class PriceLevel:
+    """FIFO queue of orders at one price with their total remaining quantity."""
+    
+    __slots__ = ("price", "orders", "quantity")
+    
+    def __init__(self, price: Decimal):
+        self.price = price
+        self.orders: "OrderedDict[int, BookOrder]" = OrderedDict()
+        self.quantity = 0
+    
+    def __len__(self) -> int:
+        return len(self.orders)
+
+
+class BookSide:
+    """One side of the book with price levels sorted by priority."""
+    
+    def __init__(self, descending: bool):
+        self.descending = descending
+        # Sort keys are negated for bids so both sides are kept ascending
+        self._keys: List[Decimal] = []
+        self.levels: Dict[Decimal, PriceLevel] = {}
+    
+    def _key(self, price: Decimal) -> Decimal:
+        return -price if self.descending else price
+    
+    def add(self, order: BookOrder):
+        """Append order to the tail of its price level."""
+        level = self.levels.get(order.price)
+        if level is None:
+            level = PriceLevel(order.price)
+            self.levels[order.price] = level
+            bisect.insort(self._keys, self._key(order.price))
+        level.orders[order.id] = order
+        level.quantity += order.remaining
+    
+    def remove(self, order: BookOrder):
+        """Remove order from its price level."""
+        level = self.levels.get(order.price)
+        if level is None or order.id not in level.orders:
+            return
+        del level.orders[order.id]
+        level.quantity -= order.remaining
+        if not level.orders:
+            del self.levels[order.price]
+            key = self._key(order.price)
+            index = bisect.bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                del self._keys[index]
+    
+    def level_at(self, index: int) -> Optional[PriceLevel]:
+        """Price level at priority position `index` (0 is the best)."""
+        if index >= len(self._keys):
+            return None
+        key = self._keys[index]
+        return self.levels[-key if self.descending else key]
+    
+    def iter_levels(self) -> Iterator[PriceLevel]:
+        """Iterate levels from best to worst price.
+        
+        The side must not be modified while iterating.
+        """
+        for key in self._keys:
+            yield self.levels[-key if self.descending else key]
+    
+    def best_price(self) -> Optional[Decimal]:
+        """Best price on this side, if any."""
+        if not self._keys:
+            return None
+        return -self._keys[0] if self.descending else self._keys[0]
+    
+    def depth(self, levels: int) -> List[Dict[str, Any]]:
+        """Aggregated quantity for the best `levels` prices."""
+        result = []
+        for key in self._keys[:levels]:
+            level = self.levels[-key if self.descending else key]
+            result.append({
+                "price": float(level.price),
+                "quantity": level.quantity,
+                "orders": len(level.orders),
+            })
+        return result
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class OrderBook:
+    """Order book for a single item.
+    
+    Callers hold `lock` while reading or changing the book.
+    """
+    
+    def __init__(self, item_id: int):
+        self.item_id = item_id
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.orders: Dict[int, BookOrder] = {}
+        # Orders waiting for the next auction tick, in arrival order
+        self.incoming: "OrderedDict[int, BookOrder]" = OrderedDict()
+        self.lock = threading.RLock()
+        # Bumped on every change; keys the cached depth snapshot
+        self.version = 0
+        self._depth_cache = None
+        # `market_books` version the book reflects
+        self.journal_version = 0
+        # (expires_at, order id) of resting good-till-time orders
+        self._expiries: List[Tuple[datetime, int]] = []
+    
+    def _side(self, order_type: OrderType) -> BookSide:
+        return self.bids if order_type == OrderType.BUY else self.asks
+    
+    def add(self, order: BookOrder):
+        """Rest an order in the book."""
+        self.orders[order.id] = order
+        self._rest(order)
+    
+    def _rest(self, order: BookOrder):
+        self._side(order.order_type).add(order)
+        if order.expires_at is not None:
+            heapq.heappush(self._expiries, (order.expires_at, order.id))
+        self.version += 1
+    
+    def queue(self, order: BookOrder):
+        """Hold an order until the next auction tick."""
+        self.orders[order.id] = order
+        self.incoming[order.id] = order
+    
+    def remove(self, order_id: int) -> Optional[BookOrder]:
+        """Take an order out of the book."""
+        order = self.orders.pop(order_id, None)
+        if order is not None and self.incoming.pop(order_id, None) is None:
+            self._side(order.order_type).remove(order)
+            self.version += 1
+        return order
+    
+    def clear(self):
+        """Drop every order from the book."""
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.orders.clear()
+        self.incoming.clear()
+        self._expiries.clear()
+        self.version += 1
+    
+    def get(self, order_id: int) -> Optional[BookOrder]:
+        """Get a resting order."""
+        return self.orders.get(order_id)
+    
+    def evict_expired(self, now: Optional[datetime] = None) -> List[BookOrder]:
+        """Take resting orders past their expiry out of the book.
+        
+        They can no longer trade, so depth and best prices stop counting
+        them at once; the expiry sweeper closes them in the database and
+        returns their escrow.
+        """
+        now = now or datetime.now(timezone.utc)
+        evicted = []
+        while self._expiries and self._expiries[0][0] <= now:
+            _, order_id = heapq.heappop(self._expiries)
+            if order_id in self.orders and order_id not in self.incoming:
+                evicted.append(self.remove(order_id))
+        return evicted
+    
+    def _opposite(self, incoming: BookOrder):
+        """Opposite side and a price test for levels the order crosses."""
+        if incoming.order_type == OrderType.BUY:
+            return self.asks, lambda price: price <= incoming.price
+        return self.bids, lambda price: price >= incoming.price
+    
+    def crosses(self, incoming: BookOrder) -> bool:
+        """Check if an order's price reaches the best price of the opposite side."""
+        opposite, crosses = self._opposite(incoming)
+        best = opposite.best_price()
+        return best is not None and crosses(best)
+    
+    def fillable(self, incoming: BookOrder) -> int:
+        """Quantity `match` would fill right now, capped at the remainder.
+        
+        Used by fill-or-kill orders; the book is not changed.
+        """
+        self.evict_expired()
+        opposite, crosses = self._opposite(incoming)
+        available = 0
+        for level in opposite.iter_levels():
+            if available >= incoming.remaining or not crosses(level.price):
+                break
+            for resting in level.orders.values():
+                if resting.character_id != incoming.character_id:
+                    available += resting.remaining
+        return min(available, incoming.remaining)
+    
+    def match(self, incoming: BookOrder) -> List[Fill]:
+        """Match an incoming order against the opposite side.
+        
+        Walks opposite price levels best-first and each level in arrival
+        order. Trades execute at the resting order's price; orders from the
+        same character are skipped and expired ones evicted first. Fully
+        filled resting orders leave the book. The incoming order is never
+        added here.
+        """
+        self.evict_expired()
+        opposite, crosses = self._opposite(incoming)
+        
+        fills: List[Fill] = []
+        index = 0
+        while incoming.remaining > 0:
+            level = opposite.level_at(index)
+            if level is None or not crosses(level.price):
+                break
+            for resting in list(level.orders.values()):
+                if incoming.remaining <= 0:
+                    break
+                if resting.character_id == incoming.character_id:
+                    continue  # Can't match with self
+                
+                trade_qty = min(incoming.remaining, resting.remaining)
+                incoming.filled_quantity += trade_qty
+                resting.filled_quantity += trade_qty
+                level.quantity -= trade_qty
+                self.version += 1
+                
+                if incoming.order_type == OrderType.BUY:
+                    fills.append(Fill(incoming, resting, resting.price, trade_qty))
+                else:
+                    fills.append(Fill(resting, incoming, resting.price, trade_qty))
+                
+                if resting.remaining <= 0:
+                    self.remove(resting.id)
+            
+            # An emptied level is dropped, so the next level shifts into place
+            if level.orders:
+                index += 1
+        
+        return fills
+    
+    def match_resting(self, order: BookOrder) -> List[Fill]:
+        """Match an order that rests in the book without losing its place.
+        
+        The order stays at its position in its price level; it leaves the
+        book only once it is fully filled or expired.
+        """
+        self.evict_expired()
+        if order.id not in self.orders:
+            return []
+        before = order.remaining
+        fills = self.match(order)
+        level = self._side(order.order_type).levels.get(order.price)
+        if level is not None:
+            level.quantity -= before - order.remaining
+        if order.remaining <= 0:
+            self.remove(order.id)
+        return fills
+    
+    def run_auction(self) -> List[Fill]:
+        """Match all queued orders against the book.
+        
+        Queued orders are processed in arrival order and their remainders
+        rest, so the outcome is the same as matching each order on arrival.
+        """
+        fills: List[Fill] = []
+        now = datetime.now(timezone.utc)
+        while self.incoming:
+            _, incoming = self.incoming.popitem(last=False)
+            if incoming.expired(now):
+                # Left for the expiry sweeper
+                self.orders.pop(incoming.id, None)
+                continue
+            fills.extend(self.match(incoming))
+            if incoming.remaining > 0:
+                self._rest(incoming)
+            else:
+                self.orders.pop(incoming.id, None)
+        return fills
+    
+    def depth(self, levels: int) -> Dict[str, Any]:
+        """Top-of-book and aggregated depth snapshot.
+        
+        Level totals are maintained incrementally, so building a snapshot
+        costs O(levels); snapshots are reused until the book changes.
+        Expired orders are evicted first.
+        """
+        self.evict_expired()
+        cached = self._depth_cache
+        if cached and cached[0] == self.version and cached[1] == levels:
+            return cached[2]
+        
+        best_bid = self.bids.best_price()
+        best_ask = self.asks.best_price()
+        snapshot = {
+            "item_id": self.item_id,
+            "best_bid": float(best_bid) if best_bid is not None else None,
+            "best_ask": float(best_ask) if best_ask is not None else None,
+            "spread": float(best_ask - best_bid) if best_bid is not None and best_ask is not None else None,
+            "bids": self.bids.depth(levels),
+            "asks": self.asks.depth(levels),
+            "version": self.version,
+        }
+        self._depth_cache = (self.version, levels, snapshot)
+        return snapshot
+    
+    def open_orders(self) -> List[BookOrder]:
+        """All resting orders."""
+        return list(self.orders.values())
+
+
+# Books per item
+_order_books: Dict[int, OrderBook] = {}
+_all_loaded = False
+_registry_lock = threading.Lock()
+
+
+def _open_orders_query(db: Session, item_id: Optional[int] = None):
+    """Query for open orders in book priority order.
+    
+    Rows are (order, journal version); reading both in one statement keeps
+    them consistent.
+    """
+    query = db.query(MarketOrder, MarketBook.version).outerjoin(
+        MarketBook, MarketBook.item_id == MarketOrder.item_id
+    ).filter(open_status_clause())
+    if item_id is not None:
+        query = query.filter(MarketOrder.item_id == item_id)
+    return query.order_by(MarketOrder.item_id, MarketOrder.price, MarketOrder.id)
+
+
+def _fill_book(book: OrderBook, rows, queued=()):
+    """Load a book from (order, journal version) rows of its open orders.
+    
+    Orders are replayed in arrival order. An order that would trade on
+    arrival, skipping its own character's orders like `match` does, never
+    rested: like one in `queued`, it was waiting for an auction tick. On a
+    batch item every later order arrived in the same window and goes back to
+    the auction queue too, so the tick clears them in arrival order. On a
+    continuous item only such orders are queued; the rest, including a
+    character's own crossing bid and ask, rest as before.
+    """
+    # The auction module builds on the books, so it is imported late
+    from backend.src.core.auction import is_batch_item
+    
+    batch = is_batch_item(book.item_id)
+    queued = set(queued)
+    waiting = False
+    now = datetime.now(timezone.utc)
+    for order, journal_version in sorted(rows, key=lambda row: row[0].id):
+        book.journal_version = journal_version or 0
+        entry = BookOrder.from_model(order)
+        if entry.expired(now):
+            continue  # Closed by the expiry sweeper
+        waits = entry.id in queued or book.fillable(entry) > 0
+        waiting = batch and (waiting or waits)
+        if waits or waiting:
+            book.queue(entry)
+        else:
+            book.add(entry)
+
+
+def _reload_order_book(book: OrderBook, db: Session, journal_version: int):
+    """Rebuild a book in place after another process changed the item."""
+    queued = list(book.incoming)
+    book.clear()
+    _fill_book(book, _open_orders_query(db, book.item_id).all(), queued)
+    book.journal_version = journal_version
+
+
+def load_order_books(db: Session):
+    """Load every order book from the database journal.
+    
+    Books already in memory are kept as they are current; the rest are
+    rebuilt from open order rows.
+    """
+    global _all_loaded
+    with _registry_lock:
+        rows = defaultdict(list)
+        for order, journal_version in _open_orders_query(db).all():
+            if order.item_id not in _order_books:
+                rows[order.item_id].append((order, journal_version))
+        for item_id, item_rows in rows.items():
+            book = _order_books[item_id] = OrderBook(item_id)
+            _fill_book(book, item_rows)
+        _all_loaded = True
+
+
+def get_order_book(item_id: int, db: Session) -> OrderBook:
+    """Get order book for item, loading it from the database on first use."""
+    book = _order_books.get(item_id)
+    if book is None:
+        with _registry_lock:
+            book = _order_books.get(item_id)
+            if book is None:
+                book = OrderBook(item_id)
+                if not _all_loaded:
+                    _fill_book(book, _open_orders_query(db, item_id).all())
+                _order_books[item_id] = book
+    return book
+
+
+# Same syntax on SQLite and PostgreSQL; a text statement keeps its compiled
+# form cached, which dialect ON CONFLICT constructs do not
+_claim_journal = text(
+    "INSERT INTO market_books (item_id, version) VALUES (:item_id, 1) "
+    "ON CONFLICT (item_id) DO UPDATE SET version = market_books.version + 1 "
+    "RETURNING version"
+)
+
+
+def _claim_item(item_id: int, db: Session) -> int:
+    """Bump the item's journal version and hold its row lock until commit."""
+    return db.execute(_claim_journal, {"item_id": item_id}).scalar()
+
+
+@contextmanager
+def locked_order_book(item_id: int, db: Session) -> Iterator[OrderBook]:
+    """Hold an item's book for a write transaction.
+    
+    Serializes writers per item across threads and processes and reloads the
+    book first if another process changed the item. Database changes made in
+    the block count only if the block commits them; otherwise they are rolled
+    back. On an error the book is discarded, as it may no longer match the
+    database.
+    """
+    book = get_order_book(item_id, db)
+    with book.lock:
+        committed = []
+        on_commit = lambda session: committed.append(True)
+        event.listen(db, "after_commit", on_commit)
+        try:
+            version = _claim_item(item_id, db)
+            if version != book.journal_version + 1:
+                _reload_order_book(book, db, version - 1)
+            yield book
+        except Exception:
+            db.rollback()
+            discard_order_book(item_id)
+            raise
+        finally:
+            event.remove(db, "after_commit", on_commit)
+        
+        if committed:
+            book.journal_version = version
+        else:
+            db.rollback()
+
+
+def refresh_order_book(book: OrderBook, db: Session):
+    """Reload a book for reading if another process changed the item.
+    
+    Callers hold `book.lock`.
+    """
+    version = db.query(MarketBook.version).filter(MarketBook.item_id == book.item_id).scalar() or 0
+    if version != book.journal_version:
+        _reload_order_book(book, db, version)
+
+
+def discard_order_book(item_id: int):
+    """Forget an item's book so it is reloaded from the database.
+    
+    Used when a database write fails after the book was already changed.
+    """
+    global _all_loaded
+    with _registry_lock:
+        if _order_books.pop(item_id, None) is not None:
+            _all_loaded = False
+
+
+def get_all_order_books(db: Session) -> List[OrderBook]:
+    """Get every order book, loading all of them if needed."""
+    if not _all_loaded:
+        load_order_books(db)
+    with _registry_lock:
+        return list(_order_books.values())
+
+
+def reset_order_books():
+    """Drop all in-memory books (they reload from the database on demand)."""
+    global _all_loaded
+    with _registry_lock:
+        _order_books.clear()
+        _all_loaded = False
@@ -0,0 +1,111 @@
+"""Bad-luck protection for rare drops.
+
+Core entries with a chance of at most PITY_MAX_CHANCE are pity-protected:
+every dry kill of a character raises their chance once the streak passes
+the expected number of kills. Counters of kills since the last drop are
+kept per (character, drop table entry) in the `drop_pity` table.
+
+A loot batch reads its characters' counters with one query (`load_pity`),
+rolls against them in memory and writes back what changed with one bulk
+upsert in its own transaction (`flush_pity`). The upsert adds the batch's
+dry kills to the stored counter, or restarts it when the entry dropped,
+so workers in several server processes resolving kills of the same
+character never overwrite each other's counts.
+"""
+
+from typing import Dict, Iterable, Iterator, Tuple
+from sqlalchemy import Boolean, bindparam, select, text
+from sqlalchemy.orm import Session
+from backend.src.models import DropPity
+
+PITY_MAX_CHANCE = 0.01  # Only rarer Core entries are protected
+PITY_START = 1.0  # Streak, in expected kills (1 / chance), after which pity kicks in
+PITY_RAMP = 1.0  # Added chance multiplier per expected kills past the start
+
+
+def pity_chance(chance: float, kills: int) -> float:
+    """Drop chance after `kills` dry kills.
+    
+    Formula: chance * (1 + RAMP * max(0, kills * chance - START))
+    """
+    overdue = kills * chance - PITY_START
+    if chance <= 0 or overdue <= 0:
+        return chance
+    return min(1.0, chance * (1 + PITY_RAMP * overdue))
+
+
+class PityStreaks(dict):
+    """A character's dry kills per drop table entry, as rolled in one batch.
+    
+    Rolls update the dict in place, setting an entry to 0 when it drops.
+    The values read from the database are kept, so `changes` can tell the
+    batch's own kills apart from the stored ones.
+    """
+    
+    __slots__ = ("stored", "dropped")
+    
+    def __init__(self, stored: Dict[int, int]):
+        super().__init__(stored)
+        self.stored = dict(stored)
+        self.dropped = set()
+    
+    def __setitem__(self, entry_id: int, kills: int):
+        if kills == 0:
+            self.dropped.add(entry_id)
+        super().__setitem__(entry_id, kills)
+    
+    def changes(self) -> Iterator[Tuple[int, int, bool]]:
+        """(entry id, kills, reset) for every changed entry.
+        
+        With `reset` the entry dropped and `kills` is the streak since;
+        otherwise `kills` is the number of dry kills to add.
+        """
+        for entry_id, kills in self.items():
+            if entry_id in self.dropped:
+                yield entry_id, kills, True
+            elif kills != self.stored.get(entry_id, 0):
+                yield entry_id, kills - self.stored.get(entry_id, 0), False
+
+
+# Plain text keeps the statement's compiled form cached; the syntax is shared
+# by SQLite and PostgreSQL
+_upsert_counters = text(
+    "INSERT INTO drop_pity (character_id, drop_table_item_id, kills_since_drop) "
+    "VALUES (:character_id, :drop_table_item_id, :kills) "
+    "ON CONFLICT (character_id, drop_table_item_id) DO UPDATE SET kills_since_drop = "
+    "CASE WHEN :reset THEN excluded.kills_since_drop "
+    "ELSE drop_pity.kills_since_drop + excluded.kills_since_drop END"
+).bindparams(
+    bindparam("character_id", type_=DropPity.__table__.c.character_id.type),
+    bindparam("drop_table_item_id", type_=DropPity.__table__.c.drop_table_item_id.type),
+    bindparam("kills", type_=DropPity.__table__.c.kills_since_drop.type),
+    bindparam("reset", type_=Boolean()),
+)
+
+
+def load_pity(character_ids: Iterable[int], db: Session) -> Dict[int, PityStreaks]:
+    """Current counters of characters, read with one query."""
+    stored: Dict[int, Dict[int, int]] = {character_id: {} for character_id in character_ids}
+    if not stored:
+        return {}
+    for character_id, entry_id, kills in db.execute(
+        select(DropPity.character_id, DropPity.drop_table_item_id, DropPity.kills_since_drop)
+        .where(DropPity.character_id.in_(stored))
+    ):
+        stored[character_id][entry_id] = kills
+    return {character_id: PityStreaks(counters) for character_id, counters in stored.items()}
+
+
+def flush_pity(counters: Dict[int, PityStreaks], db: Session) -> int:
+    """Write changed counters in one bulk upsert, in the caller's transaction.
+    
+    Returns the number of rows written.
+    """
+    rows = [
+        {"character_id": character_id, "drop_table_item_id": entry_id, "kills": kills, "reset": reset}
+        for character_id, streaks in counters.items()
+        for entry_id, kills, reset in streaks.changes()
+    ]
+    if rows:
+        db.execute(_upsert_counters, rows)
+    return len(rows)
@@ -0,0 +1,162 @@
+"""Trade settlement for market fills.
+
+Orders escrow their side of the trade when they are placed: sell orders hold
+the seller's items and buy orders hold the buyer's gold at the limit price.
+Settling a batch of fills therefore only credits both sides: sellers receive
+gold, buyers receive items plus a refund of any price improvement. A whole
+batch is written with a handful of bulk statements in the caller's
+transaction; nothing here commits or flushes per fill.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Any, Iterable, List, Tuple
+from sqlalchemy import bindparam, insert, update, select
+from sqlalchemy.orm import Session
+from backend.src.models import MarketOrder, OrderType, Trade, Character, Item
+from backend.src.core.order_book import Fill
+from backend.src.core.candles import record_trades
+from backend.src.core.inventory import plan_placement, apply_placement, hold_deliveries
+
+_characters = Character.__table__
+
+_credit_gold = (
+    update(_characters)
+    .where(_characters.c.id == bindparam("character_id"))
+    .values(gold=_characters.c.gold + bindparam("amount"))
+)
+
+_debit_gold = (
+    update(_characters)
+    .where(_characters.c.id == bindparam("character_id"), _characters.c.gold >= bindparam("amount"))
+    .values(gold=_characters.c.gold - bindparam("amount"))
+)
+
+
+def credit_gold(credits: Dict[int, Decimal], db: Session):
+    """Add gold to characters in one batched UPDATE.
+    
+    Zero credits are skipped; a negative one is a bug upstream and raises
+    ValueError rather than taking gold past the balance check.
+    """
+    if any(amount < 0 for amount in credits.values()):
+        raise ValueError("Gold credits must not be negative")
+    rows = [
+        {"character_id": character_id, "amount": amount}
+        for character_id, amount in credits.items()
+        if amount
+    ]
+    if rows:
+        db.execute(_credit_gold, rows)
+
+
+def debit_gold(character_id: int, amount: Decimal, db: Session) -> bool:
+    """Take gold from a character if they have enough.
+    
+    Computed in the database, so concurrent credits from other items'
+    settlements are never overwritten. Non-positive amounts are refused: a
+    negative one would pass the balance check and add gold.
+    """
+    if amount <= 0:
+        return False
+    result = db.execute(_debit_gold, {"character_id": character_id, "amount": amount})
+    return result.rowcount == 1
+
+
+def deliver_items(deliveries: Dict[Tuple[int, int], int], db: Session):
+    """Put items into character inventories.
+    
+    `deliveries` maps (character_id, item_id) to quantity. Market items are
+    never dropped: what does not fit the grid is held as a pending delivery
+    until the player collects it.
+    """
+    deliveries = {key: qty for key, qty in deliveries.items() if qty > 0}
+    if not deliveries:
+        return
+    
+    stack_sizes = dict(db.execute(
+        select(Item.id, Item.stack_size).where(Item.id.in_({item_id for _, item_id in deliveries}))
+    ).all())
+    plan = plan_placement(
+        [
+            (character_id, item_id, quantity, stack_sizes.get(item_id) or 1)
+            for (character_id, item_id), quantity in deliveries.items()
+        ],
+        db
+    )
+    apply_placement(plan, db)
+    hold_deliveries(
+        [
+            (character_id, item_id, left)
+            for (character_id, item_id), left in zip(deliveries, plan.unplaced)
+        ],
+        db
+    )
+
+
+def release_escrow(orders: Iterable[Any], db: Session):
+    """Return the escrow of closed orders' unfilled remainders.
+    
+    `orders` are market orders or rows with the same columns. Buy orders get
+    their gold back at the limit price, sell orders their items.
+    """
+    gold = defaultdict(Decimal)
+    items = defaultdict(int)
+    for order in orders:
+        remaining = order.quantity - order.filled_quantity
+        if order.order_type == OrderType.BUY:
+            gold[order.character_id] += Decimal(order.price) * remaining
+        else:
+            items[(order.character_id, order.item_id)] += remaining
+    credit_gold(gold, db)
+    deliver_items(items, db)
+
+
+def settle_fills(fills: List[Fill], db: Session) -> List[Dict[str, Any]]:
+    """Settle a batch of fills in the current transaction.
+    
+    Writes final order fill states, trade records, gold credits, item
+    deliveries and candle updates as bulk statements. Returns the trade records.
+    """
+    if not fills:
+        return []
+    
+    executed_at = datetime.now(timezone.utc)
+    orders = {}
+    trades = []
+    gold = defaultdict(Decimal)
+    items = defaultdict(int)
+    
+    for fill in fills:
+        buy_order = fill.buy_order
+        sell_order = fill.sell_order
+        orders[buy_order.id] = buy_order
+        orders[sell_order.id] = sell_order
+        
+        trades.append({
+            "item_id": sell_order.item_id,
+            "buy_order_id": buy_order.id,
+            "sell_order_id": sell_order.id,
+            "buyer_id": buy_order.character_id,
+            "seller_id": sell_order.character_id,
+            "price": fill.price,
+            "quantity": fill.quantity,
+            "executed_at": executed_at,
+        })
+        
+        gold[sell_order.character_id] += fill.price * fill.quantity
+        # Buyer escrowed at the limit price; refund the price improvement
+        gold[buy_order.character_id] += (buy_order.price - fill.price) * fill.quantity
+        items[(buy_order.character_id, buy_order.item_id)] += fill.quantity
+    
+    db.execute(update(MarketOrder), [
+        {"id": order.id, "filled_quantity": order.filled_quantity, "status": order.status}
+        for order in orders.values()
+    ])
+    db.execute(insert(Trade), trades)
+    credit_gold(gold, db)
+    deliver_items(items, db)
+    record_trades(trades, db)
+    
+    return trades
@@ -3,9 +3,9 @@
 from backend.src.database.base import Base, engine, SessionLocal
 # Import all models to register them
 from backend.src.models import (
-    Player, Character, Item, InventorySlot, EquipmentSlot,
-    MarketOrder, Location, Monster, Skill, CharacterSkill,
-    DropTable, DropTableItem, ItemRarity, ItemType, CharacterClass, SkillType
+    Player, Character, Item, InventorySlot, EquipmentSlot, PendingDelivery,
+    MarketOrder, MarketBook, Trade, PriceCandle, Location, Monster, Skill, CharacterSkill,
+    DropTable, DropTableItem, DropPity, CombatSession, LootKill, ItemRarity, ItemType, CharacterClass, SkillType
 )
 import json
 from pathlib import Path
@@ -67,6 +67,7 @@ def create_test_data():
             endurance=10,
             wisdom=10,
             luck=10,
+            gold=1000,
             character_class=CharacterClass.ADVENTURER,
             location_id=test_location.id
         )
@@ -3,12 +3,17 @@
 from backend.src.models.player import Player
 from backend.src.models.character import Character, CharacterClass
 from backend.src.models.item import Item, ItemRarity, ItemType
-from backend.src.models.inventory import InventorySlot, EquipmentSlot
-from backend.src.models.market_order import MarketOrder, OrderType, OrderStatus
+from backend.src.models.inventory import InventorySlot, EquipmentSlot, PendingDelivery
+from backend.src.models.market_order import MarketOrder, OrderType, OrderStatus, TimeInForce
+from backend.src.models.market_book import MarketBook
+from backend.src.models.trade import Trade
+from backend.src.models.price_candle import PriceCandle, CandleResolution
 from backend.src.models.location import Location
 from backend.src.models.monster import Monster
 from backend.src.models.skill import Skill, CharacterSkill, SkillType
-from backend.src.models.drop_table import DropTable, DropTableItem
+from backend.src.models.drop_table import DropTable, DropTableItem, DropPity
+from backend.src.models.combat_session import CombatSession
+from backend.src.models.loot_kill import LootKill
 
 __all__ = [
     "Player",
@@ -19,9 +24,15 @@ __all__ = [
     "ItemType",
     "InventorySlot",
     "EquipmentSlot",
+    "PendingDelivery",
     "MarketOrder",
     "OrderType",
     "OrderStatus",
+    "TimeInForce",
+    "MarketBook",
+    "Trade",
+    "PriceCandle",
+    "CandleResolution",
     "Location",
     "Monster",
     "Skill",
@@ -29,4 +40,7 @@ __all__ = [
     "SkillType",
     "DropTable",
     "DropTableItem",
+    "DropPity",
+    "CombatSession",
+    "LootKill",
 ]
@@ -1,6 +1,6 @@
 """Character model."""
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum as SQLEnum
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, Enum as SQLEnum, Numeric
 from sqlalchemy.orm import relationship
 from backend.src.database.base import Base
 import enum
@@ -33,6 +33,19 @@ class Character(Base):
     wisdom = Column(Integer, default=10, nullable=False)
     luck = Column(Integer, default=10, nullable=False)
     
+    # Currency
+    gold = Column(Numeric(12, 2), default=0, nullable=False)
+    
+    # Occupied inventory grid slots: bit i is set while slot i holds an item.
+    # NULL for characters from before the column; rebuilt from their slots on first placement
+    inventory_mask = Column(BigInteger, default=0, nullable=True)
+    
+    # Bumped whenever derived stats change (equipment, level); keys the stats cache
+    stats_version = Column(Integer, default=0, nullable=False)
+    
+    # Bumped whenever the character's random stream is recreated; part of the stream's seed key
+    rng_epoch = Column(Integer, default=0, nullable=False)
+    
     # Class
     character_class = Column(SQLEnum(CharacterClass), nullable=False, default=CharacterClass.ADVENTURER)
     
@@ -0,0 +1,15 @@
+"""Combat session model."""
+
+from sqlalchemy import Column, Integer, String, Text, Float
+from backend.src.database.base import Base
+
+
+class CombatSession(Base):
+    """Serialized state of a fight in progress, for the SQL combat store."""
+    
+    __tablename__ = "combat_sessions"
+    
+    key = Column(String(64), primary_key=True)
+    state = Column(Text, nullable=False)  # JSON snapshot of EnhancedCombatState
+    version = Column(Integer, default=0, nullable=False)  # Snapshot's version; saves compare-and-swap on it
+    expires_at = Column(Float, nullable=False, index=True)  # Unix time
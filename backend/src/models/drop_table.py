@@ -1,6 +1,6 @@
 """Drop table models."""
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Numeric
+from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, Boolean
 from sqlalchemy.orm import relationship
 from backend.src.database.base import Base
 
@@ -14,6 +14,9 @@ class DropTable(Base):
     monster_id = Column(Integer, ForeignKey("monsters.id"), nullable=False, unique=True)
     name = Column(String, nullable=False)
     
+    # Exclusive tables drop at most one entry per kill; chances are shares of one roll
+    is_exclusive = Column(Boolean, default=False, nullable=False)
+    
     # Relationships
     monster = relationship("Monster", back_populates="drop_table")
     items = relationship("DropTableItem", back_populates="drop_table", cascade="all, delete-orphan")
@@ -39,3 +42,13 @@ class DropTableItem(Base):
     drop_table = relationship("DropTable", back_populates="items")
     item = relationship("Item", back_populates="drop_table_items")
 
+
+
+class DropPity(Base):
+    """Kills of a character since a pity-protected entry last dropped."""
+    
+    __tablename__ = "drop_pity"
+    
+    character_id = Column(Integer, ForeignKey("characters.id"), primary_key=True)
+    drop_table_item_id = Column(Integer, ForeignKey("drop_table_items.id"), primary_key=True)
+    kills_since_drop = Column(Integer, default=0, nullable=False)
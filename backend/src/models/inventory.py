@@ -1,6 +1,7 @@
 """Inventory models."""
 
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from backend.src.database.base import Base
 
@@ -16,6 +17,11 @@ class InventorySlot(Base):
     quantity = Column(Integer, default=1, nullable=False)
     slot_index = Column(Integer, nullable=False)  # Position in inventory grid
     
+    __table_args__ = (
+        Index("ix_inventory_slots_character_item", "character_id", "item_id", "slot_index"),
+        UniqueConstraint("character_id", "slot_index", name="uq_inventory_slots_character_slot"),
+    )
+    
     # Relationships
     character = relationship("Character", back_populates="inventory_slots")
     item = relationship("Item", back_populates="inventory_slots")
@@ -42,3 +48,21 @@ class EquipmentSlot(Base):
     # Relationships
     character = relationship("Character", back_populates="equipment")
 
+
+class PendingDelivery(Base):
+    """Items delivered to a character whose inventory grid had no room.
+    
+    Market fills and returned escrow are never dropped; they wait here until
+    the player collects them.
+    """
+    
+    __tablename__ = "pending_deliveries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    character_id = Column(Integer, ForeignKey("characters.id"), nullable=False, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    item = relationship("Item")
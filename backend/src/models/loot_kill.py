@@ -0,0 +1,23 @@
+"""Loot kill model."""
+
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Float, ForeignKey, Index
+from backend.src.database.base import Base
+
+
+class LootKill(Base):
+    """A monster kill waiting for loot resolution, and its result once resolved."""
+    
+    __tablename__ = "loot_kills"
+    
+    kill_id = Column(String(32), primary_key=True)
+    character_id = Column(Integer, ForeignKey("characters.id"), nullable=False)
+    monster_id = Column(Integer, ForeignKey("monsters.id"), nullable=False)
+    luck = Column(Integer, default=0, nullable=False)
+    seed = Column(BigInteger, nullable=False)
+    status = Column(String(16), default="pending", nullable=False)  # pending, resolving, ready, failed
+    result = Column(Text, nullable=True)  # JSON loot summary, or the error of a failed kill
+    created_at = Column(Float, nullable=False)  # Unix time
+    
+    __table_args__ = (
+        Index("ix_loot_kills_status_created", "status", "created_at"),
+    )
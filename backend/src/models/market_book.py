@@ -0,0 +1,18 @@
+"""Market book journal version model."""
+
+from sqlalchemy import Column, Integer, ForeignKey
+from backend.src.database.base import Base
+
+
+class MarketBook(Base):
+    """Journal version of an item's order book.
+    
+    Every transaction that changes an item's open orders bumps the version.
+    The bump also takes the row lock, so writers for one item are serialized
+    across server processes while different items proceed independently.
+    """
+    
+    __tablename__ = "market_books"
+    
+    item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
@@ -1,9 +1,10 @@
 """Market order model."""
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum as SQLEnum, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum as SQLEnum, DateTime, Numeric, Index, and_
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from backend.src.database.base import Base
+from datetime import datetime, timezone
 import enum
 
 
@@ -19,6 +20,15 @@ class OrderStatus(str, enum.Enum):
     FILLED = "filled"
     CANCELLED = "cancelled"
     PARTIAL = "partial"
+    EXPIRED = "expired"
+
+
+class TimeInForce(str, enum.Enum):
+    """How long an order stays in the book."""
+    GTC = "gtc"  # Good till cancelled
+    GTT = "gtt"  # Good till `expires_at`
+    IOC = "ioc"  # Immediate or cancel: fill what crosses, drop the rest
+    FOK = "fok"  # Fill or kill: fill completely at once or not at all
 
 
 class MarketOrder(Base):
@@ -37,9 +47,38 @@ class MarketOrder(Base):
     quantity = Column(Integer, nullable=False)
     filled_quantity = Column(Integer, default=0, nullable=False)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    time_in_force = Column(SQLEnum(TimeInForce), nullable=False, default=TimeInForce.GTC)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Python-side default keeps sub-second precision and one stored format for keyset paging
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    __table_args__ = (
+        # Per-side book scans: item, side, status, then price-time priority
+        Index("ix_market_orders_book", "item_id", "order_type", "status", "price", "id"),
+        # Open orders only, in book priority order (used for book rebuilds)
+        Index(
+            "ix_market_orders_open", "item_id", "price", "id",
+            sqlite_where=status.in_((OrderStatus.PENDING, OrderStatus.PARTIAL)),
+            postgresql_where=status.in_((OrderStatus.PENDING, OrderStatus.PARTIAL)),
+        ),
+        # Open good-till-time orders by expiry (used by the expiry sweeper)
+        Index(
+            "ix_market_orders_expiry", "expires_at",
+            sqlite_where=and_(
+                status.in_((OrderStatus.PENDING, OrderStatus.PARTIAL)), expires_at.isnot(None)
+            ),
+            postgresql_where=and_(
+                status.in_((OrderStatus.PENDING, OrderStatus.PARTIAL)), expires_at.isnot(None)
+            ),
+        ),
+        # Keyset-paginated listings newest first, overall and per item/status
+        Index("ix_market_orders_created", "created_at", "id"),
+        Index("ix_market_orders_item_created", "item_id", "created_at", "id"),
+        Index("ix_market_orders_status_created", "status", "created_at", "id"),
+    )
+    
     # Relationships
     character = relationship("Character")
     item = relationship("Item")
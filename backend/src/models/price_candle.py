@@ -0,0 +1,33 @@
+"""Price candle model."""
+
+from sqlalchemy import Column, Integer, ForeignKey, Enum as SQLEnum, DateTime, Numeric, UniqueConstraint
+from backend.src.database.base import Base
+import enum
+
+
+class CandleResolution(str, enum.Enum):
+    """Candle resolution enum."""
+    MINUTE = "1m"
+    HOUR = "1h"
+    DAY = "1d"
+
+
+class PriceCandle(Base):
+    """OHLCV candle of executed trades for one item and time bucket."""
+    
+    __tablename__ = "price_candles"
+    __table_args__ = (
+        UniqueConstraint("item_id", "resolution", "bucket_start", name="uq_price_candles_bucket"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    resolution = Column(SQLEnum(CandleResolution), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    
+    open = Column(Numeric(10, 2), nullable=False)
+    high = Column(Numeric(10, 2), nullable=False)
+    low = Column(Numeric(10, 2), nullable=False)
+    close = Column(Numeric(10, 2), nullable=False)
+    volume = Column(Integer, default=0, nullable=False)
+    trade_count = Column(Integer, default=0, nullable=False)
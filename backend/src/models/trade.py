@@ -0,0 +1,30 @@
+"""Trade model."""
+
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Numeric, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from backend.src.database.base import Base
+
+
+class Trade(Base):
+    """Executed trade between a buy order and a sell order."""
+    
+    __tablename__ = "trades"
+    __table_args__ = (
+        Index("ix_trades_item_executed", "item_id", "executed_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    buy_order_id = Column(Integer, ForeignKey("market_orders.id"), nullable=False)
+    sell_order_id = Column(Integer, ForeignKey("market_orders.id"), nullable=False)
+    buyer_id = Column(Integer, ForeignKey("characters.id"), nullable=False)
+    seller_id = Column(Integer, ForeignKey("characters.id"), nullable=False)
+    
+    price = Column(Numeric(10, 2), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    
+    executed_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    item = relationship("Item")
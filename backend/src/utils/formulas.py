@@ -2,6 +2,9 @@
 
 from typing import Dict, Any
 
+CRIT_MULTIPLIER = 1.8  # Damage of a critical hit relative to a normal one
+MIN_DAMAGE = 1  # Every hit deals at least this much, whatever the defense
+
 
 def calculate_max_hp(level: int, strength: int, endurance: int) -> int:
     """Calculate maximum HP.
@@ -73,9 +76,9 @@ def calculate_crit_chance(agility: int, luck: int, bonuses: int = 0) -> float:
 def calculate_crit_damage(base_damage: int) -> int:
     """Calculate critical hit damage.
     
-    Formula: обычный урон * 1.8
+    Formula: обычный урон * CRIT_MULTIPLIER
     """
-    return int(base_damage * 1.8)
+    return int(base_damage * CRIT_MULTIPLIER)
 
 
 def calculate_speed(agility: int, bonuses: int = 0) -> int:
@@ -90,16 +93,16 @@ def calculate_speed(agility: int, bonuses: int = 0) -> int:
 def apply_physical_damage(damage: int, defense: int) -> int:
     """Apply physical damage with defense.
     
-    Physical defense works as direct subtraction.
+    Physical defense works as direct subtraction, down to MIN_DAMAGE.
     """
-    return max(1, damage - defense)
+    return max(MIN_DAMAGE, damage - defense)
 
 
 def apply_magical_damage(damage: int, defense_percentage: float) -> int:
     """Apply magical damage with defense.
     
-    Magical defense works as percentage reduction.
+    Magical defense works as percentage reduction, down to MIN_DAMAGE.
     """
     reduction = damage * (defense_percentage / 100.0)
-    return max(1, int(damage - reduction))
+    return max(MIN_DAMAGE, int(damage - reduction))
 
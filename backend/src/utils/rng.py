@@ -0,0 +1,78 @@
+"""Seeded random streams.
+
+Game code never draws from the global `random` generator. Combats, kills
+and characters each get their own `random.Random`, seeded from the server
+seed and a key such as ("combat", character_id, monster_id, started_ns).
+Any outcome can be replayed from the server seed and its key, and threads
+never contend for one shared generator.
+
+Set `RNG_SERVER_SEED` to pin the server seed; otherwise a fresh one is drawn
+at startup and logged, so the session can still be replayed.
+"""
+
+import hashlib
+import logging
+import os
+import random
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+CHARACTER_STREAMS_KEPT = 10000
+
+_server_seed = int(os.getenv("RNG_SERVER_SEED") or 0)
+if not _server_seed:
+    _server_seed = secrets.randbits(64)
+    logger.warning("RNG_SERVER_SEED is not set, using server seed %d", _server_seed)
+_character_streams: "OrderedDict[int, random.Random]" = OrderedDict()
+_streams_lock = threading.Lock()
+
+
+def server_seed() -> int:
+    """Seed every stream is derived from."""
+    return _server_seed
+
+
+def set_server_seed(seed: int):
+    """Replace the server seed, e.g. to replay a recorded session."""
+    global _server_seed
+    with _streams_lock:
+        _server_seed = seed
+        _character_streams.clear()
+
+
+def derive_seed(*key) -> int:
+    """63-bit seed for a key, derived from the server seed."""
+    digest = hashlib.blake2b(repr((_server_seed,) + key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+def stream(*key) -> random.Random:
+    """Fresh generator for a key; the same key always yields the same draws."""
+    return random.Random(derive_seed(*key))
+
+
+def character_stream(character_id: int, open_epoch: Callable[[], int]) -> random.Random:
+    """Long-lived generator of a character for rolls outside a combat.
+    
+    Streams are cached per process, so one is created again after eviction
+    or a restart. `open_epoch` is called each time and must return a number
+    never used before for the character; it is part of the stream's key, so
+    a recreated stream never repeats earlier rolls.
+    """
+    with _streams_lock:
+        rng = _character_streams.get(character_id)
+        if rng is not None:
+            _character_streams.move_to_end(character_id)
+            return rng
+    
+    # Outside the lock: opening an epoch may hit the database
+    rng = random.Random(derive_seed("character", character_id, open_epoch()))
+    with _streams_lock:
+        rng = _character_streams.setdefault(character_id, rng)
+        while len(_character_streams) > CHARACTER_STREAMS_KEPT:
+            _character_streams.popitem(last=False)
+        return rng
@@ -0,0 +1,71 @@
+"""Shared test fixtures."""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.src.database.base import Base
+from backend.src.models import Player, Character, Item, ItemType, Location, Monster
+from backend.src.core.order_book import reset_order_books
+from backend.src.core.combat import clear_stats_cache
+
+
+@pytest.fixture
+def db():
+    """In-memory database session with all tables created."""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    reset_order_books()
+    clear_stats_cache()
+    try:
+        yield session
+    finally:
+        session.close()
+        reset_order_books()
+        engine.dispose()
+
+
+@pytest.fixture
+def player(db):
+    """Test player account."""
+    player = Player(username="tester", email="tester@example.com", password_hash="x")
+    db.add(player)
+    db.commit()
+    return player
+
+
+@pytest.fixture
+def make_character(db, player):
+    """Factory for test characters."""
+    def _make(name="Герой", **kwargs):
+        character = Character(player_id=player.id, name=name, **kwargs)
+        db.add(character)
+        db.commit()
+        return character
+    return _make
+
+
+@pytest.fixture
+def shell_item(db):
+    """Tradable stackable Shell item."""
+    item = Item(name="Оболочка", item_type=ItemType.SHELL, is_tradable=True, stack_size=10)
+    db.add(item)
+    db.commit()
+    return item
+
+
+@pytest.fixture
+def monster(db):
+    """Monster in a test location."""
+    location = Location(name="Пустошь", description="Тестовая локация")
+    db.add(location)
+    db.flush()
+    monster = Monster(name="Тень", level=1, location_id=location.id, max_hp=50, current_hp=50)
+    db.add(monster)
+    db.commit()
+    return monster
@@ -1,8 +1,12 @@
 """Tests for character system."""
 
 import pytest
-from backend.src.models import CharacterClass
-from backend.src.core.character import get_class_stat_bonuses
+from sqlalchemy import event
+from backend.src.models import CharacterClass, InventorySlot, Item, ItemType
+from backend.src.core.character import get_class_stat_bonuses, level_up_character
+from backend.src.core.combat import calculate_character_stats
+from backend.src.core.inventory import equip_item, unequip_item
+from backend.src.utils.formulas import calculate_physical_damage, calculate_physical_defense
 
 
 def test_class_stat_bonuses():
@@ -32,3 +36,53 @@ def test_class_stat_bonuses():
     assert bonuses["wisdom"] == 1
     assert bonuses["luck"] == 1
 
+
+def _count_statements(db, fn):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        result = fn()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    return result, statements
+
+
+def test_derived_stats_cached_by_version(db, make_character):
+    """Stats are computed once per stats version, with one query for all items."""
+    character = make_character(strength=10)
+    sword = Item(name="Меч", item_type=ItemType.WEAPON, physical_damage=5, stat_bonuses={"strength": 2})
+    helmet = Item(name="Шлем", item_type=ItemType.HELMET, physical_defense=3)
+    db.add_all([sword, helmet])
+    db.commit()
+    db.add_all([
+        InventorySlot(character_id=character.id, item_id=sword.id, slot_index=0, quantity=1),
+        InventorySlot(character_id=character.id, item_id=helmet.id, slot_index=1, quantity=1),
+    ])
+    db.commit()
+    
+    assert equip_item(character, sword.id, db)["success"]
+    assert equip_item(character, helmet.id, db)["success"]
+    db.refresh(character)
+    version = character.stats_version
+    assert version == 2
+    assert character.equipment is not None  # loaded up front; only items are queried below
+    
+    stats, statements = _count_statements(db, lambda: calculate_character_stats(character, db))
+    assert len(statements) == 1
+    assert " IN " in statements[0]
+    assert stats["physical_damage"] == calculate_physical_damage(12, 5)
+    assert stats["physical_defense"] == calculate_physical_defense(character.endurance, 3)
+    
+    cached, statements = _count_statements(db, lambda: calculate_character_stats(character, db))
+    assert cached is stats
+    assert statements == []
+    
+    assert unequip_item(character, "weapon", db)["success"]
+    db.refresh(character)
+    assert character.stats_version == version + 1
+    assert calculate_character_stats(character, db)["physical_damage"] == calculate_physical_damage(10, 0)
+    
+    level_up_character(character)
+    assert character.stats_version == version + 2
+    assert calculate_character_stats(character, db)["max_hp"] > stats["max_hp"]
@@ -1,6 +1,12 @@
 """Tests for combat system."""
 
+import asyncio
+import time
 import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
 from backend.src.core.combat import (
     calculate_max_hp,
     calculate_max_mp,
@@ -13,6 +19,29 @@ from backend.src.core.combat import (
     apply_physical_damage,
     apply_magical_damage,
 )
+from backend.src.core.combat_enhanced import (
+    CombatTurn,
+    EnhancedCombatState,
+    checkpoint_due,
+    checkpoint_monster_hp,
+    write_monster_hp,
+)
+from backend.src.core.combat_store import (
+    CombatStore,
+    MemoryCombatStore,
+    SqlCombatStore,
+    StaleCombatState,
+    combat_key,
+    combat_store,
+)
+from backend.src.core.combat_scheduler import CombatScheduler, TimingWheel, combat_scheduler
+from backend.src.core.combat_feed import combat_delta, combat_view
+from backend.src.core.combat_simulation import simulate_combat
+from backend.src.core.character import character_rng
+from backend.src.api.main import app
+from backend.src.api.routes.combat_enhanced import _perform_action
+from backend.src.models import CombatSession
+from backend.src.utils.rng import server_seed, set_server_seed, stream
 
 
 def test_calculate_max_hp():
@@ -103,3 +132,300 @@ def test_apply_magical_damage():
     result = apply_magical_damage(10, 100)
     assert result == 1
 
+
+
+def test_seeded_streams_replay():
+    """Streams derive from the server seed and their key alone."""
+    original = server_seed()
+    try:
+        set_server_seed(42)
+        draws = [stream("combat", 1, 2).random() for _ in range(2)]
+        assert draws[0] == draws[1]
+        assert stream("combat", 1, 3).random() != draws[0]
+        set_server_seed(43)
+        assert stream("combat", 1, 2).random() != draws[0]
+    finally:
+        set_server_seed(original)
+
+
+def test_character_stream_never_repeats_after_restart(db, make_character):
+    """A recreated character stream opens a new epoch instead of replaying old rolls."""
+    character = make_character()
+    original = server_seed()
+    try:
+        set_server_seed(42)
+        first = character_rng(character, db).random()
+        # Same pinned seed, streams forgotten as after a restart
+        set_server_seed(42)
+        second = character_rng(character, db).random()
+        assert first != second
+        db.refresh(character)
+        assert character.rng_epoch == 2
+    finally:
+        set_server_seed(original)
+
+
+def test_combat_replays_from_seed(db, make_character, monster):
+    """A fight started with a recorded seed rolls the same hits again."""
+    character = make_character()
+    
+    def fight(seed):
+        monster.current_hp = monster.max_hp
+        db.commit()
+        state = EnhancedCombatState(character, monster, db, seed=seed)
+        hits = []
+        for _ in range(3):
+            state.current_turn = CombatTurn("character", character.id, 15.0)
+            hits.append(state.character_attack())
+        return state, [(hit["damage"], hit["is_crit"]) for hit in hits]
+    
+    first, hits = fight(None)
+    assert first.get_combat_state()["seed"] == first.seed
+    assert fight(first.seed)[1] == hits
+
+
+def test_combat_state_survives_store(db, make_character, monster):
+    """A fight saved to a store resumes with the same state and rolls."""
+    character = make_character()
+    monster.current_hp = monster.max_hp
+    db.commit()
+    state = EnhancedCombatState(character, monster, db, seed=7)
+    state.current_turn = CombatTurn("character", character.id, 15.0)
+    
+    store = SqlCombatStore(sessionmaker(bind=db.get_bind()))
+    key = combat_key(character.id, monster.id)
+    store.save(key, state)
+    restored = store.load(key)
+    assert restored.get_combat_state() | {"time_remaining": 0} == state.get_combat_state() | {"time_remaining": 0}
+    assert restored.character_attack()["damage"] == state.character_attack()["damage"]
+    
+    store.delete(key)
+    assert store.load(key) is None
+
+
+def test_memory_store_evicts_expired_and_excess():
+    """The in-process store drops expired fights and keeps at most max_sessions."""
+    store = MemoryCombatStore(ttl=60, max_sessions=2)
+    for key in ("a", "b", "c"):
+        assert store._put(key, "{}", time.time() + 60, 0, 1)
+    assert len(store) == 2
+    assert store._get("a") is None
+    
+    store._put("d", "{}", time.time() - 1, 0, 1)
+    assert store._get("d") is None
+    assert store._get("c") == "{}"
+    
+    # Backends must implement storage; only the sweep has a default
+    with pytest.raises(TypeError):
+        CombatStore()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sql"])
+def test_store_saves_compare_and_swap(db, make_character, monster, backend):
+    """A fight saved by another writer since it was loaded is not overwritten."""
+    character = make_character()
+    monster.current_hp = monster.max_hp
+    db.commit()
+    if backend == "memory":
+        store = MemoryCombatStore()
+    else:
+        store = SqlCombatStore(sessionmaker(bind=db.get_bind()))
+    key = combat_key(character.id, monster.id)
+    store.save(key, EnhancedCombatState(character, monster, db, seed=1))
+    
+    first, second = store.load(key), store.load(key)
+    store.save(key, first)
+    with pytest.raises(StaleCombatState):
+        store.save(key, second)
+    assert second.version == 1
+    assert store.load(key).version == 2
+    
+    # A new fight replaces only a missing or expired one
+    with pytest.raises(StaleCombatState):
+        store.save(key, EnhancedCombatState(character, monster, db, seed=2))
+    store.delete(key)
+    store.save(key, EnhancedCombatState(character, monster, db, seed=2))
+    assert store.load(key).version == 1
+
+
+def test_sql_store_evicts_in_sweeps(db, make_character, monster):
+    """Saves leave the TTL and the size cap to the periodic sweep."""
+    character = make_character()
+    store = SqlCombatStore(sessionmaker(bind=db.get_bind()), max_sessions=1, sweep_every=3)
+    for monster_id in (1, 2):
+        store.save(combat_key(character.id, monster_id), EnhancedCombatState(character, monster, db))
+    assert db.query(CombatSession).count() == 2
+    
+    # The third save sweeps; only the fight furthest from expiry stays
+    store.save(combat_key(character.id, 3), EnhancedCombatState(character, monster, db))
+    assert [row.key for row in db.query(CombatSession)] == [combat_key(character.id, 3)]
+
+
+def test_combat_actions_write_behind(db, make_character, monster):
+    """Actions never touch the database; monster HP is written once by a flush."""
+    character = make_character()
+    monster.current_hp = monster.max_hp
+    db.commit()
+    state = EnhancedCombatState(character, monster, db, seed=3)
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        for _ in range(3):
+            state.current_turn = CombatTurn("character", character.id, 15.0)
+            state.character_attack()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    assert statements == []
+    assert state.monster_hp < monster.max_hp
+    
+    assert checkpoint_due(state) == state.is_combat_over()
+    hp = checkpoint_monster_hp(state)
+    assert hp == state.monster_hp
+    write_monster_hp(monster.id, hp, db)
+    db.commit()
+    db.refresh(monster)
+    assert monster.current_hp == state.monster_hp
+    assert checkpoint_monster_hp(state) is None
+
+
+def test_lost_save_writes_no_monster_hp(db, make_character, monster, monkeypatch):
+    """A killing blow whose save loses the race leaves the monster's HP alone."""
+    character = make_character()
+    monster.current_hp = 1
+    db.commit()
+    state = EnhancedCombatState(character, monster, db, seed=1)
+    state.current_turn = CombatTurn("character", character.id, 15.0)
+    key = combat_key(character.id, monster.id)
+    combat_store.save(key, state)
+    try:
+        with monkeypatch.context() as patch:
+            patch.setattr(combat_store, "_put", lambda *args: False)
+            with pytest.raises(HTTPException) as lost:
+                _perform_action(character.id, monster.id, "attack", None, db)
+        assert lost.value.status_code == 409
+        db.refresh(monster)
+        assert monster.current_hp == 1
+        
+        result = _perform_action(character.id, monster.id, "attack", None, db)
+        assert result["action_result"]["combat_over"]
+        db.refresh(monster)
+        assert monster.current_hp == 0
+    finally:
+        combat_store.delete(key)
+        combat_scheduler.cancel(key)
+
+
+def test_timing_wheel_fires_after_delay():
+    """Keys fire after their delay, also past one revolution, and can be cancelled."""
+    wheel = TimingWheel(slots=4)
+    wheel.schedule("a", 2)
+    wheel.schedule("b", 6)
+    wheel.schedule("c", 1)
+    wheel.cancel("c")
+    fired = {tick: wheel.advance() for tick in range(1, 8)}
+    assert fired[2] == ["a"]
+    assert fired[6] == ["b"]
+    assert sum(len(keys) for keys in fired.values()) == 2
+    assert len(wheel) == 0
+
+
+def test_scheduler_plays_expired_turn(db, make_character, monster):
+    """An expired character turn is lost and the monster's turn is played by the server."""
+    character = make_character()
+    monster.current_hp = monster.max_hp
+    monster.physical_damage_min = monster.physical_damage_max = 5
+    db.commit()
+    state = EnhancedCombatState(character, monster, db, seed=5)
+    state.current_turn = CombatTurn("character", character.id, 0.05)
+    turn_number = state.turn_number
+    
+    key = combat_key(character.id, monster.id)
+    scheduler = CombatScheduler(tick_ms=10)
+    updates = []
+    scheduler.add_listener(lambda key, state: updates.append(state))
+    combat_store.save(key, state)
+    scheduler.track(key, state)
+    
+    async def run():
+        scheduler.start()
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+    
+    try:
+        asyncio.run(run())
+        restored = combat_store.load(key)
+    finally:
+        combat_store.delete(key)
+    assert restored.turn_number == turn_number + 2
+    assert restored.current_turn.actor_type == "character"
+    assert restored.char_hp < restored.char_max_hp
+    assert len(updates) == 1
+    assert len(scheduler.wheel) == 1  # the new character turn is on the clock
+
+
+def test_combat_delta_sends_only_changes(db, make_character, monster):
+    """A delta carries changed fields, changed tactics and new log lines only."""
+    character = make_character()
+    monster.current_hp = monster.max_hp
+    db.commit()
+    state = EnhancedCombatState(character, monster, db, seed=11)
+    state.current_turn = CombatTurn("character", character.id, 15.0)
+    before = combat_view(state)
+    state.character_attack()
+    delta = combat_delta(before, combat_view(state))
+    
+    assert delta["monster_hp"] == state.monster_hp
+    assert delta["tactics"]["attack"] == 1
+    assert [line["actor"] for line in delta["log"]] == ["character"]
+    assert "character_hp" not in delta and "time_remaining" not in delta
+
+
+def test_combat_stream_resumes_from_version(db, make_character, monster):
+    """The stream sends a full state, resumes quietly when current and ends with the fight."""
+    character = make_character()
+    monster.current_hp = 1
+    db.commit()
+    state = EnhancedCombatState(character, monster, db, seed=1)
+    state.current_turn = CombatTurn("character", character.id, 15.0)
+    state.character_attack()
+    key = combat_key(character.id, monster.id)
+    combat_store.save(key, state)
+    client = TestClient(app)
+    url = f"/api/combat-enhanced/stream?character_id={character.id}&monster_id={monster.id}"
+    try:
+        body = client.get(url).text
+        assert body.startswith(f"id: {state.version}\nevent: state\n")
+        assert "event: end" in body
+        
+        resumed = client.get(url, headers={"Last-Event-ID": str(state.version)}).text
+        assert "event: state" not in resumed and "event: end" in resumed
+    finally:
+        combat_store.delete(key)
+
+
+def test_simulate_combat_follows_formulas():
+    """Simulated damage matches the formulas and lopsided fights end one way."""
+    character = {"level": 1, "strength": 10, "agility": 20, "luck": 0, "endurance": 10}
+    sword = {"physical_damage": 5, "stat_bonuses": {"agility": -20}}
+    dummy = {"name": "Манекен", "max_hp": 10_000, "physical_damage_min": 1, "physical_damage_max": 1, "speed": 0}
+    result = simulate_combat(character, dummy, [sword], fights=20_000, seed=1, max_turns=20)
+    
+    damage = calculate_physical_damage(10, 5)
+    assert result["character_opens"]
+    assert result["damage_per_turn"]["crit_rate"] == 0
+    assert result["damage_per_turn"]["character"] == pytest.approx((damage["min"] + damage["max"]) / 2, rel=0.01)
+    assert result["unresolved_rate"] == 1.0
+    
+    weak = dict(dummy, max_hp=1)
+    won = simulate_combat(character, weak, fights=1000, seed=1)
+    assert won["win_rate"] == 1.0
+    assert won["attacks_to_kill"]["histogram"] == {1: 1.0}
+    assert won["hp_remaining"]["character_on_win_share"] == 1.0
+    
+    strong = dict(dummy, max_hp=10_000, physical_damage_min=500, physical_damage_max=600, speed=100)
+    lost = simulate_combat(character, strong, fights=1000, seed=1)
+    assert lost["loss_rate"] == 1.0
+    assert lost["turns"]["histogram"] == {1: 1.0}
+    assert lost["hp_remaining"]["monster_on_loss"]["mean"] == 10_000
@@ -1,7 +1,55 @@
 """Tests for drop system."""
 
+import random
+import threading
+import time
 import pytest
-from backend.src.core.drop import calculate_drop_chance
+from collections import Counter
+from sqlalchemy import event
+from backend.src.models import DropTable, DropTableItem, DropPity, Item, ItemType, InventorySlot, Monster
+from backend.src.core.drop import (
+    calculate_drop_chance,
+    compile_drop_tables,
+    drops_from_table,
+    get_compiled_drop_table,
+    get_drop_info,
+    reset_drop_counts,
+)
+from backend.src.core.drop_stats import compute_drop_stats, wilson_interval
+from backend.src.core.location import get_location_monsters
+from backend.src.core.drop_simulation import simulate_drops
+from backend.src.core import loot
+from backend.src.core.loot import KillEvent, LootQueue, drain_loot, resolve_kills
+from backend.src.core.pity import flush_pity, load_pity, pity_chance
+
+
+@pytest.fixture
+def drop_items(db):
+    """A core and two shells."""
+    items = [
+        Item(name="Сердцевина", item_type=ItemType.CORE, is_soul_bound=True),
+        Item(name="Оболочка", item_type=ItemType.SHELL, stack_size=10),
+        Item(name="Осколок", item_type=ItemType.SHELL, stack_size=10),
+    ]
+    db.add_all(items)
+    db.commit()
+    return items
+
+
+def _add_table(db, monster, chances, items, exclusive=False):
+    table = DropTable(monster_id=monster.id, name="Добыча", is_exclusive=exclusive)
+    db.add(table)
+    db.flush()
+    for chance, item in zip(chances, items):
+        db.add(DropTableItem(
+            drop_table_id=table.id, item_id=item.id, drop_chance=chance, min_quantity=1, max_quantity=3
+        ))
+    db.commit()
+    return table
+
+
+def _roll(monster, character, db, rng, pity=None):
+    return drops_from_table(get_compiled_drop_table(monster.id, db), character.luck, rng, pity)
 
 
 def test_calculate_drop_chance():
@@ -24,3 +72,318 @@ def test_calculate_drop_chance():
     chance = calculate_drop_chance(0.99, 1000)
     assert chance <= 1.0
 
+
+
+
+def test_rolls_use_compiled_table(db, make_character, monster, drop_items):
+    """Rolls read the compiled table without touching the database."""
+    core, shell, _ = drop_items
+    _add_table(db, monster, [1.0, 0.0], [core, shell])
+    character = make_character(luck=0)
+    compile_drop_tables(db)
+    db.refresh(monster)
+    db.refresh(character)
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        drops = [_roll(monster, character, db, random.Random(seed)) for seed in range(50)]
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    
+    assert statements == []
+    for drop in drops:
+        assert [d["item_id"] for d in drop] == [core.id]
+        assert drop[0]["is_core"] and 1 <= drop[0]["quantity"] <= 3
+
+
+def test_exclusive_table_alias_sampling(db, make_character, monster, drop_items):
+    """Exclusive tables drop at most one entry, in proportion to chances."""
+    _add_table(db, monster, [0.1, 0.2, 0.4], drop_items, exclusive=True)
+    character = make_character(luck=0)
+    rng = random.Random(7)
+    
+    counts = Counter()
+    rolls = 20000
+    for _ in range(rolls):
+        drops = _roll(monster, character, db, rng)
+        assert len(drops) <= 1
+        counts[drops[0]["item_name"] if drops else None] += 1
+    
+    for name, chance in (("Сердцевина", 0.1), ("Оболочка", 0.2), ("Осколок", 0.4), (None, 0.3)):
+        assert abs(counts[name] / rolls - chance) < 0.015
+
+
+def test_drop_tables_recompile_on_change(db, make_character, monster, drop_items):
+    """Editing a drop table is picked up by the next roll."""
+    core, shell, _ = drop_items
+    table = _add_table(db, monster, [0.0], [shell])
+    character = make_character(luck=0)
+    assert _roll(monster, character, db, random.Random(1)) == []
+    
+    table.items[0].drop_chance = 1.0
+    db.commit()
+    assert [drop["item_id"] for drop in _roll(monster, character, db, random.Random(1))] == [shell.id]
+    assert get_drop_info(monster, db)["shells"][0]["chance"] == 100.0
+
+
+@pytest.mark.parametrize("exclusive", [False, True])
+def test_simulate_drops_matches_drop_chances(db, monster, drop_items, exclusive):
+    """Simulated rates follow calculate_drop_chance and the table's layout."""
+    _add_table(db, monster, [0.01, 0.05, 0.2], drop_items, exclusive=exclusive)
+    kills = 400_000
+    result = simulate_drops(monster.id, kills=kills, luck=20, db=db, seed=3)
+    
+    core, shell, shard = result["items"]
+    if exclusive:
+        drop_chance = calculate_drop_chance(0.26, 20)
+        assert core["chance"] == pytest.approx(drop_chance * 0.01 / 0.26)
+    else:
+        assert core["chance"] == calculate_drop_chance(0.01, 20)
+    
+    # The core is rare enough to be pity-protected, which only ever adds drops
+    assert core["pity"] and not shell["pity"]
+    assert core["expected_rate"] > core["chance"]
+    for item in result["items"]:
+        sigma = (kills * item["expected_rate"] * (1 - item["expected_rate"])) ** 0.5
+        assert abs(item["drops"] - item["expected_drops"]) < 5 * sigma
+        # Quantities are uniform on 1..3: E[q] = 2, E[q^2] = 14 / 3
+        p = item["expected_rate"]
+        assert item["variance_per_kill"] == pytest.approx(p * 14 / 3 - (2 * p) ** 2, rel=0.1)
+    
+    kills_to_core = result["kills_to_core"]
+    assert kills_to_core["samples"] == core["drops"]
+    assert kills_to_core["mean_kills"] == pytest.approx(kills_to_core["expected_kills"], rel=0.1)
+    assert kills_to_core["p50_kills"] < kills_to_core["p90_kills"] < kills_to_core["p99_kills"]
+    
+    # Every player starts with a fresh streak, just as after a drop
+    shared = simulate_drops(monster.id, kills=kills, luck=20, db=db, seed=4, players=400)
+    core = shared["items"][0]
+    sigma = (kills * core["expected_rate"] * (1 - core["expected_rate"])) ** 0.5
+    assert abs(core["drops"] - core["expected_drops"]) < 5 * sigma
+    assert shared["kills_to_core"]["samples"] == core["drops"]
+
+
+def test_loot_queue_resolves_kills_in_one_batch(db, make_character, monster, drop_items):
+    """Queued kills of many characters are placed together and can be polled."""
+    core, shell, _ = drop_items
+    _add_table(db, monster, [1.0, 1.0], [core, shell])
+    characters = [make_character(f"Охотник {i}") for i in range(5)]
+    compile_drop_tables(db)
+    queue = LootQueue()
+    kill_ids = [queue.enqueue(character.id, monster.id, 0, db, seed=i) for i, character in enumerate(characters)]
+    assert queue.result(kill_ids[0], db)["status"] == "pending"
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert drain_loot(db, queue) == 5
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    
+    # Claim the kills, lock the masks, read stacks, insert slots, write the
+    # masks, store the results, find the queue empty
+    assert len(statements) == 7
+    assert queue.pending(db) == 0
+    for kill_id, character in zip(kill_ids, characters):
+        result = queue.result(kill_id, db)
+        assert result["status"] == "ready" and result["character_id"] == character.id
+        assert result["cores_found"] == [core.name]
+        slots = db.query(InventorySlot).filter(InventorySlot.character_id == character.id).all()
+        assert sum(slot.quantity for slot in slots if slot.item_id == shell.id) == result["shells_found"][0]["quantity"]
+    
+    # The seed alone decides the loot
+    replay = resolve_kills([KillEvent("replay", characters[3].id, monster.id, 0, 3)], db)["replay"]
+    assert replay["shells_found"] == queue.result(kill_ids[3], db)["shells_found"]
+    db.rollback()
+    
+    # Results are kept in the database, not in the worker's process
+    assert queue.prune(db, now=time.time() + queue.results_ttl + 1) == 5
+    assert queue.result(kill_ids[0], db) is None
+
+
+def test_failed_loot_batch_resolves_kills_one_by_one(db, make_character, monster, drop_items, monkeypatch):
+    """One kill that cannot be resolved fails alone; the rest of its batch gets loot."""
+    core, shell, _ = drop_items
+    _add_table(db, monster, [1.0, 1.0], [core, shell])
+    compile_drop_tables(db)
+    character = make_character()
+    queue = LootQueue()
+    kill_ids = [queue.enqueue(character.id, monster.id, 0, db, seed=seed) for seed in (1, 666, 3)]
+    
+    roll = loot.drops_from_table
+    
+    def broken_roll(table, luck, rng, pity=None):
+        if rng.getstate() == random.Random(666).getstate():
+            raise RuntimeError("broken drop table")
+        return roll(table, luck, rng, pity)
+    
+    monkeypatch.setattr(loot, "drops_from_table", broken_roll)
+    assert drain_loot(db, queue) == 2
+    
+    results = [queue.result(kill_id, db) for kill_id in kill_ids]
+    assert [result["status"] for result in results] == ["ready", "failed", "ready"]
+    assert queue.pending(db) == 0
+    # Nothing of the rolled-back batch is left in the inventory
+    shells = sum(slot.quantity for slot in db.query(InventorySlot).filter(InventorySlot.item_id == shell.id))
+    assert shells == sum(results[i]["shells_found"][0]["quantity"] for i in (0, 2))
+
+
+def test_pity_chance_escalates():
+    """Pity starts after the expected number of kills and grows with the streak."""
+    assert pity_chance(0.0001, 5000) == 0.0001
+    assert pity_chance(0.0001, 10000) == 0.0001
+    assert pity_chance(0.0001, 30000) == pytest.approx(0.0003)
+    assert pity_chance(0.0001, 10 ** 9) == 1.0
+
+
+@pytest.mark.parametrize("exclusive", [False, True])
+def test_pity_counters_load_and_flush_once_per_batch(db, make_character, monster, drop_items, exclusive):
+    """A batch reads and writes counters in bulk and guarantees overdue Cores."""
+    core, shell, _ = drop_items
+    table = _add_table(db, monster, [0.0001, 0.5], [core, shell], exclusive=exclusive)
+    character = make_character(luck=0)
+    db.add(DropPity(character_id=character.id, drop_table_item_id=table.items[0].id, kills_since_drop=10 ** 8))
+    db.commit()
+    compile_drop_tables(db)
+    db.refresh(monster)
+    db.refresh(character)
+    
+    events = [KillEvent(f"kill-{seed}", character.id, monster.id, 0, seed) for seed in range(20)]
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        results = resolve_kills(events, db)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    db.commit()
+    
+    # One read and one bulk write of the counters for the whole batch
+    assert sum("drop_pity" in statement for statement in statements) == 2
+    rolls = [results[kill.kill_id]["cores_found"] for kill in events]
+    assert rolls[0] == ["Сердцевина"]
+    if exclusive:
+        assert results[events[0].kill_id]["shells_found"] == []
+    assert all(cores == [] for cores in rolls[1:])
+    assert db.query(DropPity.kills_since_drop).scalar() == 19
+
+
+def test_pity_flushes_of_several_workers_add_up(db, make_character, monster, drop_items):
+    """Batches that read the same counter add their dry kills; a drop restarts it."""
+    core, shell, _ = drop_items
+    table = _add_table(db, monster, [0.0001, 0.5], [core, shell])
+    entry_id = table.items[0].id
+    character = make_character(luck=0)
+    db.add(DropPity(character_id=character.id, drop_table_item_id=entry_id, kills_since_drop=5))
+    db.commit()
+    compile_drop_tables(db)
+    
+    # Two workers read the counter before either writes it back
+    first, second = load_pity([character.id], db), load_pity([character.id], db)
+    for seed in range(3):
+        assert _roll(monster, character, db, random.Random(seed), first[character.id]) == []
+    for seed in range(4):
+        _roll(monster, character, db, random.Random(seed), second[character.id])
+    assert flush_pity(first, db) == 1
+    assert flush_pity(second, db) == 1
+    db.commit()
+    assert db.query(DropPity.kills_since_drop).scalar() == 12
+    
+    dropped, dry = load_pity([character.id], db), load_pity([character.id], db)
+    assert flush_pity(dropped, db) == 0
+    dropped[character.id][entry_id] = 0
+    dropped[character.id][entry_id] = 1
+    dry[character.id][entry_id] += 2
+    flush_pity(dropped, db)
+    flush_pity(dry, db)
+    db.commit()
+    assert db.query(DropPity.kills_since_drop).scalar() == 3
+
+
+def test_drop_stats_compare_observed_and_expected(db, make_character, monster, drop_items):
+    """Rolls from every thread are counted and checked against the table."""
+    _, shell, shard = drop_items
+    _add_table(db, monster, [0.1, 0.3], [shell, shard])
+    compile_drop_tables(db)
+    db.refresh(monster)
+    lucky = make_character("Везунчик", luck=500)
+    plain = make_character("Простак", luck=0)
+    reset_drop_counts()
+    
+    def farm(character, seed):
+        rng = random.Random(seed)
+        for _ in range(5000):
+            _roll(monster, character, db, rng)
+    
+    farm(plain, 1)
+    worker = threading.Thread(target=farm, args=(lucky, 2))
+    worker.start()
+    worker.join()
+    
+    stats = {entry["item_id"]: entry for entry in compute_drop_stats(db)}
+    assert stats[shell.id]["rolls"] == 10000
+    assert stats[shell.id]["expected_rate"] == pytest.approx((0.1 + 0.15) / 2)
+    assert stats[shard.id]["expected_rate"] == pytest.approx((0.3 + 0.35) / 2)
+    for entry in stats.values():
+        assert entry["ci_low"] <= entry["observed_rate"] <= entry["ci_high"]
+        assert entry["within_ci"]
+    
+    low, high = wilson_interval(0, 100)
+    assert low == 0.0 and 0.03 < high < 0.04
+
+
+@pytest.mark.parametrize("exclusive", [False, True])
+def test_drop_stats_leave_out_pity_drops(db, make_character, monster, drop_items, exclusive):
+    """Forced pity drops are reported apart from the table's rolls."""
+    core, shell, _ = drop_items
+    _add_table(db, monster, [0.01, 0.3], [core, shell], exclusive=exclusive)
+    compile_drop_tables(db)
+    db.refresh(monster)
+    character = make_character(luck=0)
+    reset_drop_counts()
+    
+    rng = random.Random(7)
+    pity = {}
+    for _ in range(20000):
+        _roll(monster, character, db, rng, pity)
+    
+    stats = {entry["item_id"]: entry for entry in compute_drop_stats(db)}
+    assert stats[core.id]["pity_hits"] > 0
+    assert stats[core.id]["rolls"] < 20000
+    assert stats[core.id]["expected_rate"] == pytest.approx(0.01)
+    for entry in stats.values():
+        assert entry["within_ci"]
+
+
+def test_location_monsters_cost_constant_queries(db, monster, drop_items):
+    """Twenty monsters with drops are listed with two queries."""
+    core, shell, _ = drop_items
+    monsters = [monster] + [
+        Monster(name=f"Тень {i}", level=1, location_id=monster.location_id, max_hp=50, current_hp=50)
+        for i in range(19)
+    ]
+    db.add_all(monsters[1:])
+    db.commit()
+    for index, each in enumerate(monsters):
+        _add_table(db, each, [0.0001, 0.1 + index / 100], [core, shell])
+    compile_drop_tables(db)
+    location_id = monster.location_id
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        info = get_location_monsters(location_id, db)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    
+    assert len(statements) == 2
+    assert len(info["monsters"]) == 20
+    last = info["monsters"][-1]["drops"]
+    assert last["cores"][0]["name"] == core.name
+    assert last["shells"][0]["chance"] == pytest.approx(29.0)
+    assert get_location_monsters(9999, db) is None
@@ -0,0 +1,156 @@
+"""Tests for inventory placement."""
+
+from sqlalchemy import event
+from backend.src.models import Character, Item, ItemType, InventorySlot
+from backend.src.core.inventory import (
+    GRID_MASK,
+    MAX_INVENTORY_SLOTS,
+    first_free_slot,
+    free_slots,
+    plan_placement,
+    apply_placement,
+    get_inventory,
+    claim_pending_deliveries,
+)
+from backend.src.core.settlement import deliver_items
+from backend.src.core.crafting import craft_item
+from backend.src.core.drop import summarize_drops
+
+
+def _slots(db, character):
+    return [
+        (slot.slot_index, slot.item_id, slot.quantity)
+        for slot in db.query(InventorySlot).filter(
+            InventorySlot.character_id == character.id
+        ).order_by(InventorySlot.slot_index)
+    ]
+
+
+def _drop(item, quantity):
+    return {
+        "item_id": item.id,
+        "item_name": item.name,
+        "stack_size": item.stack_size,
+        "quantity": quantity,
+        "is_core": item.item_type == ItemType.CORE,
+        "is_shell": item.item_type == ItemType.SHELL,
+    }
+
+
+def test_drop_batch_is_written_in_bulk(db, make_character, shell_item):
+    """A ten-item drop costs the same five statements as a one-item drop."""
+    character = make_character()
+    cores = [Item(name=f"Сердцевина {i}", item_type=ItemType.CORE, is_soul_bound=True) for i in range(8)]
+    db.add_all(cores)
+    db.add(InventorySlot(character_id=character.id, item_id=shell_item.id, quantity=4, slot_index=1))
+    db.commit()
+    drops = [_drop(core, 1) for core in cores] + [_drop(shell_item, 3), _drop(shell_item, 5)]
+    db.refresh(character)
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        plan = plan_placement(
+            [(character.id, drop["item_id"], drop["quantity"], drop["stack_size"]) for drop in drops], db
+        )
+        apply_placement(plan, db)
+        db.commit()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    
+    # Lock and read the mask, read stacks, update stacks, insert slots, write the mask
+    assert len(statements) == 5
+    
+    # 4 + 3 + 5 shells: the old stack tops up to 10, the rest opens a new stack
+    slots = _slots(db, character)
+    assert (1, shell_item.id, 10) in slots
+    assert sum(quantity for _, item_id, quantity in slots if item_id == shell_item.id) == 12
+    assert sorted(index for index, _, _ in slots) == list(range(10))
+    assert len(summarize_drops(drops, plan.placed)["cores_found"]) == 8
+
+
+def test_placement_respects_grid(db, make_character, shell_item):
+    """A full grid leaves items unplaced; market deliveries wait as pending until claimed."""
+    character = make_character()
+    db.add_all([
+        InventorySlot(character_id=character.id, item_id=shell_item.id, quantity=10, slot_index=index)
+        for index in range(MAX_INVENTORY_SLOTS - 1)
+    ])
+    db.commit()
+    
+    plan = plan_placement([(character.id, shell_item.id, 15, 10)], db)
+    assert plan.placed == [(0, 10)] and plan.unplaced == [5]
+    db.rollback()
+    
+    deliver_items({(character.id, shell_item.id): 15}, db)
+    db.commit()
+    assert max(slot_index for slot_index, _, _ in _slots(db, character)) == MAX_INVENTORY_SLOTS - 1
+    inventory = get_inventory(character, db)
+    assert inventory["used_slots"] == MAX_INVENTORY_SLOTS
+    assert [(d["item_id"], d["quantity"]) for d in inventory["pending"]] == [(shell_item.id, 5)]
+    
+    assert claim_pending_deliveries(character, db)["reason"] == "Инвентарь переполнен"
+    db.delete(db.query(InventorySlot).filter(InventorySlot.slot_index == 0).one())
+    db.commit()
+    claim = claim_pending_deliveries(character, db)
+    assert (claim["claimed"], claim["pending"]) == (5, 0)
+    assert _slots(db, character)[0] == (0, shell_item.id, 5)
+    assert get_inventory(character, db)["pending"] == []
+
+
+def test_free_slots_from_mask():
+    """Free grid slots are read off the occupancy mask."""
+    assert first_free_slot(0) == 0
+    assert first_free_slot(0b1011) == 2
+    assert first_free_slot(GRID_MASK) is None
+    assert free_slots(0b1011, 3) == [2, 4, 5]
+    assert free_slots(GRID_MASK ^ (1 << 29), 3) == [29]
+
+
+def test_mask_follows_slot_writes(db, make_character, shell_item):
+    """ORM writes, bulk placement and crafting keep the mask equal to the grid."""
+    character = make_character()
+    db.add(InventorySlot(character_id=character.id, item_id=shell_item.id, quantity=10, slot_index=2))
+    db.commit()
+    
+    def mask():
+        return db.query(Character.inventory_mask).filter(Character.id == character.id).scalar()
+    
+    def grid_mask():
+        return sum(1 << index for index, _, _ in _slots(db, character) if index < MAX_INVENTORY_SLOTS)
+    
+    assert mask() == grid_mask() == 0b100
+    
+    apply_placement(plan_placement([(character.id, shell_item.id, 15, 10)], db), db)
+    db.commit()
+    assert mask() == grid_mask() == 0b111
+    
+    result_item = Item(name="Клинок", item_type=ItemType.WEAPON)
+    db.add(result_item)
+    db.commit()
+    recipe = {"result_item_id": result_item.id, "shell_items": [{"item_id": shell_item.id, "quantity": 20}]}
+    assert craft_item(character, recipe, db)["success"]
+    assert mask() == grid_mask()
+    slots = _slots(db, character)
+    assert slots[0][:2] == (0, result_item.id)
+    assert [quantity for _, item_id, quantity in slots if item_id == shell_item.id] == [5]
+    
+    db.delete(db.query(InventorySlot).filter(InventorySlot.item_id == shell_item.id).one())
+    db.commit()
+    assert mask() == grid_mask() == 1
+
+
+def test_missing_mask_is_rebuilt_from_slots(db, make_character, shell_item):
+    """Characters from before the mask column get it rebuilt on first placement."""
+    character = make_character()
+    db.add(InventorySlot(character_id=character.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    db.query(Character).filter(Character.id == character.id).update({"inventory_mask": None})
+    db.commit()
+    
+    plan = plan_placement([(character.id, shell_item.id, 10, 10)], db)
+    apply_placement(plan, db)
+    db.commit()
+    assert _slots(db, character) == [(0, shell_item.id, 10), (1, shell_item.id, 10)]
+    assert db.query(Character.inventory_mask).filter(Character.id == character.id).scalar() == 0b11
@@ -1,7 +1,34 @@
 """Tests for market system."""
 
+import multiprocessing
+import random
+import re
+import threading
 import pytest
-from backend.src.models import OrderType, OrderStatus
+from fastapi.testclient import TestClient
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from backend.src.database.base import Base
+from backend.src.models import (
+    Player, Character, Item, ItemType, OrderType, OrderStatus, TimeInForce, MarketOrder, InventorySlot, Trade
+)
+from backend.src.core.order_book import (
+    BookOrder,
+    OrderBook,
+    get_order_book,
+    load_order_books,
+    reset_order_books,
+)
+from backend.src.core.market import create_order, cancel_order, get_market_orders, try_match_order
+from backend.src.core.settlement import credit_gold, debit_gold
+from backend.src.core.auction import set_batch_mode, run_auction_tick
+from backend.src.core.candles import record_trades, get_candles
+from backend.src.core.expiry import expire_orders
+from backend.benchmarks.market_bench import generate_flow, run_benchmark, is_throwaway_database
+from backend.src.models import CandleResolution
+from backend.src.api.main import app
 
 
 def test_order_types():
@@ -17,3 +44,627 @@ def test_order_status():
     assert OrderStatus.CANCELLED.value == "cancelled"
     assert OrderStatus.PARTIAL.value == "partial"
 
+
+def _book_order(order_id, order_type, price, quantity, character_id=None):
+    return BookOrder(order_id, character_id or order_id, 1, order_type, price, quantity)
+
+
+def test_order_book_price_time_priority():
+    """Best price matches first, then arrival order within a level."""
+    book = OrderBook(1)
+    book.add(_book_order(1, OrderType.SELL, 12, 5))
+    book.add(_book_order(2, OrderType.SELL, 10, 5))
+    book.add(_book_order(3, OrderType.SELL, 10, 5))
+    
+    incoming = _book_order(4, OrderType.BUY, 11, 7)
+    fills = book.match(incoming)
+    
+    assert [(f.sell_order.id, f.quantity, f.price) for f in fills] == [
+        (2, 5, Decimal("10.00")),
+        (3, 2, Decimal("10.00")),
+    ]
+    assert incoming.remaining == 0
+    assert book.get(2) is None
+    assert book.get(3).remaining == 3
+    assert book.asks.best_price() == Decimal("10.00")
+
+
+def test_order_book_skips_self_and_cancel():
+    """Own orders are never matched; cancelled orders leave the book."""
+    book = OrderBook(1)
+    book.add(_book_order(1, OrderType.BUY, 10, 5, character_id=7))
+    book.add(_book_order(2, OrderType.BUY, 9, 5))
+    
+    assert book.remove(2).id == 2
+    assert book.bids.best_price() == Decimal("10.00")
+    
+    fills = book.match(_book_order(3, OrderType.SELL, 9, 5, character_id=7))
+    assert fills == []
+    
+    assert book.remove(1).id == 1
+    assert len(book.bids) == 0
+
+
+def test_resting_order_keeps_priority_when_matched(db, make_character, shell_item):
+    """Re-matching a resting order leaves it at the head of its level."""
+    first = make_character("Первый")
+    second = make_character("Второй")
+    buyer = make_character("Покупатель", gold=100)
+    for slot_index, seller in enumerate((first, second)):
+        db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=5, slot_index=slot_index))
+    db.commit()
+    
+    early = create_order(first, shell_item.id, OrderType.SELL, 10.0, 5, db)
+    create_order(second, shell_item.id, OrderType.SELL, 10.0, 5, db)
+    assert not try_match_order(early["order_id"], db)["matched"]
+    
+    create_order(buyer, shell_item.id, OrderType.BUY, 10.0, 3, db)
+    assert db.get(MarketOrder, early["order_id"]).filled_quantity == 3
+    assert get_order_book(shell_item.id, db).depth(1)["asks"] == [{"price": 10.0, "quantity": 7, "orders": 2}]
+
+
+def test_create_order_matches_against_book(db, make_character, shell_item):
+    """Orders match through the book and the database mirrors the fills."""
+    seller = make_character("Продавец")
+    buyer = make_character("Покупатель", gold=100)
+    db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    
+    sell = create_order(seller, shell_item.id, OrderType.SELL, 10.0, 10, db)
+    assert sell["success"] and not sell["matched"]
+    
+    buy = create_order(buyer, shell_item.id, OrderType.BUY, 12.0, 4, db)
+    assert buy["matched"]
+    
+    sell_order = db.get(MarketOrder, sell["order_id"])
+    buy_order = db.get(MarketOrder, buy["order_id"])
+    assert sell_order.status == OrderStatus.PARTIAL
+    assert sell_order.filled_quantity == 4
+    assert buy_order.status == OrderStatus.FILLED
+    
+    open_orders = get_market_orders(shell_item.id, status=OrderStatus.PARTIAL, db=db)["orders"]
+    assert [o["id"] for o in open_orders] == [sell["order_id"]]
+    
+    assert cancel_order(sell["order_id"], seller.id, db)["success"]
+    assert get_order_book(shell_item.id, db).get(sell["order_id"]) is None
+    
+    # Books rebuilt from the journal contain no cancelled orders
+    reset_order_books()
+    load_order_books(db)
+    assert get_order_book(shell_item.id, db).open_orders() == []
+
+
+@pytest.mark.parametrize("order_type", [OrderType.BUY, OrderType.SELL])
+@pytest.mark.parametrize("price, quantity", [(5.0, -1000), (5.0, 0), (-5.0, 1000), (0.0, 1)])
+def test_non_positive_orders_are_rejected(db, make_character, shell_item, order_type, price, quantity):
+    """Negative or zero prices and quantities never reach escrow."""
+    character = make_character(gold=10)
+    db.add(InventorySlot(character_id=character.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    
+    result = create_order(character, shell_item.id, order_type, price, quantity, db)
+    assert not result["success"]
+    db.refresh(character)
+    assert character.gold == 10
+    assert db.query(MarketOrder).count() == 0
+    assert db.query(func.sum(InventorySlot.quantity)).scalar() == 10
+
+
+def test_gold_updates_refuse_non_positive_amounts(db, make_character):
+    """A negative debit would pass the balance check and mint gold."""
+    character = make_character(gold=10)
+    assert not debit_gold(character.id, Decimal(-1000), db)
+    assert not debit_gold(character.id, Decimal(0), db)
+    with pytest.raises(ValueError):
+        credit_gold({character.id: Decimal(-5)}, db)
+    db.commit()
+    db.refresh(character)
+    assert character.gold == 10
+    
+    response = TestClient(app).post("/api/market/orders", json={
+        "character_id": character.id, "item_id": 1, "order_type": "buy", "price": 5, "quantity": -1000,
+    })
+    assert response.status_code == 422
+
+
+def test_settlement_moves_items_and_gold(db, make_character, shell_item):
+    """Fills credit the seller with gold and the buyer with items."""
+    seller = make_character("Продавец", gold=0)
+    buyer = make_character("Покупатель", gold=100)
+    db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    
+    sell = create_order(seller, shell_item.id, OrderType.SELL, 10.0, 5, db)
+    buy = create_order(buyer, shell_item.id, OrderType.BUY, 12.0, 3, db)
+    assert buy["matched"]
+    
+    db.expire_all()
+    assert buyer.gold == Decimal("70.00")  # 36 escrowed, 6 price improvement refunded
+    assert seller.gold == Decimal("30.00")
+    
+    trade = db.query(Trade).one()
+    assert (trade.buyer_id, trade.seller_id, trade.quantity) == (buyer.id, seller.id, 3)
+    assert trade.price == Decimal("10.00")
+    
+    buyer_slot = db.query(InventorySlot).filter(InventorySlot.character_id == buyer.id).one()
+    assert buyer_slot.quantity == 3
+    
+    # Cancelling returns the escrowed remainder to the seller's stack
+    assert cancel_order(sell["order_id"], seller.id, db)["success"]
+    seller_slot = db.query(InventorySlot).filter(InventorySlot.character_id == seller.id).one()
+    assert seller_slot.quantity == 7
+
+
+def test_sweep_settles_in_few_statements(db, make_character, shell_item):
+    """A 200-level sweep is settled with a constant number of statements."""
+    buyer = make_character("Покупатель", gold=100000)
+    sellers = [make_character(f"Продавец {i}") for i in range(200)]
+    book = get_order_book(shell_item.id, db)
+    for seller in sellers:
+        order = MarketOrder(
+            character_id=seller.id, item_id=shell_item.id, order_type=OrderType.SELL,
+            status=OrderStatus.PENDING, price=10 + seller.id, quantity=1, filled_quantity=0
+        )
+        db.add(order)
+        db.flush()
+        book.add(BookOrder.from_model(order))
+    buy_order = MarketOrder(
+        character_id=buyer.id, item_id=shell_item.id, order_type=OrderType.BUY,
+        status=OrderStatus.PENDING, price=1000, quantity=200, filled_quantity=0
+    )
+    db.add(buy_order)
+    db.commit()
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        assert try_match_order(buy_order.id, db)["matched"]
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    
+    assert len(statements) <= 12
+    assert db.query(Trade).count() == 200
+    assert db.get(MarketOrder, buy_order.id).status == OrderStatus.FILLED
+
+
+def _full_scans(connection, statement, parameters):
+    """Tables a statement reads with a full table scan."""
+    plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+        if match and "USING" not in detail:
+            scans.append(f"{match.group(1)}: {statement}")
+    return scans
+
+
+def test_market_queries_use_indexes(db, make_character, shell_item):
+    """Every SELECT issued by the market avoids full table scans."""
+    seller = make_character("Продавец")
+    buyer = make_character("Покупатель", gold=1000)
+    db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    
+    statements = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            statements.append((statement, parameters))
+    
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        sell = create_order(seller, shell_item.id, OrderType.SELL, 10.0, 5, db)
+        create_order(buyer, shell_item.id, OrderType.BUY, 11.0, 2, db)
+        cancel_order(sell["order_id"], seller.id, db)
+        reset_order_books()
+        load_order_books(db)
+        reset_order_books()
+        get_market_orders(shell_item.id, status=OrderStatus.PENDING, db=db)
+        get_market_orders(db=db)
+        get_market_orders(shell_item.id, OrderType.SELL, db=db)
+        get_market_orders(status=OrderStatus.FILLED, db=db)
+        page = get_market_orders(db=db, limit=1)
+        get_market_orders(shell_item.id, db=db, limit=1, cursor=page["next_cursor"])
+        expire_orders(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    
+    assert statements
+    with engine.connect() as connection:
+        scans = [
+            scan
+            for statement, parameters in statements
+            for scan in _full_scans(connection, statement, parameters)
+        ]
+    assert scans == []
+
+
+def test_batch_mode_matches_in_auction_tick(db, make_character, shell_item):
+    """Batch items accept orders immediately and clear them per tick."""
+    seller = make_character("Продавец")
+    buyer = make_character("Покупатель", gold=100)
+    db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    
+    set_batch_mode(shell_item.id)
+    try:
+        sell = create_order(seller, shell_item.id, OrderType.SELL, 10.0, 5, db)
+        buy = create_order(buyer, shell_item.id, OrderType.BUY, 12.0, 3, db)
+        assert sell["batched"] and buy["batched"]
+        assert not buy["matched"]
+        assert db.query(Trade).count() == 0
+        
+        assert run_auction_tick(db) == {shell_item.id: 1}
+        assert run_auction_tick(db) == {}
+    finally:
+        set_batch_mode(shell_item.id, False)
+    
+    # Same outcome as continuous matching: the earlier sell sets the price
+    trade = db.query(Trade).one()
+    assert (trade.sell_order_id, trade.price, trade.quantity) == (sell["order_id"], Decimal("10.00"), 3)
+    book = get_order_book(shell_item.id, db)
+    assert book.get(sell["order_id"]).remaining == 2
+    assert book.get(buy["order_id"]) is None
+
+
+def test_reload_requeues_unmatched_batch_orders(db, make_character, shell_item):
+    """Queued orders lost with the process are queued again, not left crossing the book."""
+    seller = make_character("Продавец")
+    buyer = make_character("Покупатель", gold=100)
+    db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    
+    set_batch_mode(shell_item.id)
+    try:
+        sell = create_order(seller, shell_item.id, OrderType.SELL, 10.0, 5, db)
+        buy = create_order(buyer, shell_item.id, OrderType.BUY, 12.0, 3, db)
+        
+        reset_order_books()
+        load_order_books(db)
+        book = get_order_book(shell_item.id, db)
+        assert book.asks.best_price() == Decimal("10.00")
+        assert book.bids.best_price() is None
+        assert list(book.incoming) == [buy["order_id"]]
+        
+        assert run_auction_tick(db) == {shell_item.id: 1}
+    finally:
+        set_batch_mode(shell_item.id, False)
+    
+    assert book.get(sell["order_id"]).remaining == 2
+    assert db.get(MarketOrder, buy["order_id"]).status == OrderStatus.FILLED
+
+
+def test_reload_keeps_self_crossed_orders_resting(db, make_character, shell_item):
+    """A character's own crossing orders rest again on reload and later orders keep their place."""
+    trader = make_character("Торговец", gold=100)
+    buyer = make_character("Покупатель", gold=100)
+    seller = make_character("Продавец")
+    db.add_all([
+        InventorySlot(character_id=trader.id, item_id=shell_item.id, quantity=5, slot_index=0),
+        InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=5, slot_index=0),
+    ])
+    db.commit()
+    
+    ask = create_order(trader, shell_item.id, OrderType.SELL, 10.0, 5, db)
+    bid = create_order(trader, shell_item.id, OrderType.BUY, 12.0, 3, db)
+    later = create_order(buyer, shell_item.id, OrderType.BUY, 9.0, 2, db)
+    assert not bid["matched"]
+    
+    reset_order_books()
+    load_order_books(db)
+    book = get_order_book(shell_item.id, db)
+    assert not book.incoming
+    assert (book.bids.best_price(), book.asks.best_price()) == (Decimal("12.00"), Decimal("10.00"))
+    
+    sell = create_order(seller, shell_item.id, OrderType.SELL, 9.0, 5, db)
+    assert sell["matched"]
+    trades = db.query(Trade).order_by(Trade.id).all()
+    assert [(trade.buy_order_id, trade.price, trade.quantity) for trade in trades] == [
+        (bid["order_id"], Decimal("12.00"), 3),
+        (later["order_id"], Decimal("9.00"), 2),
+    ]
+    assert book.get(ask["order_id"]).remaining == 5
+
+
+def test_depth_updates_incrementally():
+    """Level totals follow fills and cancels without rescanning orders."""
+    book = OrderBook(1)
+    book.add(_book_order(1, OrderType.SELL, 10, 5))
+    book.add(_book_order(2, OrderType.SELL, 10, 3))
+    book.add(_book_order(3, OrderType.SELL, 11, 4))
+    book.add(_book_order(4, OrderType.BUY, 9, 2))
+    
+    depth = book.depth(1)
+    assert depth["asks"] == [{"price": 10.0, "quantity": 8, "orders": 2}]
+    assert depth["spread"] == 1.0
+    assert book.depth(1) is depth
+    
+    book.match(_book_order(5, OrderType.BUY, 10, 6))
+    assert book.depth(5)["asks"] == [
+        {"price": 10.0, "quantity": 2, "orders": 1},
+        {"price": 11.0, "quantity": 4, "orders": 1},
+    ]
+    
+    book.remove(2)
+    assert book.depth(5)["asks"] == [{"price": 11.0, "quantity": 4, "orders": 1}]
+    assert book.depth(5)["bids"] == [{"price": 9.0, "quantity": 2, "orders": 1}]
+
+
+def test_expired_orders_leave_depth():
+    """Orders past their expiry stop counting in depth before the sweeper runs."""
+    now = datetime.now(timezone.utc)
+    book = OrderBook(1)
+    book.add(_book_order(1, OrderType.SELL, 10, 5))
+    book.add(BookOrder(2, 2, 1, OrderType.SELL, 9, 3, expires_at=now + timedelta(minutes=1)))
+    assert book.depth(1)["best_ask"] == 9.0
+    
+    book.add(BookOrder(3, 3, 1, OrderType.SELL, 10, 4, expires_at=now - timedelta(seconds=1)))
+    assert book.depth(5)["asks"] == [
+        {"price": 9.0, "quantity": 3, "orders": 1},
+        {"price": 10.0, "quantity": 5, "orders": 1},
+    ]
+    
+    assert [order.id for order in book.evict_expired(now + timedelta(minutes=1))] == [2]
+    assert book.depth(5)["asks"] == [{"price": 10.0, "quantity": 5, "orders": 1}]
+    
+    fills = book.match(_book_order(4, OrderType.BUY, 10, 5))
+    assert [(fill.sell_order.id, fill.quantity) for fill in fills] == [(1, 5)]
+
+
+def test_market_orders_keyset_pagination(db, make_character, shell_item):
+    """Pages follow (created_at, id) without gaps or repeats."""
+    buyer = make_character("Покупатель", gold=1000)
+    created = [
+        create_order(buyer, shell_item.id, OrderType.BUY, 1.0 + i, 1, db)["order_id"]
+        for i in range(5)
+    ]
+    
+    for status in (None, OrderStatus.PENDING):
+        seen = []
+        cursor = None
+        while True:
+            page = get_market_orders(status=status, db=db, limit=2, cursor=cursor)
+            seen.extend(order["id"] for order in page["orders"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        assert seen == sorted(created, reverse=True)
+    
+    with pytest.raises(ValueError):
+        get_market_orders(db=db, cursor="not-a-cursor")
+
+
+def test_trades_roll_into_candles(db, shell_item):
+    """Trades merge into the bucket candle at every resolution."""
+    start = datetime(2024, 5, 1, 12, 0, 30, tzinfo=timezone.utc)
+    trade = lambda price, quantity, seconds: {
+        "item_id": shell_item.id,
+        "price": Decimal(price),
+        "quantity": quantity,
+        "executed_at": start + timedelta(seconds=seconds),
+    }
+    record_trades([trade("10", 2, 0), trade("14", 3, 10)], db)
+    record_trades([trade("8", 1, 20)], db)  # merges into existing buckets
+    record_trades([trade("9", 4, 60)], db)  # next minute
+    db.commit()
+    
+    minutes = get_candles(shell_item.id, CandleResolution.MINUTE, db)
+    first, second = minutes
+    assert (first["open"], first["high"], first["low"], first["close"]) == (10.0, 14.0, 8.0, 8.0)
+    assert (first["volume"], first["trade_count"]) == (6, 3)
+    assert (second["open"], second["close"], second["volume"]) == (9.0, 9.0, 4)
+    
+    for resolution in (CandleResolution.HOUR, CandleResolution.DAY):
+        candle, = get_candles(shell_item.id, resolution, db)
+        assert (candle["open"], candle["high"], candle["low"], candle["close"]) == (10.0, 14.0, 8.0, 9.0)
+        assert (candle["volume"], candle["trade_count"]) == (10, 4)
+
+
+def test_fills_feed_candles(db, make_character, shell_item):
+    """Settling a fill records it in the candles."""
+    seller = make_character("Продавец", gold=0)
+    buyer = make_character("Покупатель", gold=1000)
+    db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    
+    create_order(seller, shell_item.id, OrderType.SELL, 10.0, 2, db)
+    create_order(buyer, shell_item.id, OrderType.BUY, 12.0, 2, db)
+    
+    candle, = get_candles(shell_item.id, CandleResolution.DAY, db)
+    assert (candle["close"], candle["volume"]) == (10.0, 2)
+
+
+def test_ioc_and_fok_never_rest(db, make_character, shell_item):
+    """Immediate orders fill what they can at once and never rest."""
+    seller = make_character("Продавец", gold=0)
+    buyer = make_character("Покупатель", gold=100)
+    db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    create_order(seller, shell_item.id, OrderType.SELL, 10.0, 3, db)
+    
+    fok = create_order(buyer, shell_item.id, OrderType.BUY, 10.0, 5, db, TimeInForce.FOK)
+    assert fok["success"] and not fok["matched"]
+    assert db.get(MarketOrder, fok["order_id"]).status == OrderStatus.CANCELLED
+    db.expire_all()
+    assert buyer.gold == Decimal("100.00")
+    
+    ioc = create_order(buyer, shell_item.id, OrderType.BUY, 10.0, 5, db, TimeInForce.IOC)
+    assert ioc["matched"]
+    order = db.get(MarketOrder, ioc["order_id"])
+    assert (order.status, order.filled_quantity) == (OrderStatus.CANCELLED, 3)
+    db.expire_all()
+    assert buyer.gold == Decimal("70.00")
+    
+    book = get_order_book(shell_item.id, db)
+    assert book.depth(5)["bids"] == [] and book.depth(5)["asks"] == []
+
+
+def test_expired_orders_are_swept(db, make_character, shell_item):
+    """The sweeper expires good-till-time orders and returns their escrow."""
+    seller = make_character("Продавец", gold=0)
+    buyer = make_character("Покупатель", gold=100)
+    db.add(InventorySlot(character_id=seller.id, item_id=shell_item.id, quantity=10, slot_index=0))
+    db.commit()
+    now = datetime.now(timezone.utc)
+    
+    assert not create_order(buyer, shell_item.id, OrderType.BUY, 5.0, 2, db, TimeInForce.GTT)["success"]
+    assert not create_order(buyer, shell_item.id, OrderType.BUY, 5.0, 2, db, TimeInForce.GTT, now)["success"]
+    
+    soon = now + timedelta(minutes=1)
+    buy = create_order(buyer, shell_item.id, OrderType.BUY, 5.0, 4, db, TimeInForce.GTT, soon)
+    sell = create_order(seller, shell_item.id, OrderType.SELL, 9.0, 6, db, TimeInForce.GTT, soon)
+    keep = create_order(seller, shell_item.id, OrderType.SELL, 9.0, 1, db)
+    
+    assert expire_orders(db, now) == 0
+    assert expire_orders(db, soon) == 2
+    
+    statuses = {order.id: order.status for order in db.query(MarketOrder).all()}
+    assert statuses[buy["order_id"]] == OrderStatus.EXPIRED
+    assert statuses[sell["order_id"]] == OrderStatus.EXPIRED
+    assert statuses[keep["order_id"]] == OrderStatus.PENDING
+    
+    db.expire_all()
+    assert buyer.gold == Decimal("100.00")
+    seller_items = db.query(func.sum(InventorySlot.quantity)).filter(
+        InventorySlot.character_id == seller.id
+    ).scalar()
+    assert seller_items == 9
+    
+    book = get_order_book(shell_item.id, db)
+    assert [order.id for order in book.open_orders()] == [keep["order_id"]]
+
+
+def test_benchmark_flow_replays():
+    """The benchmark flow is reproducible and replays cleanly."""
+    flow = generate_flow(7, 200, 10, 5, cancel_ratio=0.3)
+    assert flow == generate_flow(7, 200, 10, 5, cancel_ratio=0.3)
+    assert sum(event.action == "create" for event in flow) == 200
+    
+    report = run_benchmark(orders=200, items=10, characters=5, cancel_ratio=0.3, seed=7)
+    assert report["orders"] == 200
+    assert report["matched"] > 0 and report["cancelled"] > 0
+    assert 0 < report["p50_ms"] <= report["p99_ms"]
+    
+    # A database not named as throwaway is never wiped without consent
+    with pytest.raises(ValueError):
+        run_benchmark(orders=10, database_url="postgresql://game:secret@db/dreamforge")
+    assert is_throwaway_database("postgresql://game@db/dreamforge_bench")
+    assert not is_throwaway_database("postgresql://game@db/dreamforge")
+    # The server's own SQLite file is not throwaway either
+    assert not is_throwaway_database("sqlite:///./dreamforge.db")
+    assert not is_throwaway_database("sqlite:////tmp/dreamforge.db")
+    assert is_throwaway_database("sqlite://")
+    assert is_throwaway_database("sqlite:///:memory:")
+    assert is_throwaway_database("sqlite:///./market_bench.db")
+
+
+STRESS_THREADS = 4
+STRESS_ORDERS = 25
+
+
+def _stress_worker(url, item_id, character_ids, seed):
+    """One server process placing and cancelling orders from many threads."""
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 60})
+    make_session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    reset_order_books()  # Forget the parent's books
+    errors = []
+    
+    def trade(character_id):
+        rng = random.Random(seed * 1000 + character_id)
+        db = make_session()
+        placed = []
+        try:
+            for _ in range(STRESS_ORDERS):
+                character = db.get(Character, character_id)
+                order_type = OrderType.SELL if character_id % 2 else OrderType.BUY
+                result = create_order(character, item_id, order_type, rng.randint(8, 12), rng.randint(1, 3), db)
+                if result["success"]:
+                    placed.append(result["order_id"])
+                if placed and rng.random() < 0.2:
+                    cancel_order(placed.pop(rng.randrange(len(placed))), character_id, db)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+    
+    threads = [threading.Thread(target=trade, args=(character_id,)) for character_id in character_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    if errors:
+        raise errors[0]
+
+
+def test_concurrent_matching_keeps_book_consistent(tmp_path):
+    """Many threads in several processes trading one item never double-fill."""
+    url = f"sqlite:///{tmp_path / 'market.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    
+    player = Player(username="tester", email="tester@example.com", password_hash="x")
+    item = Item(name="Оболочка", item_type=ItemType.SHELL, is_tradable=True, stack_size=1000)
+    db.add_all([player, item])
+    db.flush()
+    characters = [
+        Character(player_id=player.id, name=f"Торговец {i}", gold=10000)
+        for i in range(2 * STRESS_THREADS)
+    ]
+    db.add_all(characters)
+    db.flush()
+    for character in characters:
+        db.add(InventorySlot(character_id=character.id, item_id=item.id, quantity=100, slot_index=0))
+    db.commit()
+    character_ids = [character.id for character in characters]
+    item_id = item.id
+    total_gold = 10000 * len(characters)
+    total_items = 100 * len(characters)
+    
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(
+            target=_stress_worker,
+            args=(url, item_id, character_ids[i::2], i)
+        )
+        for i in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0, 0]
+    
+    orders = db.query(MarketOrder).all()
+    traded = {order.id: 0 for order in orders}
+    for trade in db.query(Trade).all():
+        traded[trade.buy_order_id] += trade.quantity
+        traded[trade.sell_order_id] += trade.quantity
+    for order in orders:
+        assert order.filled_quantity == traded[order.id] <= order.quantity
+        if order.status != OrderStatus.CANCELLED:
+            assert order.status == BookOrder.from_model(order).status
+    
+    open_orders = [order for order in orders if order.status in (OrderStatus.PENDING, OrderStatus.PARTIAL)]
+    bids = [order.price for order in open_orders if order.order_type == OrderType.BUY]
+    asks = [order.price for order in open_orders if order.order_type == OrderType.SELL]
+    if bids and asks:
+        assert max(bids) < min(asks)
+    
+    escrowed_items = sum(
+        order.quantity - order.filled_quantity
+        for order in open_orders if order.order_type == OrderType.SELL
+    )
+    escrowed_gold = sum(
+        (order.quantity - order.filled_quantity) * order.price
+        for order in open_orders if order.order_type == OrderType.BUY
+    )
+    assert db.query(func.sum(InventorySlot.quantity)).scalar() + escrowed_items == total_items
+    assert db.query(func.sum(Character.gold)).scalar() + escrowed_gold == total_gold
+    
+    db.close()
+    engine.dispose()
@@ -1,7 +1,8 @@
 """API client for backend."""
 
+import json
 import requests
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator, Tuple
 
 
 class APIClient:
@@ -76,6 +77,10 @@ class APIClient:
         """Get equipment."""
         return self._get(f"/api/inventory/{character_id}/equipment")
     
+    def claim_deliveries(self, character_id: int) -> Dict[str, Any]:
+        """Move pending deliveries into the inventory."""
+        return self._post(f"/api/inventory/{character_id}/claim", {})
+    
     def equip_item(self, character_id: int, item_id: int) -> Dict[str, Any]:
         """Equip item."""
         return self._post("/api/inventory/equip", {
@@ -113,4 +118,34 @@ class APIClient:
         if skill_id:
             data["skill_id"] = skill_id
         return self._post("/api/combat-enhanced/action", data)
+    
+    def stream_combat(self, character_id: int, monster_id: int, last_event_id: Optional[int] = None) -> Iterator[Tuple[Optional[int], str, Dict[str, Any]]]:
+        """Follow combat state as Server-Sent Events; yields (event_id, event, data)."""
+        headers = {"Accept": "text/event-stream"}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = str(last_event_id)
+        # A stream of its own: the shared session is used by the main loop
+        with requests.get(
+            f"{self.base_url}/api/combat-enhanced/stream",
+            params={"character_id": character_id, "monster_id": monster_id},
+            headers=headers,
+            stream=True,
+            timeout=(5, 60),
+        ) as response:
+            response.raise_for_status()
+            event_id, event, data = None, "message", []
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    if data:
+                        yield event_id, event, json.loads("\n".join(data))
+                    event, data = "message", []
+                elif not line.startswith(":"):
+                    field, _, value = line.partition(":")
+                    value = value[1:] if value.startswith(" ") else value
+                    if field == "id":
+                        event_id = int(value)
+                    elif field == "event":
+                        event = value
+                    elif field == "data":
+                        data.append(value)
 
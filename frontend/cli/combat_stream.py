@@ -0,0 +1,90 @@
+"""Background follower of a combat-enhanced fight."""
+
+import threading
+import requests
+from typing import Dict, Any, Optional
+from frontend.cli.api_client import APIClient
+
+
+def apply_combat_event(combat_state: Dict[str, Any], event: str, data: Dict[str, Any]):
+    """Apply a streamed `state` or `delta` event to a local combat state."""
+    if event == "state":
+        combat_state.update(data)
+        combat_state["combat_log"] = list(data.get("log", []))
+    elif event == "delta":
+        tactics = data.pop("tactics", None)
+        lines = data.pop("log", [])
+        combat_state.update(data)
+        if tactics:
+            combat_state.setdefault("tactics", {}).update(tactics)
+        combat_state["combat_log"] = (combat_state.get("combat_log", []) + lines)[-10:]
+        if lines:
+            combat_state["log_total"] = combat_state.get("log_total", 0) + len(lines)
+
+
+class CombatFollower:
+    """Keeps a local combat state current from the server's push channel.
+    
+    Log lines the player has not seen in an action response (turn timeouts,
+    monster turns played by the server) are passed to `on_line`.
+    """
+    
+    def __init__(self, api: APIClient, character_id: int, monster_id: int, combat_state: Dict[str, Any], on_line):
+        self.api = api
+        self.character_id = character_id
+        self.monster_id = monster_id
+        self.state = combat_state
+        self.on_line = on_line
+        self.lock = threading.Lock()
+        self.shown_total = combat_state.get("log_total", 0)
+        self.last_event_id: Optional[int] = combat_state.get("version")
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def seen(self, combat_state: Dict[str, Any]):
+        """Take a fresher state from an action response; its log lines are already shown."""
+        with self.lock:
+            if combat_state.get("version", 0) >= (self.last_event_id or 0):
+                self.state.update(combat_state)
+                self.last_event_id = combat_state.get("version", self.last_event_id)
+            self.shown_total = max(self.shown_total, combat_state.get("log_total", 0))
+    
+    def start(self):
+        """Start following."""
+        self._thread = threading.Thread(target=self._run, name="combat-stream", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop following; the connection is dropped with the daemon thread."""
+        self._stop.set()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                for event_id, event, data in self.api.stream_combat(self.character_id, self.monster_id, self.last_event_id):
+                    if self._stop.is_set():
+                        return
+                    if event == "end":
+                        return
+                    self._apply(event_id, event, data)
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    return
+                self._stop.wait(1.0)
+            except Exception:
+                # Reconnect and resume from the last version
+                self._stop.wait(1.0)
+    
+    def _apply(self, event_id: Optional[int], event: str, data: Dict[str, Any]):
+        with self.lock:
+            if event_id is not None and self.last_event_id is not None and event_id <= self.last_event_id:
+                return
+            lines = data.get("log", [])
+            total = data.get("log_total", self.state.get("log_total", 0) + len(lines))
+            first = total - len(lines) + 1
+            apply_combat_event(self.state, event, data)
+            self.last_event_id = event_id
+            for number, line in enumerate(lines, start=first):
+                if number > self.shown_total:
+                    self.on_line(line)
+            self.shown_total = max(self.shown_total, total)
@@ -120,6 +120,12 @@ def print_inventory(inventory: Dict[str, Any]):
                 row_items.append("[dim][ ][/]")
         
         console.print("  ".join(row_items))
+    
+    pending = inventory.get('pending', [])
+    if pending:
+        console.print("\n[bold]Ожидают места в инвентаре:[/]")
+        for delivery in pending:
+            console.print(f"  {delivery['item']['name']} x{delivery['quantity']}")
 
 
 def print_skills(skills: List[Dict[str, Any]], selected: bool = False):
@@ -5,6 +5,7 @@ from rich.console import Console
 from rich.live import Live
 from rich.panel import Panel
 from frontend.cli.api_client import APIClient
+from frontend.cli.combat_stream import CombatFollower
 from frontend.cli.ui_modern import ModernUI, ChatMessage
 from frontend.cli.commands import CommandHandler
 from frontend.cli.navigation import Navigation, parse_command
@@ -38,13 +39,17 @@ def main():
     current_screen = "location"
     in_combat = False
     combat_state = None
+    combat_skills = []
+    follower = None
+    character = None
     
     try:
         while True:
-            # Get character data
+            # Get character data; it does not change during a fight
             try:
-                character = api.get_character(character_id)
-                character_stats = api.get_character_stats(character_id)
+                if not in_combat or character is None:
+                    character = api.get_character(character_id)
+                    character_stats = api.get_character_stats(character_id)
             except Exception as e:
                 if "404" in str(e) or "not found" in str(e).lower():
                     ui.add_chat_message("Система", 
@@ -70,20 +75,15 @@ def main():
             })
             
             try:
-                if in_combat and combat_state:
-                    # Combat screen
-                    try:
-                        skills = api.get_selected_skills(character_id)
-                    except:
-                        skills = []
-                    # Update combat state from API
-                    try:
-                        monster_id = combat_state.get('monster_id')
-                        if monster_id:
-                            combat_state = api._get(f"/api/combat-enhanced/state?character_id={character_id}&monster_id={monster_id}")
-                    except:
-                        pass
-                    content = ui.render_combat_screen(combat_state, skills)
+                if in_combat and combat_state and combat_state.get('combat_over'):
+                    # Ended by the server clock between commands
+                    in_combat = False
+                    follower.stop()
+                    ui.add_chat_message("Система", f"Бой завершен! Победитель: {combat_state.get('winner', 'unknown')}", "system")
+                    content = "[dim]Бой завершен[/]"
+                elif in_combat and combat_state:
+                    # Combat screen; the state is kept current by the combat stream
+                    content = ui.render_combat_screen(combat_state, combat_skills)
                 elif current_screen == "location":
                     # Location screen
                     location_id = character.get('location_id')
@@ -154,9 +154,10 @@ def main():
                                 ui.add_chat_message("Бой", monster_msg, "combat")
                             
                             # Update combat state
-                            combat_state = api._get(f"/api/combat-enhanced/state?character_id={character_id}&monster_id={monster_id}")
-                            if combat_state.get('combat_over') or action_result.get('combat_over'):
+                            follower.seen(result.get('combat_state', {}))
+                            if action_result.get('combat_over'):
                                 in_combat = False
+                                follower.stop()
                                 winner = action_result.get('winner', 'unknown')
                                 ui.add_chat_message("Система", f"Бой завершен! Победитель: {winner}", "system")
                         else:
@@ -168,10 +169,11 @@ def main():
                     skill_num = int(cmd)
                     if skill_num == 0:
                         in_combat = False
+                        follower.stop()
                         ui.add_chat_message("Система", "Бой прерван", "system")
                     elif skill_num > 1:
                         try:
-                            skills = api.get_selected_skills(character_id)
+                            skills = combat_skills
                             if 0 <= skill_num - 2 < len(skills):
                                 skill = skills[skill_num - 2]
                                 result = api.combat_action(character_id, monster_id, "skill", skill['id'])
@@ -185,9 +187,10 @@ def main():
                                         ui.add_chat_message("Бой", monster_msg, "combat")
                                     
                                     # Update combat state
-                                    combat_state = api._get(f"/api/combat-enhanced/state?character_id={character_id}&monster_id={monster_id}")
-                                    if combat_state.get('combat_over') or action_result.get('combat_over'):
+                                    follower.seen(result.get('combat_state', {}))
+                                    if action_result.get('combat_over'):
                                         in_combat = False
+                                        follower.stop()
                                         winner = action_result.get('winner', 'unknown')
                                         ui.add_chat_message("Система", f"Бой завершен! Победитель: {winner}", "system")
                                 else:
@@ -224,6 +227,16 @@ def main():
                         in_combat = True
                         combat_state = combat_start.get('combat_state', {})
                         combat_state['monster_id'] = monster_id
+                        try:
+                            combat_skills = api.get_selected_skills(character_id)
+                        except Exception:
+                            combat_skills = []
+                        # Server-driven turns and timers arrive over the stream
+                        follower = CombatFollower(
+                            api, character_id, monster_id, combat_state,
+                            lambda line: ui.add_chat_message("Бой", line.get('message', ''), "combat")
+                        )
+                        follower.start()
                         ui.add_chat_message("Система", f"Бой начат с мобом ID {monster_id}!", "combat")
                     except Exception as e:
                         ui.add_chat_message("Система", f"Ошибка начала боя: {e}", "error")
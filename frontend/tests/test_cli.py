@@ -2,6 +2,7 @@
 
 import pytest
 from frontend.cli.navigation import parse_command
+from frontend.cli.combat_stream import apply_combat_event
 
 
 def test_parse_command():
@@ -18,3 +19,17 @@ def test_parse_command():
     assert cmd == "menu"
     assert args == []
 
+
+def test_apply_combat_event():
+    """Test applying streamed combat state and deltas."""
+    state = {}
+    apply_combat_event(state, "state", {
+        "monster_hp": 80, "tactics": {"attack": 0, "block": 0}, "log": [], "log_total": 0,
+    })
+    apply_combat_event(state, "delta", {
+        "monster_hp": 55, "tactics": {"attack": 1}, "log": [{"actor": "character", "message": "Удар"}],
+    })
+    assert state["monster_hp"] == 55
+    assert state["tactics"] == {"attack": 1, "block": 0}
+    assert state["combat_log"][-1]["message"] == "Удар"
+    assert state["log_total"] == 1